@@ -0,0 +1,244 @@
+# Offline benchmark of every pipeline stage on synthetic data, using the fake backend
+# (deterministic hashing embeddings + stub chat model), so results are comparable
+# between commits:
+#   python benchmark.py --sizes 1000 10000 100000 --out bench.json
+#   python benchmark.py --sizes 1000 10000 --out new.json --compare bench.json
+#   python benchmark.py --imports-only   # fresh-interpreter import times vs IMPORT_BUDGET_MS
+#   python benchmark.py --index-types --sizes 100000   # recall@10 / latency / size per FAISS index vs flat
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, date
+from typing import Callable, Dict, Any, List
+
+os.environ.setdefault("TRADER_AGENT_BACKEND", "fake")
+
+import numpy as np
+
+from gen_synthetic_data import write_trades
+from trader_agent.fakes import HashEmbeddings, FakeChatModel
+
+QUERIES = [
+    "What lessons did you learn last month? What worked and what failed?",
+    "Which were your most profitable DOGE trades in 2024?",
+    "Why did you buy DOGE on 2024-01-25?",
+    "Show recent BTC buys",
+    "What trades do you prefer?",
+    "SOL sells between 2024-03-01 and 2024-06-30",
+    "How do you deal with losses?",
+    "ETH trades in the last 90 days",
+]
+WINDOWS = [(None, None), (date(2024, 3, 1), date(2024, 3, 31)), (date(2025, 1, 1), None)]
+
+# Import-time budget (ms, best of --repeat fresh interpreters). Light modules must not
+# pull in pandas/langchain/faiss; bootstrap defers its backends and the graph stack.
+IMPORT_BUDGET_MS = {
+    "trader_agent.config": 25,
+    "trader_agent.scoring": 25,
+    "trader_agent.date_utils": 25,
+    "trader_agent.composer": 25,
+    "trader_agent.bootstrap": 50,
+}
+
+
+def timed(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    a = np.asarray(samples)
+    return {"mean_s": float(a.mean()), "p50_s": float(np.median(a)), "min_s": float(a.min()), "n": len(a)}
+
+
+def git_rev() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL, cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except Exception:
+        return "unknown"
+
+
+def bench_size(size: int, workdir: str, repeat: int, llm_latency_s: float) -> Dict[str, Dict[str, float]]:
+    from trader_agent.data_store import load_csv, load_trades, convert_trades, build_docs, build_vectorstore, load_vectorstore
+    from trader_agent.date_utils import parse_date_range
+    from trader_agent.query_analysis import analyze_query, clear_analysis_cache
+    from trader_agent.retriever import FilteredRetriever, retrieve_with_filters, extract_simple_filters
+    from trader_agent.lessons import compute_lessons, LessonCube
+    from trader_agent.persona import extract_persona
+    from trader_agent.bootstrap import load_assets, make_chat
+
+    csv_path = os.path.join(workdir, f"trades_{size}.csv")
+    path_db = os.path.join(workdir, f"vectordb_{size}")
+    write_trades(csv_path, rows=size, seed=size)
+    embeddings = HashEmbeddings()
+    out: Dict[str, Dict[str, float]] = {}
+
+    out["load_csv"] = timed(lambda: load_csv(csv_path), repeat)
+    store = load_csv(csv_path)
+    try:
+        parquet_path = convert_trades(csv_path)
+        out["load_parquet"] = timed(lambda: load_trades(parquet_path), repeat)
+    except ImportError:
+        pass  # pyarrow not installed
+    out["build_docs"] = timed(lambda: build_docs(store), repeat)
+    docs = build_docs(store)
+    out["index_build"] = timed(lambda: build_vectorstore(docs, embeddings, path_db), 1)
+    out["index_load"] = timed(lambda: load_vectorstore(path_db, embeddings), repeat)
+    vectorstore = load_vectorstore(path_db, embeddings)
+    retriever = FilteredRetriever(vectorstore, store, k=12)
+
+    # cold: every query parsed; memoized: what later stages of the same turn pay
+    out["analyze_query"] = timed(lambda: (clear_analysis_cache(), [analyze_query(q, store) for q in QUERIES]), repeat)
+    out["parse_date_range"] = timed(lambda: [parse_date_range(q, store) for q in QUERIES], repeat)
+    ranges = [parse_date_range(q, store) for q in QUERIES]
+    out["retrieve_with_filters"] = timed(
+        lambda: [retrieve_with_filters(retriever, q, extract_simple_filters(q, store), r, k=5, store=store)
+                 for q, r in zip(QUERIES, ranges)], repeat)
+    out["compute_lessons"] = timed(lambda: [compute_lessons(store, s, e) for s, e in WINDOWS], repeat)
+    cube = LessonCube(store)
+    out["lesson_cube_stats"] = timed(lambda: [cube.stats(s, e) for s, e in WINDOWS], repeat)
+    out["extract_persona"] = timed(lambda: extract_persona(store), repeat)
+
+    assets = load_assets(csv_path, embeddings=embeddings, llm=FakeChatModel(latency_s=llm_latency_s), path_db=path_db)
+    chat = make_chat(assets)
+    turns = iter(QUERIES * (repeat + 1))
+    out["chat_turn"] = timed(lambda: chat["chat"](next(turns)), max(repeat, len(QUERIES)))
+    # all QUERIES in one call; compare with len(QUERIES) * chat_turn
+    out["chat_batch"] = timed(lambda: chat["chat_batch"](QUERIES), repeat)
+    return out
+
+
+def bench_imports(repeat: int) -> Dict[str, Dict[str, float]]:
+    root = os.path.dirname(os.path.abspath(__file__))
+    env = {**os.environ, "PYTHONPATH": root + os.pathsep + os.environ.get("PYTHONPATH", "")}
+    out = {}
+    for mod, budget in IMPORT_BUDGET_MS.items():
+        code = f"import time; t = time.perf_counter(); import {mod}; print(time.perf_counter() - t)"
+        samples = [float(subprocess.check_output([sys.executable, "-c", code], text=True, env=env, cwd=root))
+                   for _ in range(repeat)]
+        best_ms = min(samples) * 1e3
+        out[mod] = {"best_ms": best_ms, "budget_ms": budget, "ok": best_ms <= budget}
+    return out
+
+
+# (index kind, search knobs) swept by --index-types; recall is measured against IndexFlatL2
+INDEX_GRID = [
+    ("flat", {}),
+    ("hnsw", {"ef_search": 16}), ("hnsw", {"ef_search": 64}), ("hnsw", {"ef_search": 256}),
+    ("ivfsq8", {"nprobe": 1}), ("ivfsq8", {"nprobe": 8}), ("ivfsq8", {"nprobe": 32}),
+    ("ivfpq", {"nprobe": 1}), ("ivfpq", {"nprobe": 8}), ("ivfpq", {"nprobe": 32}),
+]
+
+
+def bench_index_types(size: int, workdir: str, n_queries: int = 200, k: int = 10) -> Dict[str, Dict[str, float]]:
+    import faiss
+    import pandas as pd
+    from trader_agent.data_store import row_to_text, make_faiss_index, tune_index
+
+    # queries are held-out trades from the same generator, so they look like the data
+    csv_path = os.path.join(workdir, f"index_trades_{size}.csv")
+    write_trades(csv_path, rows=size + n_queries, seed=size)
+    df = pd.read_csv(csv_path)
+    texts = [row_to_text(r) for _, r in df.iterrows()]
+    vecs = np.asarray(HashEmbeddings().embed_documents(texts), dtype=np.float32)
+    rng = np.random.default_rng(0)
+    q_rows = rng.choice(len(vecs), n_queries, replace=False)
+    base = np.delete(vecs, q_rows, axis=0)
+    queries = vecs[q_rows]
+
+    flat = faiss.IndexFlatL2(base.shape[1])
+    flat.add(base)
+    _, truth = flat.search(queries, k)
+
+    out = {}
+    for kind, knobs in INDEX_GRID:
+        t0 = time.perf_counter()
+        index = make_faiss_index(base, kind)
+        index.add(base)
+        build_s = time.perf_counter() - t0
+        tune_index(index, **knobs)
+        lat = []
+        hits = 0
+        for i in range(n_queries):
+            t0 = time.perf_counter()
+            _, ids = index.search(queries[i:i + 1], k)
+            lat.append(time.perf_counter() - t0)
+            hits += len(np.intersect1d(ids[0], truth[i]))
+        name = kind + "".join(f" {key}={v}" for key, v in knobs.items())
+        out[name] = {"recall_at_k": hits / (n_queries * k), "k": k,
+                     "p50_ms": float(np.median(lat) * 1e3), "p95_ms": float(np.percentile(lat, 95) * 1e3),
+                     "build_s": build_s, "bytes": int(faiss.serialize_index(index).size)}
+    return out
+
+
+def compare(new: Dict[str, Any], base: Dict[str, Any]) -> None:
+    print(f"{'size':>9} {'stage':<24} {'base_ms':>10} {'new_ms':>10} {'ratio':>7}")
+    for size, stages in new["results"].items():
+        for stage, r in stages.items():
+            b = base.get("results", {}).get(size, {}).get(stage)
+            if b is None:
+                continue
+            ratio = r["p50_s"] / b["p50_s"] if b["p50_s"] else float("nan")
+            print(f"{size:>9} {stage:<24} {b['p50_s']*1e3:>10.2f} {r['p50_s']*1e3:>10.2f} {ratio:>7.2f}")
+
+
+def main(argv: List[str] = None) -> None:
+    ap = argparse.ArgumentParser(description="Benchmark trader_agent pipeline stages offline")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--llm-latency", type=float, default=0.0, help="simulated seconds per fake LLM call")
+    ap.add_argument("--out", default="bench.json")
+    ap.add_argument("--compare", default=None, help="earlier results JSON to compare against")
+    ap.add_argument("--imports-only", action="store_true", help="only check import times; exit 1 if over budget")
+    ap.add_argument("--index-types", action="store_true", help="only sweep FAISS index types (recall vs latency vs flat)")
+    ap.add_argument("--index-queries", type=int, default=200)
+    args = ap.parse_args(argv)
+
+    imports = bench_imports(args.repeat)
+    for mod, r in imports.items():
+        print(f"{'import':>9} {mod:<24} {r['best_ms']:8.1f} ms (budget {r['budget_ms']} ms){'' if r['ok'] else '  OVER'}")
+    if args.imports_only:
+        sys.exit(0 if all(r["ok"] for r in imports.values()) else 1)
+
+    results = {
+        "meta": {"git": git_rev(), "timestamp": datetime.now().isoformat(timespec="seconds"),
+                 "python": sys.version.split()[0], "platform": platform.platform(),
+                 "repeat": args.repeat, "llm_latency_s": args.llm_latency},
+        "imports": imports,
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)  # keep caches/indexes created during the run out of the repo
+        try:
+            if args.index_types:
+                results["index_types"] = {}
+                print(f"{'size':>9} {'index':<24} {'recall@k':>9} {'p50_ms':>8} {'p95_ms':>8} {'build_s':>8} {'MB':>8}")
+                for size in args.sizes:
+                    res = results["index_types"][str(size)] = bench_index_types(size, workdir, args.index_queries)
+                    for name, r in res.items():
+                        print(f"{size:>9} {name:<24} {r['recall_at_k']:>9.3f} {r['p50_ms']:>8.3f} {r['p95_ms']:>8.3f}"
+                              f" {r['build_s']:>8.2f} {r['bytes'] / 2**20:>8.1f}")
+            for size in ([] if args.index_types else args.sizes):
+                results["results"][str(size)] = bench_size(size, workdir, args.repeat, args.llm_latency)
+                for stage, r in results["results"][str(size)].items():
+                    print(f"{size:>9} {stage:<24} p50 {r['p50_s']*1e3:10.2f} ms")
+        finally:
+            os.chdir(cwd)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"wrote {args.out}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,13 @@
-# Create a synthetic "Trader Past Trades" dataset with market context and save it to CSV
+# Create a synthetic "Trader Past Trades" dataset with market context and save it to CSV/Parquet
+#
+# Importable (`iter_trades`, `write_trades`) and usable as a CLI:
+#   python gen_synthetic_data.py --rows 5000000 --traders 200 --out trades.parquet
+import argparse
+from datetime import datetime, date
+from typing import Dict, Iterator, Optional
+
 import numpy as np
 import pandas as pd
-import random
-from datetime import datetime, timedelta
-from caas_jupyter_tools import display_dataframe_to_user
-
-random.seed(42)
-np.random.seed(42)
 
 # Asset configurations: base price ranges and typical volume ranges
 assets = {
@@ -17,113 +18,170 @@ assets = {
     "PEPE": {"price_range": (0.000001, 0.00002), "volume_range": (1_000_000, 120_000_000)},
 }
 
-tags_pool = [
+tags_pool = np.array([
     "breakout", "rsi-divergence", "meme", "event-driven", "stop-loss",
     "swing", "intraday", "long-term", "volume-spike", "news-sentiment",
     "range-trade", "momentum", "mean-revert", "trend-follow"
-]
+])
+
+# Default date span
+START_DATE = date(2024, 1, 10)
+END_DATE = date(2025, 8, 1)
 
-# Helper to draw a price within a range (with slight fat-tail)
-def draw_price(low, high):
+# Helper to draw prices within per-row ranges (with slight fat-tail)
+def draw_price(rng, low, high):
     # use beta distribution to bias towards the middle with occasional extremes
-    a, b = 2.0, 2.0
-    u = np.random.beta(a, b)
-    return round(low + u * (high - low), 8)
+    u = rng.beta(2.0, 2.0, size=len(low))
+    return np.round(low + u * (high - low), 8)
 
-def draw_volume(low, high):
-    val = np.random.lognormal(mean=np.log((low+high)/2), sigma=0.5)
-    return round(min(max(val, low), high), 8)
+def draw_volume(rng, low, high):
+    val = rng.lognormal(mean=np.log((low + high) / 2), sigma=0.5)
+    return np.round(np.clip(val, low, high), 8)
 
-def draw_rsi():
+def draw_rsi(rng, n):
     # cluster around 35-65 but allow tails 15-85
-    base = np.clip(np.random.normal(50, 15), 10, 90)
-    return round(base, 2)
+    return np.round(np.clip(rng.normal(50, 15, n), 10, 90), 2)
 
-def draw_volume_change_pct():
+def draw_volume_change_pct(rng, n):
     # percent change with long tail for spikes
-    val = np.clip(np.random.normal(10, 40), -70, 180)
-    return round(val, 2)
+    return np.round(np.clip(rng.normal(10, 40, n), -70, 180), 2)
 
-def draw_sentiment():
+def draw_sentiment(rng, n):
     # sentiment score between -1 and 1, slightly positive on average
-    val = np.clip(np.random.normal(0.1, 0.5), -1, 1)
-    return round(val, 2)
+    return np.round(np.clip(rng.normal(0.1, 0.5, n), -1, 1), 2)
 
-def pick_tags():
-    k = random.choice([2, 2, 3])  # bias toward 2-3 tags
-    return ",".join(random.sample(tags_pool, k))
+def pick_tags(rng, n):
+    # 2-3 distinct tags per trade, biased toward 2
+    k = rng.choice([2, 2, 3], size=n)
+    picks = tags_pool[np.argsort(rng.random((n, len(tags_pool))), axis=1)[:, :3]]
+    out = np.char.add(np.char.add(picks[:, 0], ","), picks[:, 1])
+    return np.where(k == 3, np.char.add(np.char.add(out, ","), picks[:, 2]), out)
 
-def likely_outcome(side, rsi, sent, vchg):
+def likely_outcome(rng, is_buy, rsi, sent, vchg):
     # Simple heuristic for outcome; inject some structure + randomness
-    score = 0.0
     # RSI: oversold (<30) favors Buy; overbought (>70) favors Sell
-    if side == "Buy":
-        score += (30 - min(rsi, 30)) * 0.15  # positive if rsi<30
-        score += sent * 0.8  # positive sentiment helps
-    else:  # Sell
-        score += (max(rsi, 70) - 70) * 0.15  # positive if rsi>70
-        score += (-sent) * 0.5  # negative sentiment helps sell outcomes
-    
+    buy_score = (30 - np.minimum(rsi, 30)) * 0.15 + sent * 0.8   # positive sentiment helps
+    sell_score = (np.maximum(rsi, 70) - 70) * 0.15 + (-sent) * 0.5  # negative sentiment helps sells
+    score = np.where(is_buy, buy_score, sell_score)
+
     # Volume change spike can help momentum strategies
-    score += max(vchg, 0) * 0.02
-    
-    # Add noise
-    score += np.random.normal(0, 0.5)
-    
-    if score > 0.6:
-        return "Profit"
-    elif score < -0.6:
-        return "Loss"
-    else:
-        return "Neutral"
-
-# Generate dates from 2024-01-10 to 2025-08-01
-start_date = datetime(2024, 1, 10)
-end_date = datetime(2025, 8, 1)
-num_days = (end_date - start_date).days
-
-rows = []
-N = 80  # number of trades
-
-for i in range(1, N + 1):
-    trade_id = f"T{i:03d}"
-    asset = random.choice(list(assets.keys()))
-    pr = assets[asset]["price_range"]
-    vr = assets[asset]["volume_range"]
-    price = draw_price(*pr)
-    volume = draw_volume(*vr)
-    side = random.choice(["Buy", "Sell"])
-    rsi = draw_rsi()
-    vchg = draw_volume_change_pct()
-    sent = draw_sentiment()
-    outcome = likely_outcome(side, rsi, sent, vchg)
-    tags = pick_tags()
-    date = (start_date + timedelta(days=random.randint(0, num_days))).date().isoformat()
-    
-    rows.append({
-        "Trade ID": trade_id,
-        "Asset": asset,
-        "Buy/Sell": side,
-        "Price": price,
-        "Volume": volume,
-        "Date": date,
-        "Outcome": outcome,
-        "Tags": tags,
-        "RSI": rsi,
-        "Volume_Change_Pct": vchg,
-        "Sentiment_Score": sent
-    })
-
-df = pd.DataFrame(rows)
-
-# Sort by date to look realistic, then reset Trade IDs sequentially by date
-df = df.sort_values("Date").reset_index(drop=True)
-df["Trade ID"] = [f"T{i:03d}" for i in range(1, len(df) + 1)]
-
-# Save CSV
-csv_path = "/trader_past_trades.csv"
-df.to_csv(csv_path, index=False)
-
-# Show a preview to the user
-#display_dataframe_to_user("Trader Past Trades (preview)", df.head(20))
+    score = score + np.maximum(vchg, 0) * 0.02
 
+    # Add noise
+    score = score + rng.normal(0, 0.5, len(score))
+    return np.where(score > 0.6, "Profit", np.where(score < -0.6, "Loss", "Neutral"))
+
+
+def parse_asset_mix(spec: Optional[str]) -> Dict[str, float]:
+    """'BTC=0.4,ETH=0.3,...' -> normalised weights; default is uniform over `assets`."""
+    if not spec:
+        return {a: 1.0 / len(assets) for a in assets}
+    mix = {}
+    for part in spec.split(","):
+        name, _, w = part.partition("=")
+        name = name.strip().upper()
+        if name not in assets:
+            raise ValueError(f"unknown asset {name!r}; expected one of {sorted(assets)}")
+        mix[name] = float(w or 1.0)
+    total = sum(mix.values())
+    return {a: w / total for a, w in mix.items()}
+
+
+def iter_trades(rows: int = 80, traders: int = 1, asset_mix: Optional[Dict[str, float]] = None,
+                start: date = START_DATE, end: date = END_DATE, chunk_size: int = 1_000_000,
+                seed: int = 42) -> Iterator[pd.DataFrame]:
+    """Yield trades in date order, `chunk_size` rows at a time.
+
+    Per-day counts are drawn up front (a multinomial over the span), so dates come out
+    sorted and Trade IDs stay sequential by date without materialising the full set.
+    A `Trader` column is added when `traders > 1`."""
+    rng = np.random.default_rng(seed)
+    mix = asset_mix or parse_asset_mix(None)
+    names = np.array(list(mix))
+    probs = np.array([mix[a] for a in names])
+    p_lo = np.array([assets[a]["price_range"][0] for a in names], dtype=np.float64)
+    p_hi = np.array([assets[a]["price_range"][1] for a in names], dtype=np.float64)
+    v_lo = np.array([assets[a]["volume_range"][0] for a in names], dtype=np.float64)
+    v_hi = np.array([assets[a]["volume_range"][1] for a in names], dtype=np.float64)
+
+    days = np.arange(np.datetime64(start, "D"), np.datetime64(end, "D") + 1)
+    per_day = rng.multinomial(rows, np.full(len(days), 1.0 / len(days)))
+    day_of_row_end = np.cumsum(per_day)
+    id_width = max(3, len(str(rows)))
+    trader_width = max(3, len(str(traders)))
+
+    for lo in range(0, rows, chunk_size):
+        n = min(chunk_size, rows - lo)
+        pos = np.arange(lo, lo + n)
+        dates = days[np.searchsorted(day_of_row_end, pos, side="right")]
+
+        a = rng.choice(len(names), size=n, p=probs)
+        is_buy = rng.random(n) < 0.5
+        rsi = draw_rsi(rng, n)
+        vchg = draw_volume_change_pct(rng, n)
+        sent = draw_sentiment(rng, n)
+        chunk = {
+            "Trade ID": np.char.add("T", np.char.zfill((pos + 1).astype(str), id_width)),
+            "Asset": names[a],
+            "Buy/Sell": np.where(is_buy, "Buy", "Sell"),
+            "Price": draw_price(rng, p_lo[a], p_hi[a]),
+            "Volume": draw_volume(rng, v_lo[a], v_hi[a]),
+            "Date": np.datetime_as_string(dates, unit="D"),
+            "Outcome": likely_outcome(rng, is_buy, rsi, sent, vchg),
+            "Tags": pick_tags(rng, n),
+            "RSI": rsi,
+            "Volume_Change_Pct": vchg,
+            "Sentiment_Score": sent,
+        }
+        df = pd.DataFrame(chunk)
+        if traders > 1:
+            df.insert(1, "Trader", np.char.add("TR", np.char.zfill((rng.integers(0, traders, n) + 1).astype(str), trader_width)))
+        yield df
+
+
+def write_trades(path: str, fmt: Optional[str] = None, **kwargs) -> int:
+    """Stream `iter_trades(**kwargs)` to CSV or Parquet; returns the row count written."""
+    fmt = fmt or ("parquet" if path.endswith((".parquet", ".pq")) else "csv")
+    written = 0
+    writer = None
+    try:
+        for i, df in enumerate(iter_trades(**kwargs)):
+            if fmt == "parquet":
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+            else:
+                df.to_csv(path, index=False, mode="w" if i == 0 else "a", header=(i == 0))
+            written += len(df)
+    finally:
+        if writer is not None:
+            writer.close()
+    return written
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description="Generate synthetic trader past trades")
+    ap.add_argument("--rows", type=int, default=80, help="number of trades")
+    ap.add_argument("--traders", type=int, default=1, help="number of traders (adds a Trader column when > 1)")
+    ap.add_argument("--asset-mix", default=None, help="e.g. BTC=0.4,ETH=0.3,SOL=0.2,DOGE=0.05,PEPE=0.05")
+    ap.add_argument("--start", default=START_DATE.isoformat(), help="first trade date (YYYY-MM-DD)")
+    ap.add_argument("--end", default=END_DATE.isoformat(), help="last trade date (YYYY-MM-DD)")
+    ap.add_argument("--chunk-size", type=int, default=1_000_000)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--format", choices=["csv", "parquet"], default=None, help="default: from --out extension")
+    # not trader_past_trades.csv: that is the committed sample dataset
+    ap.add_argument("--out", default="synthetic_trades.csv", help="output path (default: synthetic_trades.csv)")
+    args = ap.parse_args(argv)
+
+    n = write_trades(args.out, fmt=args.format, rows=args.rows, traders=args.traders,
+                     asset_mix=parse_asset_mix(args.asset_mix),
+                     start=datetime.fromisoformat(args.start).date(), end=datetime.fromisoformat(args.end).date(),
+                     chunk_size=args.chunk_size, seed=args.seed)
+    print(f"wrote {n} trades to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
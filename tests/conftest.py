@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the repo root, for trader_agent and gen_synthetic_data, before any test module imports them
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
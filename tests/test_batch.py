@@ -0,0 +1,28 @@
+import hashlib
+import sqlite3
+
+import pytest
+
+from gen_synthetic_data import write_trades
+from trader_agent.bootstrap import load_assets, make_chat
+from trader_agent.embed_cache import CachedEmbeddings
+from trader_agent.fakes import HashEmbeddings, FakeChatModel
+
+
+@pytest.fixture
+def assets(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_trades("trades.csv", rows=100, traders=1, seed=9)
+    embeddings = CachedEmbeddings(HashEmbeddings(), "embed_cache.sqlite")
+    return load_assets("trades.csv", embeddings=embeddings, llm=FakeChatModel(latency_s=0.0))
+
+
+def test_batch_queries_do_not_enter_the_document_cache(assets):
+    queries = ["Show my latest SOL buys", "How do you size a position?", "Show my latest SOL buys"]
+    assert len(make_chat(assets)["chat_batch"](queries)) == 3
+    hashes = [hashlib.sha256(q.encode("utf-8")).hexdigest() for q in queries]
+    with sqlite3.connect("embed_cache.sqlite") as conn:
+        found = conn.execute(f"SELECT COUNT(*) FROM embeddings WHERE text_hash IN ({','.join('?' * len(hashes))})",
+                             hashes).fetchone()[0]
+    assert found == 0
+    assert all(assets["embeddings"]._query_memo(q) is not None for q in queries)
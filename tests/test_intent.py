@@ -0,0 +1,45 @@
+import pytest
+
+from trader_agent.fakes import FakeChatModel
+from trader_agent.intent import IntentClassifier, keyword_intent
+
+FALSE_POSITIVES = [
+    "What is a realistic stop?",             # "list" in "realistic"
+    "Is a 2% risk per trade reasonable?",    # "reason" in "reasonable"
+    "How does trading fit your lifestyle?",  # "style" in "lifestyle"
+]
+
+
+@pytest.fixture
+def classifier():
+    return IntentClassifier(FakeChatModel(latency_s=0.0))
+
+
+@pytest.mark.parametrize("query", FALSE_POSITIVES)
+def test_keywords_match_whole_words_only(classifier, query):
+    assert keyword_intent(query) is None
+    assert classifier.classify(query).intent == "generic"
+    assert classifier.counts["keyword"] == 0
+
+
+@pytest.mark.parametrize("query, intent", [
+    ("Show recent BTC buys", "list"),
+    ("List my SOL sells", "list"),
+    ("Why did you buy DOGE on 2024-10-09?", "why_trade"),
+    ("What was the reasoning behind trade T042?", "why_trade"),
+    ("What's your trading style?", "persona"),
+    ("Which were your most profitable ETH trades?", "best"),
+    ("What lessons did you learn last month?", "reflect"),
+])
+def test_confident_keywords_skip_later_tiers(classifier, query, intent):
+    assert classifier.classify(query).intent == intent
+    assert classifier.counts["keyword"] == 1 and classifier.counts["llm"] == 0
+
+
+@pytest.mark.parametrize("query", [
+    "Can you show me how a stop-loss works?",  # one ambiguous word
+    "Show me the lessons from my best trades",  # reflect leads list/best by less than the margin
+])
+def test_weak_keyword_evidence_escalates(classifier, query):
+    classifier.classify(query)
+    assert classifier.counts["keyword"] == 0 and classifier.counts["llm"] == 1
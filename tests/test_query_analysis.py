@@ -0,0 +1,45 @@
+import os
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from trader_agent import trade_store
+from trader_agent.date_utils import clamp_to_df_dates, parse_date_range
+from trader_agent.query_analysis import analyze_query
+from trader_agent.trade_store import TradeStore
+
+CSV = os.path.join(os.path.dirname(__file__), os.pardir, "trader_past_trades.csv")
+
+QUERIES = [
+    "Show BTC buys since 2024-03-01",
+    "breakout trades on ETH in 2024",
+    "long term momentum trades last month",
+    "range-trade between 2020-01-01 and 2030-01-01",
+    "What did you sell from 2024-02-01?",
+]
+
+
+@pytest.fixture(scope="module")
+def df():
+    return pd.read_csv(CSV)
+
+
+def test_frame_and_store_give_the_same_analysis(df):
+    store = TradeStore(df)
+    for q in QUERIES:
+        assert analyze_query(q, df) == analyze_query(q, store)
+        assert parse_date_range(q, df) == parse_date_range(q, store)
+    wide = (date(2000, 1, 1), date(2100, 1, 1))
+    assert clamp_to_df_dates(*wide, df) == clamp_to_df_dates(*wide, store) == (store.date_min, store.date_max)
+
+
+def test_frame_callers_do_not_build_a_store(df, monkeypatch):
+    def fail(self, *args, **kwargs):
+        raise AssertionError("TradeStore built for a plain DataFrame")
+
+    monkeypatch.setattr(trade_store.TradeStore, "__init__", fail)
+    for q in QUERIES:
+        analyze_query(q, df)
+        parse_date_range(q, df)
+    clamp_to_df_dates(date(2000, 1, 1), None, df)
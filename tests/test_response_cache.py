@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+from gen_synthetic_data import write_trades
+from trader_agent.bootstrap import load_assets, make_chat
+from trader_agent.fakes import HashEmbeddings, FakeChatModel
+from trader_agent.response_cache import ResponseCache
+
+
+@pytest.fixture(scope="module")
+def assets(tmp_path_factory):
+    # index and cache files are relative to the working directory
+    root = tmp_path_factory.mktemp("response_cache")
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        write_trades("trades.csv", rows=200, traders=1, seed=3)
+        assets = load_assets("trades.csv", embeddings=HashEmbeddings(), llm=FakeChatModel(latency_s=0.0))
+        yield {**assets, "response_cache": ResponseCache()}
+    finally:
+        os.chdir(cwd)
+
+
+def test_first_turns_are_shared_between_sessions(assets):
+    cache = assets["response_cache"]
+    cache.clear()
+    make_chat(assets)["chat"]("Show my BTC trade history")
+    hits = cache.hits
+    make_chat(assets)["chat"]("Show my BTC trade history")
+    assert cache.hits == hits + 1
+
+
+def test_follow_up_is_not_served_from_another_conversation(assets):
+    cache = assets["response_cache"]
+    cache.clear()
+    a, b = make_chat(assets), make_chat(assets)
+    a["chat"]("Show my BTC trade history")
+    a["chat"]("Why?")
+    hits = cache.hits
+    b["chat"]("Any thoughts on DOGE buys?")
+    b["chat"]("Why?")
+    assert cache.hits == hits
+
+    c = make_chat(assets)  # same prior turns as `a`: its follow-up may be shared
+    c["chat"]("Show my BTC trade history")
+    c["chat"]("Why?")
+    assert cache.hits == hits + 2
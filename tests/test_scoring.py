@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from trader_agent import scoring
+from trader_agent.scoring import setup_score, setup_scores
+from trader_agent.trade_store import TradeStore
+
+CSV = os.path.join(os.path.dirname(__file__), os.pardir, "trader_past_trades.csv")
+
+
+@pytest.fixture(scope="module")
+def df():
+    return pd.read_csv(CSV)
+
+
+def scalar_scores(df):
+    return np.array([setup_score(row) for row in df.to_dict("records")])
+
+
+def test_vectorised_scores_match_scalar(df):
+    store = TradeStore(df)
+    np.testing.assert_array_equal(setup_scores(store), scalar_scores(df))
+    np.testing.assert_array_equal(store.setup_score, scalar_scores(df))
+
+
+def test_rescore_matches_scalar_with_custom_weights(df, monkeypatch):
+    weights = {"breakout": -1.0, "meme": 2.5, "stop-loss": 0.75, "long-term": 0.1}
+    store = TradeStore(df)
+    version = store.version
+    scores = store.rescore(weights)
+    monkeypatch.setattr(scoring, "TAG_WEIGHTS", weights)
+    expected = scalar_scores(df)
+    np.testing.assert_array_equal(scores, expected)
+    np.testing.assert_array_equal(store.setup_score, expected)
+    assert store.version == version + 1
+
+
+def odd_rows(df):
+    odd = df.head(6).copy()
+    odd["Tags"] = ["breakout,breakout", "Breakout, breakout,,momentum",
+                   "meme , meme,meme", "stop-loss,stop-loss", None, ""]
+    odd = odd.astype({"RSI": object, "Volume_Change_Pct": object, "Sentiment_Score": object})
+    odd.loc[2, "RSI"] = "abc"
+    odd.loc[3, "Volume_Change_Pct"] = "n/a"
+    odd.loc[4, "Sentiment_Score"] = "0.5"  # text, but float() parses it
+    return odd
+
+
+def test_repeated_tags_and_bad_numbers_match_scalar(df):
+    odd = odd_rows(df)
+    np.testing.assert_array_equal(setup_scores(TradeStore(odd)), scalar_scores(odd))
+
+
+def test_append_keeps_repeated_tags(df):
+    odd = odd_rows(df)
+    store = TradeStore(odd.head(3))
+    store.append(odd.tail(3))
+    np.testing.assert_array_equal(store.setup_score, scalar_scores(odd))
+    np.testing.assert_array_equal(setup_scores(store), scalar_scores(odd))
@@ -0,0 +1,190 @@
+import os
+import copy
+import json
+import time
+import asyncio
+
+import pandas as pd
+import pytest
+
+from gen_synthetic_data import write_trades
+from trader_agent.data_store import convert_trades
+from trader_agent.fakes import HashEmbeddings, FakeChatModel
+from trader_agent.llm_limiter import ConcurrencyLimitedLLM
+from trader_agent.server import AgentServer, create_server
+
+LATENCY_S = 0.02
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    # index and cache files are relative to the working directory
+    root = tmp_path_factory.mktemp("server")
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        write_trades("trades.csv", rows=300, traders=1, seed=7)
+        yield create_server("trades.csv", embeddings=HashEmbeddings(), llm=FakeChatModel(latency_s=LATENCY_S),
+                            llm_concurrency=2, idle_s=60.0, path_db="vectordb")
+    finally:
+        os.chdir(cwd)
+
+
+def chat(server, message, session_id=None):
+    body = json.dumps({"message": message, "session_id": session_id}).encode("utf-8")
+    return server.handle("POST", "/chat", body)
+
+
+def test_chat_creates_session_and_delete_removes_it(server):
+    status, payload = asyncio.run(chat(server, "Show recent BTC buys"))
+    assert status == 200 and payload["reply"]
+    sid = payload["session_id"]
+    assert sid in server.sessions
+
+    status, payload = asyncio.run(chat(server, "And the ETH ones?", sid))
+    assert status == 200 and payload["session_id"] == sid
+    assert [t["role"] for t in server.sessions[sid].memory.turns] == ["user", "assistant"] * 2
+
+    assert asyncio.run(server.handle("DELETE", f"/sessions/{sid}")) == (200, {"deleted": sid})
+    assert sid not in server.sessions
+    assert asyncio.run(server.handle("DELETE", f"/sessions/{sid}"))[0] == 404
+
+
+def test_bad_chat_request_is_400(server):
+    assert asyncio.run(server.handle("POST", "/chat", b'{"msg": 1}'))[0] == 400
+    assert asyncio.run(server.handle("POST", "/chat", b"not json"))[0] == 400
+
+
+def test_bad_trades_request_is_400(server):
+    status, payload = asyncio.run(server.handle("POST", "/trades", b'{"trades": [{"Trade ID": "Z1"}]}'))
+    assert status == 400 and "missing" in payload["error"]
+    assert asyncio.run(server.handle("POST", "/trades", b'{"trades": [1]}'))[0] == 400
+
+
+def test_internal_errors_are_500(server):
+    fresh = AgentServer(server.assets, idle_s=60.0)
+
+    async def broken(message):
+        return {}["reply"]
+
+    fresh.session("s").chat["achat"] = broken
+    status, payload = asyncio.run(chat(fresh, "hello", "s"))
+    assert status == 500 and payload["error"].startswith("KeyError")
+
+
+def test_evict_idle_drops_only_idle_unlocked_sessions(server):
+    fresh = AgentServer(server.assets, idle_s=0.0)
+    idle, busy = fresh.session("idle"), fresh.session("busy")
+
+    async def evict_while_busy():
+        async with busy.lock:
+            time.sleep(0.01)
+            return fresh.evict_idle()
+
+    assert asyncio.run(evict_while_busy()) == 1
+    assert list(fresh.sessions) == ["busy"]
+    assert fresh.evict_idle() == 1 and not fresh.sessions
+
+    fresh.idle_s = 60.0
+    fresh.session("recent")
+    assert fresh.evict_idle() == 0 and list(fresh.sessions) == ["recent"]
+
+
+def test_session_lock_serializes_turns(server):
+    fresh = AgentServer(server.assets, idle_s=60.0)
+    s = fresh.session("one")
+    achat, active, peak = s.chat["achat"], [0], [0]
+
+    async def tracked(message):
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        try:
+            return await achat(message)
+        finally:
+            active[0] -= 1
+
+    s.chat["achat"] = tracked
+
+    async def run():
+        return await asyncio.gather(*(chat(fresh, f"Show the last {n} SOL sells", "one") for n in range(2, 8)))
+
+    results = asyncio.run(run())
+    assert all(status == 200 for status, _ in results)
+    assert peak[0] == 1
+    assert [t["role"] for t in s.memory.turns] == ["user", "assistant"] * 2
+
+
+def test_llm_concurrency_is_limited_across_sessions(server):
+    fresh = AgentServer(server.assets, idle_s=60.0)
+
+    async def run():
+        return await asyncio.gather(*(chat(fresh, f"How do you size positions, case {i}?", f"s{i}")
+                                      for i in range(8)))
+
+    results = asyncio.run(run())
+    assert all(status == 200 for status, _ in results)
+    stats = fresh.stats()["llm"]
+    assert stats["max_concurrency"] == 2
+    assert stats["in_flight"] == 0
+    assert stats["peak_in_flight"] == 2
+
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+def test_posted_trades_survive_a_reboot(tmp_path, monkeypatch, fmt):
+    monkeypatch.chdir(tmp_path)
+    write_trades("trades.csv", rows=120, traders=1, seed=11)
+    path = "trades.csv" if fmt == "csv" else convert_trades("trades.csv")
+
+    def boot():
+        return create_server(path, embeddings=HashEmbeddings(), llm=FakeChatModel(latency_s=0.0),
+                             llm_concurrency=2, idle_s=60.0, path_db="vectordb")
+
+    new = pd.read_csv("trades.csv").head(40)
+    new["Trade ID"] = [f"N{i:04d}" for i in range(len(new))]
+    body = json.dumps({"trades": new.to_dict("records")}).encode("utf-8")
+    assert asyncio.run(boot().handle("POST", "/trades", body)) == (200, {"added": 40, "trades": 160})
+
+    assets = boot().assets
+    assert len(assets["store"]) == 160
+    assert set(new["Trade ID"]) <= set(assets["store"].row_of)
+    assert assets["vectorstore"].index.ntotal == 160
+
+
+def test_limiter_is_shared_by_sync_and_async_callers():
+    limited = ConcurrencyLimitedLLM(FakeChatModel(latency_s=0.05), 2)
+
+    async def run():
+        threads = [asyncio.to_thread(limited.invoke, f"sync {i}") for i in range(4)]
+        tasks = [limited.ainvoke(f"async {i}") for i in range(4)]
+        return await asyncio.gather(*threads, *tasks)
+
+    assert len(asyncio.run(run())) == 8
+    assert limited.peak_in_flight == 2 and limited.in_flight == 0
+
+
+def test_limiter_slot_is_not_lost_to_a_cancelled_waiter():
+    limited = ConcurrencyLimitedLLM(FakeChatModel(latency_s=0.05), 1)
+
+    async def run():
+        first = asyncio.create_task(limited.ainvoke("first"))
+        waiting = asyncio.create_task(limited.ainvoke("waiting"))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        await first
+        await asyncio.wait_for(limited.ainvoke("after"), timeout=1.0)
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+    asyncio.run(run())
+    assert limited.in_flight == 0 and limited.peak_in_flight == 1
+
+
+def test_limiter_attribute_lookup_without_llm():
+    bare = ConcurrencyLimitedLLM.__new__(ConcurrencyLimitedLLM)
+    assert not hasattr(bare, "model_name")
+    with pytest.raises(AttributeError):
+        bare.model_name
+
+    limited = ConcurrencyLimitedLLM(FakeChatModel(latency_s=0.0), 3)
+    assert limited.model_name == "fake-chat"
+    assert copy.copy(limited).max_concurrency == 3
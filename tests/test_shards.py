@@ -0,0 +1,67 @@
+import json
+import pickle
+import sqlite3
+import asyncio
+
+import pytest
+
+from gen_synthetic_data import write_trades
+from trader_agent.embed_cache import CachedEmbeddings
+from trader_agent.fakes import HashEmbeddings, FakeChatModel
+from trader_agent.server import AgentServer
+from trader_agent.shards import ShardRouter
+
+
+@pytest.fixture
+def trades(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_trades("trades.csv", rows=150, traders=3, seed=5)
+    return "trades.csv"
+
+
+def cached_rows(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+def test_pickled_embedding_cache_is_read_only(trades):
+    cache = CachedEmbeddings(HashEmbeddings(), "embed_cache.sqlite")
+    cache.embed_documents(["a", "b"])
+    copy = pickle.loads(pickle.dumps(cache))
+    assert copy.read_only and copy.path == cache.path
+    copy.embed_documents(["a", "c"])
+    assert copy.hits == 1 and len(copy.unsaved) == 1
+    assert cached_rows("embed_cache.sqlite") == 2
+    cache.save(copy.unsaved)
+    assert cached_rows("embed_cache.sqlite") == 3
+
+
+def test_parallel_build_writes_the_cache_from_the_parent_only(trades):
+    cache = CachedEmbeddings(HashEmbeddings(), "embed_cache.sqlite")
+    router = ShardRouter.from_trades(trades, "shards", embeddings=cache, llm=FakeChatModel(latency_s=0.0))
+    out = router.build(workers=3)
+    assert sum(r["rows"] for r in out.values()) == 150
+    assert len({r["pid"] for r in out.values()}) > 1
+    assert all("unsaved" not in r for r in out.values())
+    assert cached_rows("embed_cache.sqlite") == 150
+
+
+def test_sessions_release_evicted_shards(trades):
+    router = ShardRouter.from_trades(trades, "shards", embeddings=HashEmbeddings(),
+                                     llm=FakeChatModel(latency_s=0.0), max_resident=1)
+    server = AgentServer(None, idle_s=60.0, router=router)
+    first, second = router.traders()[:2]
+
+    def chat(session_id, trader):
+        body = json.dumps({"message": "Show recent BTC buys", "session_id": session_id, "trader": trader})
+        return asyncio.run(server.handle("POST", "/chat", body.encode("utf-8")))[0]
+
+    assert chat("a", first) == 200
+    assert server.sessions["a"].assets is not None
+    assert chat("b", second) == 200
+    assert router.resident() == [second]
+    assert server.sessions["a"].assets is None and server.sessions["a"].chat is None
+    assert chat("a", first) == 200
+    assert server.sessions["a"].assets is router.assets(first)
+    assert len(server.sessions["a"].memory.turns) == 4
+    assert server.sessions["b"].assets is None
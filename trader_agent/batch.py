@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from .config import BATCH_LLM_CONCURRENCY
+from .query_analysis import analyze_query
+from .pipeline import merge_filters
+from .retriever import FilteredRetriever, retrieve_with_filters, fetch_size
+from .lessons import summarize_lessons_batch
+from .composer import compose_answers
+
+
+def chat_batch(assets: Dict[str, Any], queries: List[str], max_concurrency: int = BATCH_LLM_CONCURRENCY,
+               history: str = "", k: int = 5) -> List[str]:
+    """Answer many independent queries (e.g. a nightly replay of canned questions)
+    and return the replies in order.
+
+    Same stages as one `chat` turn, but each runs once for the whole batch: every
+    distinct query is embedded once through `embed_query` (queries stay out of the
+    document embedding cache), intent/lessons/compose prompts go through the chat
+    model's batch interface, both with at most `max_concurrency` in flight, and
+    unfiltered vector searches run as a single FAISS matrix query. Queries do not see
+    each other; `history` is the shared conversation context (none by default)."""
+    if not queries:
+        return []
+    store = assets["store"]
+    llm = assets["llm"]
+    retriever = assets["retriever"]
+    engine = assets["query_engine"]
+
+    pos = {q: i for i, q in enumerate(dict.fromkeys(queries))}
+    embed = assets["embeddings"].embed_query
+    if len(pos) > 1 and max_concurrency > 1:
+        with ThreadPoolExecutor(min(max_concurrency, len(pos))) as pool:
+            vecs = np.asarray(list(pool.map(embed, pos)), dtype=np.float32)
+    else:
+        vecs = np.asarray([embed(q) for q in pos], dtype=np.float32)
+    qvecs = vecs[[pos[q] for q in queries]]
+
+    intents = assets["intent_classifier"].classify_batch(queries, qvecs, max_concurrency)
+    analyses = [analyze_query(q, store) for q in queries]
+    ranges = [a.date_range for a in analyses]
+    filters = [merge_filters(intent, a) for intent, a in zip(intents, analyses)]
+
+    docs: List[Optional[List[Any]]] = [engine.answer(intent.intent, q, f, r, k=k, analysis=a)
+                                       for intent, q, f, r, a in zip(intents, queries, filters, ranges, analyses)]
+    todo = [i for i, d in enumerate(docs) if d is None]
+    dense: List[Optional[List[Any]]] = [None] * len(queries)
+    if todo and isinstance(retriever, FilteredRetriever):
+        hits = retriever.search_batch(qvecs[todo], [filters[i] for i in todo], [ranges[i] for i in todo], k=fetch_size(k))
+        for i, h in zip(todo, hits):
+            dense[i] = h
+    for i in todo:
+        docs[i] = retrieve_with_filters(retriever, queries[i], filters[i], ranges[i], k, store, dense=dense[i],
+                                        trade_ids=analyses[i].trade_ids, boost_tags=analyses[i].tags)
+
+    lessons = [""] * len(queries)
+    reflect = [i for i, intent in enumerate(intents) if intent.intent == "reflect"]
+    if reflect:
+        stats = [assets["lessons_cube"].stats(*ranges[i]) for i in reflect]
+        summaries = summarize_lessons_batch(llm, {}, stats, assets.get("summary_cache"), max_concurrency)
+        for i, s in zip(reflect, summaries):
+            lessons[i] = s
+
+    persona = assets["persona"]
+    return compose_answers(llm, [
+        dict(persona=persona, history=history, intent=intent.intent, date_window=f"{r[0]} → {r[1]}",
+             docs=d, lessons=lesson or "(none)", query=q)
+        for q, intent, r, d, lesson in zip(queries, intents, ranges, docs, lessons)
+    ], max_concurrency)
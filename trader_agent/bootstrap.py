@@ -1,82 +1,332 @@
 import os
-from typing import Callable, Dict, Any
-from .config import USE_OPENAI, CSV_PATH, OPENAI_CHAT_MODEL, OPENAI_EMBED_MODEL, HF_EMBED_MODEL, HF_CHAT_REPO
-from .data_store import load_csv, build_docs, build_vectorstore, load_vectorstore
-from .persona import extract_persona
+import time
+import threading
+from typing import Dict, Any, Iterator, AsyncIterator, Optional, Tuple, List
+from .config import (BACKEND, CSV_PATH, OPENAI_CHAT_MODEL, OPENAI_EMBED_MODEL, HF_EMBED_MODEL, HF_CHAT_REPO,
+                     RESPONSE_CACHE_ENABLED)
 from .memory import Memory
-from .intent import classify_intent
-from .pipeline import build_graph
-from .composer import compose_answer
-from .retriever import extract_simple_filters
-
-# Backends
-if USE_OPENAI:
-    from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-    EMBEDDINGS = OpenAIEmbeddings(model=OPENAI_EMBED_MODEL)
-    LLM = ChatOpenAI(model=OPENAI_CHAT_MODEL, temperature=0.2)
-else:
+from .composer import compose_answer, acompose_answer, stream_answer, astream_answer
+# The rest of the stack (pandas, faiss, langgraph, model clients) is imported inside
+# load_assets/make_chat, so importing this module stays cheap.
+
+# Backends are created on first use (not at import), once per process
+_BACKENDS: Dict[str, Any] = {}
+_BACKENDS_LOCK = threading.Lock()
+
+def _make_backends(backend: str) -> Tuple[Any, Any]:
+    if backend == "fake":
+        from .fakes import HashEmbeddings, FakeChatModel
+        return HashEmbeddings(), FakeChatModel()
+    from .embed_cache import CachedEmbeddings
+    if backend == "openai":
+        from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+        return (CachedEmbeddings(OpenAIEmbeddings(model=OPENAI_EMBED_MODEL)),
+                ChatOpenAI(model=OPENAI_CHAT_MODEL, temperature=0.2))
     from langchain_community.embeddings import HuggingFaceEmbeddings
     from langchain_community.llms import HuggingFaceHub
-    EMBEDDINGS = HuggingFaceEmbeddings(model_name=HF_EMBED_MODEL)
-    LLM = HuggingFaceHub(repo_id=HF_CHAT_REPO,
-                         huggingfacehub_api_token=os.getenv("HUGGINGFACEHUB_API_TOKEN"),
-                         model_kwargs={"temperature": 0.2, "max_new_tokens": 512})
+    return (CachedEmbeddings(HuggingFaceEmbeddings(model_name=HF_EMBED_MODEL)),
+            HuggingFaceHub(repo_id=HF_CHAT_REPO,
+                           huggingfacehub_api_token=os.getenv("HUGGINGFACEHUB_API_TOKEN"),
+                           model_kwargs={"temperature": 0.2, "max_new_tokens": 512}))
 
-def boot_agent(csv_path: str = CSV_PATH) -> Dict[str, Any]:
-    df = load_csv(csv_path)
-    docs = build_docs(df)
-    #For first time rum
-    vectorstore = build_vectorstore(docs, EMBEDDINGS)
+def _backend(kind: str) -> Any:
+    if not _BACKENDS:
+        with _BACKENDS_LOCK:
+            if not _BACKENDS:
+                _BACKENDS["embeddings"], _BACKENDS["llm"] = _make_backends(BACKEND)
+    return _BACKENDS[kind]
+
+def get_embeddings():
+    return _backend("embeddings")
+
+def get_llm():
+    return _backend("llm")
+
+def __getattr__(name: str):
+    # module-level EMBEDDINGS / LLM kept for existing callers; resolved lazily
+    if name == "EMBEDDINGS":
+        return get_embeddings()
+    if name == "LLM":
+        return get_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def load_assets(csv_path: str = CSV_PATH, embeddings=None, llm=None, path_db: str = "vectordb",
+                intent_classifier=None) -> Dict[str, Any]:
+    """Everything that can be shared read-only between conversations. Pass
+    `intent_classifier` to share one (and its cache) between several asset sets."""
+    from .data_store import load_trades, build_docs, bind_rows, sync_vectorstore, sync_lexical_index
+    from .retriever import FilteredRetriever
+    from .persona import PersonaStats
+    from .lessons import LessonCube
+    from .intent import IntentClassifier
+    from .summary_cache import SummaryCache
+    from .pipeline import build_graph
+    from .query_engine import TradeQueryEngine
+    from .telemetry import TRACER, InstrumentedLLM
+    from .response_cache import ResponseCache
+
+    embeddings = embeddings if embeddings is not None else get_embeddings()
+    # counts calls/tokens against the current traced turn; passthrough otherwise
+    llm = InstrumentedLLM(llm if llm is not None else get_llm())
+
+    # CSV, or Parquet/Arrow (memory-mapped, only the agent's columns are read)
+    store = load_trades(csv_path)
+    docs = build_docs(store)
+    # Full build on first run; afterwards only new/changed trades are re-embedded
+    vectorstore = sync_vectorstore(docs, embeddings, path_db)
+    # docstore metadata becomes row views into the store instead of per-doc copies
+    bind_rows(vectorstore, store)
+    # BM25 over IDs/tags/dates, persisted next to the FAISS index
+    lexical = sync_lexical_index(docs, path_db)
+
+    retriever = FilteredRetriever(vectorstore, store, k=12, lexical=lexical)
+
+    # persona snapshot (running counters, so ingested trades can update it)
+    persona_stats = PersonaStats(store)
+    persona = persona_stats.persona()
+
+    # pre-aggregated daily stats for reflect queries
+    lessons_cube = LessonCube(store)
 
-    #Load from local
-    #vectorstore = load_vectorstore("vectordb", EMBEDDINGS)
+    # keyword / nearest-neighbour tiers before the LLM intent call
+    if intent_classifier is None:
+        intent_classifier = IntentClassifier(llm, embeddings)
 
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 12})
+    # reflect summaries keyed by stats fingerprint + model
+    summary_cache = SummaryCache()
 
-    # persona snapshot
-    persona = extract_persona(df)
+    # exact list/best/why_trade answers straight from the trade table
+    query_engine = TradeQueryEngine(store)
 
     # langgraph app
-    app = build_graph(df, retriever, LLM)
+    app = build_graph(store, retriever, llm, lessons_cube, intent_classifier, summary_cache, query_engine)
 
-    # short-term memory
-    memory = Memory()
+    # replies to near-duplicate questions, shared across sessions
+    response_cache = ResponseCache() if RESPONSE_CACHE_ENABLED else None
 
-    def chat(user_text: str) -> str:
-        memory.add("user", user_text)
-        # ✅ Only pass 'query' into invoke()
-        state = app.invoke({"query": user_text})
+    return {
+        "df": store.df,
+        "store": store,
+        "vectorstore": vectorstore,
+        "lexical": lexical,
+        "retriever": retriever,
+        "persona": persona,
+        "persona_stats": persona_stats,
+        "lessons_cube": lessons_cube,
+        "summary_cache": summary_cache,
+        "app": app,
+        "llm": llm,
+        "embeddings": embeddings,
+        "intent_classifier": intent_classifier,
+        "query_engine": query_engine,
+        "response_cache": response_cache,
+        "tracer": TRACER,
+        "csv_path": csv_path,
+        "path_db": path_db,
+    }
+
+async def _aonce(text: str) -> AsyncIterator[str]:
+    yield text
+
+def make_chat(assets: Dict[str, Any], memory: Optional[Memory] = None) -> Dict[str, Any]:
+    """Per-conversation chat functions over shared `assets`, with their own short-term memory."""
+    from .telemetry import TRACER, span, current_turn
+    from .response_cache import query_context, data_version
+    memory = memory if memory is not None else Memory()
+    app = assets["app"]
+    intent_classifier = assets["intent_classifier"]
+    tracer = assets.get("tracer", TRACER)
+    cache = assets.get("response_cache")
+
+    def cache_key(user_text: str, qvec, history: str) -> Tuple[Any, Any, Any]:
+        return qvec, query_context(user_text, assets["store"], history), data_version(assets)
+
+    def cache_get(key) -> Optional[str]:
+        with span("response_cache"):
+            reply = cache.get(*key)
+        trace = current_turn()
+        if trace is not None:
+            trace.extra["response_cache"] = "hit" if reply is not None else "miss"
+        return reply
 
-        intent_obj = state.get("intent")
-        if intent_obj is None:
-            # Extremely defensive fallback (shouldn't happen)
-            intent_obj = classify_intent(LLM, user_text)
+    # token accounting of the most recent composed prompt (see composer._response_inputs)
+    last_prompt: Dict[str, int] = {}
 
+    def note_prompt(trace=None) -> None:
+        trace = trace if trace is not None else current_turn()
+        if trace is not None and last_prompt:
+            trace.extra.update(tokens_saved=last_prompt["tokens_saved"], prompt_budget_tokens=last_prompt["prompt_tokens"])
+
+    def answer_inputs(state: Dict[str, Any], intent_obj, user_text: str) -> Dict[str, Any]:
         intent = intent_obj.intent if hasattr(intent_obj, "intent") else getattr(intent_obj, "intent", "generic")
         s,e = state.get("date_range", (None, None))
         docs = state.get("docs", [])
         lessons = state.get("lessons_text","") if intent=="reflect" else ""
-
-        reply = compose_answer(
-            llm=LLM,
+        return dict(
+            llm=assets["llm"],
             intent=intent,
-            persona=persona,
+            persona=assets["persona"],
             date_window=f"{s} → {e}",
-            lessons=lessons or "(none)",         
+            lessons=lessons or "(none)",
             history=memory.last_context(),
             query=user_text,
-            docs=docs,            
+            docs=docs,
+            report=last_prompt,
         )
+
+    def chat(user_text: str) -> str:
+        with tracer.turn(user_text):
+            history = memory.last_context()  # the turns before this one
+            memory.add("user", user_text)
+            key = None
+            if cache is not None:
+                key = cache_key(user_text, assets["embeddings"].embed_query(user_text), history)
+                reply = cache_get(key)
+                if reply is not None:
+                    memory.add("assistant", reply)
+                    return reply
+            # ✅ Only pass 'query' into invoke()
+            state = app.invoke({"query": user_text})
+
+            intent_obj = state.get("intent")
+            if intent_obj is None:
+                # Extremely defensive fallback (shouldn't happen)
+                intent_obj = intent_classifier.classify(user_text)
+
+            with span("compose_answer"):
+                reply = compose_answer(**answer_inputs(state, intent_obj, user_text))
+            note_prompt()
+            if key is not None:
+                cache.put(*key[:2], reply, key[2])
+            memory.add("assistant", reply)
+            return reply
+
+    async def achat(user_text: str) -> str:
+        with tracer.turn(user_text):
+            history = memory.last_context()
+            memory.add("user", user_text)
+            key = None
+            if cache is not None:
+                key = cache_key(user_text, await assets["embeddings"].aembed_query(user_text), history)
+                reply = cache_get(key)
+                if reply is not None:
+                    memory.add("assistant", reply)
+                    return reply
+            state = await app.ainvoke({"query": user_text})
+
+            intent_obj = state.get("intent")
+            if intent_obj is None:
+                intent_obj = await intent_classifier.aclassify(user_text)
+
+            with span("compose_answer"):
+                reply = await acompose_answer(**answer_inputs(state, intent_obj, user_text))
+            note_prompt()
+            if key is not None:
+                cache.put(*key[:2], reply, key[2])
+            memory.add("assistant", reply)
+            return reply
+
+    # timings of the most recent streamed turn: graph_s, ttft_s (first token), total_s
+    last_stream_timing: Dict[str, float] = {}
+
+    # Streams only make the trace current while pulling the next chunk, so it never
+    # leaks into the consumer's context between yields.
+    def chat_stream(user_text: str) -> Iterator[str]:
+        t0 = time.perf_counter()
+        trace = tracer.begin(user_text)
+        with tracer.activate(trace):
+            history = memory.last_context()
+            memory.add("user", user_text)
+            key = cached = None
+            if cache is not None:
+                key = cache_key(user_text, assets["embeddings"].embed_query(user_text), history)
+                cached = cache_get(key)
+            if cached is not None:
+                it = iter([cached])
+            else:
+                state = app.invoke({"query": user_text})
+                intent_obj = state.get("intent") or intent_classifier.classify(user_text)
+                it = stream_answer(**answer_inputs(state, intent_obj, user_text))
+        t_graph = time.perf_counter()
+
+        parts = []
+        while True:
+            with tracer.activate(trace):
+                chunk = next(it, None)
+            if chunk is None:
+                break
+            if not parts:
+                last_stream_timing.update(graph_s=t_graph - t0, ttft_s=time.perf_counter() - t0)
+            parts.append(chunk)
+            yield chunk
+        reply = "".join(parts)
+        if key is not None and cached is None:
+            cache.put(*key[:2], reply, key[2])
         memory.add("assistant", reply)
-        return reply
+        last_stream_timing["total_s"] = time.perf_counter() - t0
+        if trace is not None:
+            trace.add_span("compose_answer", last_stream_timing["total_s"] - (t_graph - t0))
+            trace.extra["ttft_s"] = last_stream_timing.get("ttft_s")
+            if cached is None:
+                note_prompt(trace)
+        tracer.finish(trace)
+
+    async def achat_stream(user_text: str) -> AsyncIterator[str]:
+        t0 = time.perf_counter()
+        trace = tracer.begin(user_text)
+        with tracer.activate(trace):
+            history = memory.last_context()
+            memory.add("user", user_text)
+            key = cached = None
+            if cache is not None:
+                key = cache_key(user_text, await assets["embeddings"].aembed_query(user_text), history)
+                cached = cache_get(key)
+            if cached is not None:
+                it = _aonce(cached)
+            else:
+                state = await app.ainvoke({"query": user_text})
+                intent_obj = state.get("intent") or await intent_classifier.aclassify(user_text)
+                it = astream_answer(**answer_inputs(state, intent_obj, user_text)).__aiter__()
+        t_graph = time.perf_counter()
+
+        parts = []
+        while True:
+            with tracer.activate(trace):
+                chunk = await anext(it, None)
+            if chunk is None:
+                break
+            if not parts:
+                last_stream_timing.update(graph_s=t_graph - t0, ttft_s=time.perf_counter() - t0)
+            parts.append(chunk)
+            yield chunk
+        reply = "".join(parts)
+        if key is not None and cached is None:
+            cache.put(*key[:2], reply, key[2])
+        memory.add("assistant", reply)
+        last_stream_timing["total_s"] = time.perf_counter() - t0
+        if trace is not None:
+            trace.add_span("compose_answer", last_stream_timing["total_s"] - (t_graph - t0))
+            trace.extra["ttft_s"] = last_stream_timing.get("ttft_s")
+            if cached is None:
+                note_prompt(trace)
+        tracer.finish(trace)
+
+    def chat_batch(queries: List[str], **kwargs) -> List[str]:
+        """Independent replies to many queries (see `batch.chat_batch`); memory is not touched."""
+        from .batch import chat_batch as run
+        return run(assets, queries, **kwargs)
 
     return {
-        "df": df,
-        "vectorstore": vectorstore,
-        "retriever": retriever,
-        "persona": persona,
-        "app": app,
-        "llm": LLM,
         "chat": chat,
+        "chat_batch": chat_batch,
+        "achat": achat,
+        "chat_stream": chat_stream,
+        "achat_stream": achat_stream,
+        "last_stream_timing": last_stream_timing,
+        "last_prompt": last_prompt,
         "memory": memory
-    }
\ No newline at end of file
+    }
+
+def boot_agent(csv_path: str = CSV_PATH) -> Dict[str, Any]:
+    assets = load_assets(csv_path)
+    return {**assets, **make_chat(assets)}
@@ -1,43 +1,160 @@
-from typing import List, Dict, Any
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.documents import Document
+from typing import List, Dict, Any, Iterator, AsyncIterator, Optional, TYPE_CHECKING
+from functools import lru_cache
 import json
 
-def docs_to_bullets(docs: List[Document]) -> str:
-    lines = []
-    for d in docs:
-        m = d.metadata
-        lines.append(
-            f"- {m['Trade ID']} | {m['Asset']} | {m['Buy/Sell']} @ {m['Price']} x {m['Volume']} | "
+from .config import PROMPT_TOKEN_BUDGET, PROMPT_HISTORY_SHARE, PROMPT_LESSONS_SHARE
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+def doc_bullet(d: "Document") -> str:
+    m = d.metadata
+    return (f"- {m['Trade ID']} | {m['Asset']} | {m['Buy/Sell']} @ {m['Price']} x {m['Volume']} | "
             f"{m['Date']} | {m['Outcome']} | Tags: {m['Tags']} | "
             f"RSI {m['RSI']}, ΔVol {m['Volume_Change_Pct']}%, Sent {m['Sentiment_Score']} | "
-            f"SetupScore {m.get('_setup_score','')}"
-        )
-    return "\\n".join(lines) if lines else "- (none)"
-
-
-def compose_answer(llm, persona: Dict[str, Any], history: str, intent: str, date_window: str, docs: List[Document], lessons: str, query: str) -> str:
-    
-    response_prompt = ChatPromptTemplate.from_messages([
-    ("system",
-     "You are a trader assistant with a consistent trader personality inferred from persona.\n"
-     "Answer ONLY using the provided past-trade evidence and persona; do not give financial advice.\n"
-     "When explaining, cite metrics (RSI, ΔVol, Sentiment, Tags, SetupScore) from retrieved rows.\n"
-     "Intent: {intent}\nPersona: {persona}\nDate window: {date_window}\nLessons (if any):\n{lessons}\n"
-     "Conversation (recent):\n{history}"),
-    ("human", "User query: {query}\nRelevant past trades:\n{evidence}")
-])
-    response_chain = response_prompt | llm | StrOutputParser()
-
-    msgs = response_chain.invoke({
+            f"SetupScore {m.get('_setup_score','')}")
+
+
+def docs_to_bullets(docs: List["Document"]) -> str:
+    return "\n".join(doc_bullet(d) for d in docs) if docs else "- (none)"
+
+
+def compact_persona(persona: Dict[str, Any]) -> str:
+    """`key=value; ...` form of the persona (a fraction of its JSON tokens), memoized per persona."""
+    return _compact_persona(json.dumps(persona, sort_keys=True, ensure_ascii=False, default=str))
+
+
+@lru_cache(maxsize=64)
+def _compact_persona(persona_json: str) -> str:
+    persona = json.loads(persona_json)
+    parts = []
+    for k, v in persona.items():
+        if k == "rules" or v in (None, "", []):
+            continue
+        parts.append(f"{k}={','.join(map(str, v)) if isinstance(v, list) else v}")
+    if persona.get("rules"):
+        parts.append("rules: " + " ".join(persona["rules"]))
+    return "; ".join(parts)
+
+
+def response_chain(llm):
+    from langchain_core.output_parsers import StrOutputParser
+    return response_prompt() | llm | StrOutputParser()
+
+
+@lru_cache(maxsize=None)
+def response_prompt():
+    from langchain_core.prompts import ChatPromptTemplate
+    return ChatPromptTemplate.from_messages([
+        ("system",
+         "You are a trader assistant with a consistent trader personality inferred from persona.\n"
+         "Answer ONLY using the provided past-trade evidence and persona; do not give financial advice.\n"
+         "When explaining, cite metrics (RSI, ΔVol, Sentiment, Tags, SetupScore) from retrieved rows.\n"
+         "Intent: {intent}\nPersona: {persona}\nDate window: {date_window}\nLessons (if any):\n{lessons}\n"
+         "Conversation (recent):\n{history}"),
+        ("human", "User query: {query}\nRelevant past trades:\n{evidence}")
+    ])
+
+
+def __getattr__(name: str):
+    # RESPONSE_PROMPT is built on first access so importing the module skips langchain
+    if name == "RESPONSE_PROMPT":
+        return response_prompt()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@lru_cache(maxsize=None)
+def _template_tokens() -> int:
+    from .tokens import count_tokens
+    prompt = response_prompt()
+    return sum(count_tokens(m.content) for m in prompt.format_messages(**{v: "" for v in prompt.input_variables}))
+
+
+def _score(d: "Document") -> float:
+    try:
+        return float(d.metadata.get("_setup_score") or 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _response_inputs(persona: Dict[str, Any], history: str, intent: str, date_window: str, docs: List["Document"], lessons: str, query: str,
+                     budget: Optional[int] = PROMPT_TOKEN_BUDGET, report: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
+    """Prompt variables, fitted to `budget` tokens for the whole prompt (None = as is).
+
+    The persona is sent in compact form. Over budget, lessons keep their head and
+    history its tail, each capped at a share of what is left after the fixed
+    parts; evidence rows are then added by descending setup score while they fit
+    (kept rows stay in retrieval order). `report`, if given, receives the token
+    accounting."""
+    from .tokens import count_tokens, truncate_tokens
+    bullets = [doc_bullet(d) for d in docs]
+    full = {
         "intent": intent,
         "persona": json.dumps(persona, ensure_ascii=False),
         "date_window": date_window,
         "lessons": lessons or "(none)",
         "history": history,
         "query": query,
-        "evidence": docs_to_bullets(docs)
-    })
+        "evidence": "\n".join(bullets) if bullets else "- (none)",
+    }
+    if budget is None and report is None:
+        return full
+    tokens = {k: count_tokens(v) for k, v in full.items()}
+    full_tokens = _template_tokens() + sum(tokens.values())
+    inputs, kept = full, len(docs)
+    if budget is not None:
+        inputs = dict(full, persona=compact_persona(persona))
+        tokens["persona"] = count_tokens(inputs["persona"])
+    if budget is not None and _template_tokens() + sum(tokens.values()) > budget:
+        free = budget - _template_tokens() - sum(tokens[k] for k in ("intent", "persona", "date_window", "query"))
+        inputs["lessons"] = truncate_tokens(inputs["lessons"], int(max(0, free) * PROMPT_LESSONS_SHARE))
+        inputs["history"] = truncate_tokens(history, int(max(0, free) * PROMPT_HISTORY_SHARE), keep="tail")
+        tokens["lessons"], tokens["history"] = count_tokens(inputs["lessons"]), count_tokens(inputs["history"])
+        free -= tokens["lessons"] + tokens["history"]
+        keep = []
+        for i in sorted(range(len(docs)), key=lambda i: -_score(docs[i])):
+            cost = count_tokens(bullets[i]) + 1
+            if cost > free:
+                break
+            keep.append(i)
+            free -= cost
+        kept = len(keep)
+        inputs["evidence"] = "\n".join(bullets[i] for i in sorted(keep)) if keep else "- (none)"
+        tokens["evidence"] = count_tokens(inputs["evidence"])
+    if report is not None:
+        used = _template_tokens() + sum(tokens.values())
+        report.update(prompt_tokens=used, full_prompt_tokens=full_tokens, tokens_saved=full_tokens - used,
+                      evidence_rows=kept, evidence_dropped=len(docs) - kept)
+    return inputs
+
+
+def compose_answer(llm, persona: Dict[str, Any], history: str, intent: str, date_window: str, docs: List["Document"], lessons: str, query: str,
+                   budget: Optional[int] = PROMPT_TOKEN_BUDGET, report: Optional[Dict[str, Any]] = None) -> str:
+    chain = response_chain(llm)
+    return chain.invoke(_response_inputs(persona, history, intent, date_window, docs, lessons, query, budget, report))
+
+
+def compose_answers(llm, answers: List[Dict[str, Any]], max_concurrency: int = 8) -> List[str]:
+    """`compose_answer` for many turns (each a dict of its keyword arguments, minus
+    `llm`) through the model's batch interface; replies come back in order."""
+    chain = response_chain(llm)
+    return chain.batch([_response_inputs(**a) for a in answers], config={"max_concurrency": max_concurrency})
+
+
+async def acompose_answer(llm, persona: Dict[str, Any], history: str, intent: str, date_window: str, docs: List["Document"], lessons: str, query: str,
+                          budget: Optional[int] = PROMPT_TOKEN_BUDGET, report: Optional[Dict[str, Any]] = None) -> str:
+    chain = response_chain(llm)
+    return await chain.ainvoke(_response_inputs(persona, history, intent, date_window, docs, lessons, query, budget, report))
+
+
+def stream_answer(llm, persona: Dict[str, Any], history: str, intent: str, date_window: str, docs: List["Document"], lessons: str, query: str,
+                  budget: Optional[int] = PROMPT_TOKEN_BUDGET, report: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+    chain = response_chain(llm)
+    yield from chain.stream(_response_inputs(persona, history, intent, date_window, docs, lessons, query, budget, report))
+
 
-    return msgs
\ No newline at end of file
+async def astream_answer(llm, persona: Dict[str, Any], history: str, intent: str, date_window: str, docs: List["Document"], lessons: str, query: str,
+                         budget: Optional[int] = PROMPT_TOKEN_BUDGET, report: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+    chain = response_chain(llm)
+    async for chunk in chain.astream(_response_inputs(persona, history, intent, date_window, docs, lessons, query, budget, report)):
+        yield chunk
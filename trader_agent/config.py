@@ -5,6 +5,10 @@ from datetime import datetime
 # Flip to False to use HuggingFace community models instead of OpenAI.
 USE_OPENAI: bool = True
 
+# Backend: "openai", "hf", or "fake" (deterministic local embeddings + stub chat model,
+# for offline tests and benchmarks). Defaults to the USE_OPENAI toggle.
+BACKEND: str = os.getenv("TRADER_AGENT_BACKEND", "openai" if USE_OPENAI else "hf")
+
 # CSV location (change if needed)
 CSV_PATH: str = os.getenv("CSV_PATH", "trader_past_trades.csv")
 
@@ -17,4 +21,82 @@ OPENAI_CHAT_MODEL  = "gpt-4o-mini"
 
 # HuggingFace defaults (override via env if desired)
 HF_EMBED_MODEL = os.getenv("HF_EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
-HF_CHAT_REPO   = os.getenv("HF_CHAT_REPO", "mistralai/Mixtral-8x7B-Instruct-v0.1")
\ No newline at end of file
+HF_CHAT_REPO   = os.getenv("HF_CHAT_REPO", "mistralai/Mixtral-8x7B-Instruct-v0.1")
+
+# Embedding stage: batch size / parallel batches sent to the backend and the on-disk cache
+EMBED_BATCH_SIZE   = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+EMBED_CONCURRENCY  = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_CACHE_PATH   = os.getenv("EMBED_CACHE_PATH", "embed_cache.sqlite")
+
+# Filtered retrieval: candidate sets up to this size are scored exactly instead of via FAISS
+PREFILTER_EXACT_MAX = int(os.getenv("PREFILTER_EXACT_MAX", "4096"))
+
+# Intent cascade: local tiers answer when confident, otherwise the LLM is asked
+INTENT_KNN_THRESHOLD = float(os.getenv("INTENT_KNN_THRESHOLD", "0.80"))
+# keyword-tier score (see intent.KEYWORD_RULES) the top intent must lead the next by
+INTENT_KEYWORD_MARGIN = float(os.getenv("INTENT_KEYWORD_MARGIN", "2"))
+INTENT_CACHE_SIZE    = int(os.getenv("INTENT_CACHE_SIZE", "1024"))
+
+# Lesson-summary cache (LRU + TTL), keyed by stats fingerprint and model
+SUMMARY_CACHE_PATH   = os.getenv("SUMMARY_CACHE_PATH", "summary_cache.sqlite")
+SUMMARY_CACHE_MAX    = int(os.getenv("SUMMARY_CACHE_MAX", "512"))
+SUMMARY_CACHE_TTL_S  = float(os.getenv("SUMMARY_CACHE_TTL_S", str(7 * 24 * 3600)))
+
+# Multi-session server
+SERVER_HOST            = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT            = int(os.getenv("SERVER_PORT", "8080"))
+SERVER_LLM_CONCURRENCY = int(os.getenv("SERVER_LLM_CONCURRENCY", "8"))
+SESSION_IDLE_S         = float(os.getenv("SESSION_IDLE_S", "1800"))
+
+# Fake backend knobs
+FAKE_EMBED_DIM       = int(os.getenv("FAKE_EMBED_DIM", "256"))
+FAKE_LLM_LATENCY_S   = float(os.getenv("FAKE_LLM_LATENCY_S", "0.0"))
+
+# Per-turn tracing (off by default); optional JSON-lines export and rolling window size
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "0").lower() in ("1", "true", "yes")
+TRACE_JSONL   = os.getenv("TRACE_JSONL", "")
+TRACE_WINDOW  = int(os.getenv("TRACE_WINDOW", "2048"))
+
+# Live ingestion (ingest.py): tail-follow poll interval and how often the index is saved
+INGEST_POLL_S        = float(os.getenv("INGEST_POLL_S", "1.0"))
+INGEST_SAVE_EVERY_S  = float(os.getenv("INGEST_SAVE_EVERY_S", "30"))
+
+# Vector index type: "flat" (exact), "hnsw", "ivfpq" or "ivfsq8" (approximate/compressed).
+# IVF/PQ are trained on a random sample; nprobe / efSearch trade recall for latency.
+FAISS_INDEX              = os.getenv("FAISS_INDEX", "flat").lower()
+FAISS_TRAIN_SAMPLE       = int(os.getenv("FAISS_TRAIN_SAMPLE", "100000"))
+FAISS_IVF_NLIST          = int(os.getenv("FAISS_IVF_NLIST", "0"))   # 0 = ~4*sqrt(n)
+FAISS_NPROBE             = int(os.getenv("FAISS_NPROBE", "16"))
+FAISS_PQ_M               = int(os.getenv("FAISS_PQ_M", "16"))       # sub-quantizers (reduced to a divisor of dim)
+FAISS_HNSW_M             = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_HNSW_EF_CONSTRUCTION = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "200"))
+FAISS_HNSW_EF_SEARCH     = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+
+# Batch chat (chat_batch): LLM calls in flight per batch (intent, lessons, compose)
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+
+# Semantic response cache in front of chat (opt-in): cosine threshold on the query
+# embedding (same date window / filters / trade IDs / prior turns required) and LRU size cap
+RESPONSE_CACHE_ENABLED   = os.getenv("RESPONSE_CACHE_ENABLED", "0").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+RESPONSE_CACHE_MAX       = int(os.getenv("RESPONSE_CACHE_MAX", "1024"))
+
+# Prompt assembly for compose_answer: token budget for the whole response prompt
+# (tiktoken encoding of the chat model; chars/4 estimate if it cannot be loaded)
+PROMPT_TOKEN_BUDGET     = int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))
+PROMPT_HISTORY_SHARE    = float(os.getenv("PROMPT_HISTORY_SHARE", "0.25"))  # max share of the free budget
+PROMPT_LESSONS_SHARE    = float(os.getenv("PROMPT_LESSONS_SHARE", "0.35"))
+# Memory: recent turns kept verbatim (ring buffer); older ones fold into a rolling summary
+MEMORY_RECENT_TURNS     = int(os.getenv("MEMORY_RECENT_TURNS", "2"))
+MEMORY_SUMMARY_TOKENS   = int(os.getenv("MEMORY_SUMMARY_TOKENS", "160"))
+
+# Multi-trader deployment (shards.py): trades are split by TRADER_COLUMN into one shard
+# (trades file + indexes) per trader under SHARD_DIR; shards are built in a process pool
+# and at most SHARD_MAX_RESIDENT stay loaded, least-recently-used evicted first
+TRADER_COLUMN      = os.getenv("TRADER_COLUMN", "Trader")
+SHARD_DIR          = os.getenv("SHARD_DIR", "shards")
+SHARD_MAX_RESIDENT = int(os.getenv("SHARD_MAX_RESIDENT", "8"))
+SHARD_BOOT_WORKERS = int(os.getenv("SHARD_BOOT_WORKERS", "0"))  # 0 = os.cpu_count()
+
+# Query analysis (query_analysis.py): memoized per (query, TODAY, data date span)
+QUERY_ANALYSIS_CACHE_SIZE = int(os.getenv("QUERY_ANALYSIS_CACHE_SIZE", "4096"))
@@ -1,12 +1,126 @@
+import io
+import os
+import re
+import json
+import hashlib
+from collections import Counter
+import numpy as np
 import pandas as pd
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional, Union, Sequence, TYPE_CHECKING
 
-from langchain_core.documents import Document
-from langchain_community.vectorstores import FAISS
+from .trade_store import TradeStore, CATEGORICAL_COLUMNS, as_store
+from .config import (FAISS_INDEX, FAISS_TRAIN_SAMPLE, FAISS_IVF_NLIST, FAISS_NPROBE, FAISS_PQ_M,
+                     FAISS_HNSW_M, FAISS_HNSW_EF_CONSTRUCTION, FAISS_HNSW_EF_SEARCH)
 
-def load_csv(csv_path: str) -> pd.DataFrame:
-    df = pd.read_csv(csv_path)
-    return df
+# langchain/faiss are imported on first use so that loading trades stays cheap
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+    from langchain_community.vectorstores import FAISS
+
+MANIFEST_FILE = "manifest.json"
+LEXICAL_FILE = "lexical.npz"
+
+# columns the agent reads; anything else in the source file is not loaded
+TRADE_COLUMNS = ["Trade ID", "Trader", "Asset", "Buy/Sell", "Price", "Volume", "Date", "Outcome", "Tags",
+                 "RSI", "Volume_Change_Pct", "Sentiment_Score"]
+PARQUET_EXT = (".parquet", ".pq")
+ARROW_EXT = (".arrow", ".feather", ".ipc")
+
+def trades_format(path: str) -> str:
+    p = path.lower()
+    return "parquet" if p.endswith(PARQUET_EXT) else ("arrow" if p.endswith(ARROW_EXT) else "csv")
+
+def read_trades(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Trade table from CSV, Parquet or Arrow IPC (by extension), projected to
+    `columns` (default TRADE_COLUMNS; missing ones are skipped). Binary formats
+    are memory-mapped and only the projected columns are decoded; categorical
+    columns come back dictionary-encoded."""
+    wanted = columns or TRADE_COLUMNS
+    fmt = trades_format(path)
+    if fmt == "csv":
+        return pd.read_csv(path, usecols=lambda c: c in wanted)
+    import pyarrow as pa
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        names = pq.read_schema(path, memory_map=True).names
+        cols = [c for c in names if c in wanted]
+        table = pq.read_table(path, columns=cols, memory_map=True,
+                              read_dictionary=[c for c in CATEGORICAL_COLUMNS if c in cols])
+    else:
+        with pa.memory_map(path, "r") as source:
+            try:
+                table = pa.ipc.open_file(source).read_all()
+            except pa.ArrowInvalid:  # stream format
+                source.seek(0)
+                table = pa.ipc.open_stream(source).read_all()
+        table = table.select([c for c in table.column_names if c in wanted])
+    # self_destruct: each column's Arrow buffers are released as it is converted
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+def append_trades(path: str, df: pd.DataFrame) -> None:
+    """Add rows to a trades file, in its own columns (missing ones left empty).
+    CSV is appended to; Parquet/Arrow are rewritten to a temporary file that then
+    replaces the original, so readers with the old file memory-mapped keep a
+    consistent copy."""
+    fmt = trades_format(path)
+    if fmt == "csv":
+        with open(path, "r", encoding="utf-8") as f:
+            header = pd.read_csv(io.StringIO(f.readline())).columns
+        df.reindex(columns=header).to_csv(path, mode="a", header=False, index=False)
+        return
+    import pyarrow as pa
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        table = pq.read_table(path)
+    else:
+        with pa.memory_map(path, "r") as source:
+            try:
+                table = pa.ipc.open_file(source).read_all()
+            except pa.ArrowInvalid:  # stream format
+                source.seek(0)
+                table = pa.ipc.open_stream(source).read_all()
+    new = pa.Table.from_pandas(df.reindex(columns=table.schema.names), schema=table.schema, preserve_index=False)
+    table = pa.concat_tables([table, new])
+    tmp = path + ".tmp"
+    if fmt == "parquet":
+        pq.write_table(table, tmp)
+    else:
+        with pa.ipc.new_file(tmp, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)
+
+def load_trades(path: str, columns: Optional[List[str]] = None) -> TradeStore:
+    return TradeStore(read_trades(path, columns))
+
+def load_csv(csv_path: str) -> TradeStore:
+    return load_trades(csv_path)
+
+def convert_trades(src: str, dst: Optional[str] = None, block_size: int = 64 << 20) -> str:
+    """One-shot CSV -> Parquet (or Arrow IPC, by `dst` extension) conversion,
+    streamed in blocks so large files never sit in memory whole. Column types are
+    inferred from the first block; ID/text columns are always kept as strings."""
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    dst = dst or os.path.splitext(src)[0] + ".parquet"
+    fmt = trades_format(dst)
+    if fmt == "csv":
+        raise ValueError(f"destination must be .parquet/.pq or .arrow/.feather, got {dst!r}")
+    text = {c: pa.string() for c in ("Trade ID", "Trader", "Asset", "Buy/Sell", "Date", "Outcome", "Tags")}
+    reader = pacsv.open_csv(src, read_options=pacsv.ReadOptions(block_size=block_size),
+                            convert_options=pacsv.ConvertOptions(column_types=text, strings_can_be_null=True))
+    tmp = dst + ".tmp"
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(tmp, reader.schema)
+    else:
+        writer = pa.ipc.new_file(tmp, reader.schema)
+    try:
+        for batch in reader:
+            writer.write_table(pa.Table.from_batches([batch]))
+    finally:
+        writer.close()
+    os.replace(tmp, dst)
+    return dst
 
 def row_to_text(row) -> str:
     fields = [
@@ -24,17 +138,324 @@ def row_to_text(row) -> str:
     ]
     return " | ".join(map(str, fields))
 
-def build_docs(df: pd.DataFrame) -> List[Document]:
-    return [
-        Document(page_content=row_to_text(r), metadata={k: r[k] for k in df.columns})
-        for _, r in df.iterrows()
-    ]
+TEXT_COLUMNS = ["Trade ID", "Asset", "Buy/Sell", "Price", "Volume", "Date", "Outcome", "Tags",
+                "RSI", "Volume_Change_Pct", "Sentiment_Score"]
+
+def build_docs(trades: Union[TradeStore, pd.DataFrame], rows: Optional[Sequence[int]] = None) -> List["Document"]:
+    """One Document per row (all rows, or `rows`). Metadata is a `TradeRow` view
+    into the store rather than a copy of the fields."""
+    from langchain_core.documents import Document
+    store = as_store(trades)
+    rows = np.arange(len(store)) if rows is None else np.asarray(rows, dtype=np.int64)
+    df = store.df
+    values = zip(*(df[c].take(rows).to_numpy(dtype=object) for c in TEXT_COLUMNS))
+    docs = []
+    for i, v in zip(rows.tolist(), values):
+        row = dict(zip(TEXT_COLUMNS, v))
+        d = Document(id=str(row["Trade ID"]), page_content=row_to_text(row))
+        d.metadata = store.row(i)  # assigned after init: pydantic would copy it into a dict
+        docs.append(d)
+    return docs
+
+def doc_refs(docs: List["Document"]) -> List[Dict[str, str]]:
+    """Metadata handed to the vectorstore: just the key `bind_rows` needs."""
+    return [{"Trade ID": d.id} for d in docs]
+
+def bind_rows(vectorstore, store: TradeStore, ids: Optional[List[str]] = None) -> int:
+    """Point docstore metadata (of `ids`, or every doc) at rows of `store`;
+    returns how many were bound."""
+    docstore = vectorstore.docstore._dict
+    n = 0
+    for tid in (docstore if ids is None else ids):
+        doc, row = docstore.get(tid), store.row_of.get(str(tid))
+        if doc is not None and row is not None:
+            doc.metadata = store.row(row)
+            n += 1
+    return n
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def embeddings_name(embeddings) -> str:
+    return str(getattr(embeddings, "model", None) or getattr(embeddings, "model_name", None) or type(embeddings).__name__)
+
+def load_manifest(path_db: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(path_db, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(path_db: str, docs: List["Document"], embeddings, index_kind: str = "flat") -> None:
+    manifest = {"model": embeddings_name(embeddings), "index": index_kind,
+                "rows": {d.id: text_hash(d.page_content) for d in docs}}
+    os.makedirs(path_db, exist_ok=True)
+    tmp = os.path.join(path_db, MANIFEST_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(path_db, MANIFEST_FILE))
+
+def update_manifest(path_db: str, docs: List["Document"], embeddings) -> None:
+    """Add `docs` to an existing manifest (e.g. after appending them to the index)."""
+    manifest = load_manifest(path_db) or {"model": embeddings_name(embeddings), "rows": {}}
+    manifest["rows"].update({d.id: text_hash(d.page_content) for d in docs})
+    tmp = os.path.join(path_db, MANIFEST_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(path_db, MANIFEST_FILE))
+
+INDEX_KINDS = ("flat", "hnsw", "ivfpq", "ivfsq8")
+
+def index_spec(kind: str, dim: int, n: int) -> str:
+    """faiss.index_factory string for `kind` at this size. IVF/PQ fall back to flat
+    when there are too few vectors to train a useful quantizer."""
+    if kind not in INDEX_KINDS:
+        raise ValueError(f"unknown FAISS_INDEX {kind!r}; expected one of {INDEX_KINDS}")
+    if kind == "hnsw":
+        return f"HNSW{FAISS_HNSW_M},Flat"
+    if kind == "flat" or n < 256:
+        return "Flat"
+    nlist = FAISS_IVF_NLIST or int(4 * np.sqrt(n))
+    nlist = max(1, min(nlist, n // 39))  # faiss wants ~39 training points per centroid
+    if kind == "ivfsq8":
+        return f"IVF{nlist},SQ8"
+    m = max(d for d in range(1, min(FAISS_PQ_M, dim) + 1) if dim % d == 0)
+    nbits = int(min(8, max(4, np.log2(n // 39))))  # smaller codebooks below ~10k vectors
+    return f"IVF{nlist},PQ{m}x{nbits}"
+
+def tune_index(index, nprobe: int = FAISS_NPROBE, ef_search: int = FAISS_HNSW_EF_SEARCH):
+    """Apply search-time knobs (not all are persisted) and make IVF ids reconstructable/removable."""
+    import faiss
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+        if ivf.direct_map.type == faiss.DirectMap.NoMap:
+            ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    hnsw = getattr(index, "hnsw", None)
+    if hnsw is not None:
+        hnsw.efSearch = ef_search
+    return index
+
+def make_faiss_index(vectors: np.ndarray, kind: str = FAISS_INDEX, seed: int = 0):
+    """Empty (but trained) index for `vectors`; training uses a random sample of at
+    most FAISS_TRAIN_SAMPLE rows."""
+    import faiss
+    n, dim = vectors.shape
+    index = faiss.index_factory(dim, index_spec(kind, dim, n))
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+    if not index.is_trained:
+        sample = vectors
+        if n > FAISS_TRAIN_SAMPLE:
+            sample = vectors[np.random.default_rng(seed).choice(n, FAISS_TRAIN_SAMPLE, replace=False)]
+        index.train(np.ascontiguousarray(sample, dtype=np.float32))
+    return tune_index(index)
 
-def build_vectorstore(docs: List[Document], embeddings, path_db: str="vectordb") -> Tuple[FAISS, Any]:
-    vectorstore = FAISS.from_documents(docs, embeddings)
+def build_vectorstore(docs: List["Document"], embeddings, path_db: str="vectordb",
+                      index_kind: Optional[str] = None) -> Tuple["FAISS", Any]:
+    from langchain_community.vectorstores import FAISS
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    kind = index_kind or FAISS_INDEX
+    if kind == "flat":
+        vectorstore = FAISS.from_texts([d.page_content for d in docs], embeddings, metadatas=doc_refs(docs),
+                                       ids=[d.id for d in docs])
+    else:
+        texts = [d.page_content for d in docs]
+        vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+        vectorstore = FAISS(embeddings, make_faiss_index(vectors, kind), InMemoryDocstore(), {})
+        vectorstore.add_embeddings(list(zip(texts, vectors.tolist())), metadatas=doc_refs(docs),
+                                   ids=[d.id for d in docs])
     vectorstore.save_local(path_db)
+    save_manifest(path_db, docs, embeddings, kind)
     return vectorstore
 
 def load_vectorstore(path_db: str, embeddings):
+    from langchain_community.vectorstores import FAISS
     db = FAISS.load_local(path_db, embeddings, allow_dangerous_deserialization=True)
-    return db
\ No newline at end of file
+    tune_index(db.index)
+    return db
+
+def sync_vectorstore(docs: List["Document"], embeddings, path_db: str="vectordb",
+                     index_kind: Optional[str] = None) -> "FAISS":
+    """Load the index at `path_db` and bring it in line with `docs`, embedding only
+    rows whose `row_to_text` hash is new or changed since the manifest was written.
+    Falls back to a full build when there is no usable index/manifest, or the
+    configured index type changed."""
+    kind = index_kind or FAISS_INDEX
+    manifest = load_manifest(path_db)
+    if (manifest is None or manifest.get("model") != embeddings_name(embeddings)
+            or manifest.get("index", "flat") != kind
+            or not os.path.exists(os.path.join(path_db, "index.faiss"))):
+        return build_vectorstore(docs, embeddings, path_db, kind)
+
+    old_rows: Dict[str, str] = manifest.get("rows", {})
+    new_rows = {d.id: text_hash(d.page_content) for d in docs}
+    stale = [tid for tid, h in old_rows.items() if new_rows.get(tid) != h]
+    fresh = [d for d in docs if old_rows.get(d.id) != new_rows[d.id]]
+    if len(stale) == len(old_rows) and fresh:
+        return build_vectorstore(docs, embeddings, path_db, kind)
+
+    if stale and kind != "flat":
+        # HNSW cannot remove vectors, and IVF keeps ids sparse after removal while
+        # the langchain wrapper renumbers them; rebuild (embeddings come from the cache)
+        return build_vectorstore(docs, embeddings, path_db, kind)
+    vectorstore = load_vectorstore(path_db, embeddings)
+    if stale:
+        vectorstore.delete(ids=stale)
+    if fresh:
+        vectorstore.add_texts([d.page_content for d in fresh], metadatas=doc_refs(fresh), ids=[d.id for d in fresh])
+    if stale or fresh:
+        vectorstore.save_local(path_db)
+        save_manifest(path_db, docs, embeddings, kind)
+    return vectorstore
+
+
+# ---- Lexical (BM25) index over the exact-token fields of each trade ----
+
+LEXICAL_FIELDS = ["Trade ID", "Trader", "Asset", "Buy/Sell", "Date", "Outcome", "Tags"]
+TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9_\-]*")
+
+def lexical_tokens(meta: Dict[str, Any]) -> List[str]:
+    """IDs, assets, sides, dates (plus a YYYY-MM token), outcomes and tags, lower-cased.
+    Free-text numbers (prices, RSI, ...) are left to the dense index."""
+    toks: List[str] = []
+    for f in LEXICAL_FIELDS:
+        v = meta.get(f)
+        if v is None or (isinstance(v, float) and np.isnan(v)):
+            continue
+        toks += TOKEN_RE.findall(str(v).lower())
+    day = str(meta.get("Date", ""))
+    if len(day) >= 7:
+        toks.append(day[:7])
+    return toks
+
+def rows_fingerprint(rows: Dict[str, str]) -> str:
+    return hashlib.sha256(json.dumps(rows, sort_keys=True).encode("utf-8")).hexdigest()
+
+class LexicalIndex:
+    """BM25 over `lexical_tokens` of each document, kept as (term, doc, tf) triplets
+    compiled lazily into CSR postings. Positions are insertion order; `ids` maps
+    them back to Trade IDs. Saved as `lexical.npz` next to the FAISS index."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1, self.b = k1, b
+        self.ids: List[str] = []
+        self.vocab: Dict[str, int] = {}
+        self.fingerprint: Optional[str] = None
+        self._chunks: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        self._doc_len: List[np.ndarray] = []
+        self._csr = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, docs: List["Document"]) -> None:
+        terms, rows, tfs, lens = [], [], [], []
+        base = len(self.ids)
+        for i, d in enumerate(docs):
+            counts = Counter(lexical_tokens(d.metadata))
+            for tok, tf in counts.items():
+                terms.append(self.vocab.setdefault(tok, len(self.vocab)))
+                rows.append(base + i)
+                tfs.append(tf)
+            lens.append(sum(counts.values()))
+            self.ids.append(str(d.id))
+        self._chunks.append((np.asarray(terms, dtype=np.int64), np.asarray(rows, dtype=np.int64),
+                             np.asarray(tfs, dtype=np.float32)))
+        self._doc_len.append(np.asarray(lens, dtype=np.float32))
+        self._csr = None
+
+    def _compile(self):
+        if self._csr is None:
+            terms = np.concatenate([c[0] for c in self._chunks]) if self._chunks else np.empty(0, np.int64)
+            order = np.argsort(terms, kind="stable")
+            indptr = np.concatenate([[0], np.cumsum(np.bincount(terms, minlength=len(self.vocab)))])
+            rows = np.concatenate([c[1] for c in self._chunks])[order] if self._chunks else np.empty(0, np.int64)
+            tfs = np.concatenate([c[2] for c in self._chunks])[order] if self._chunks else np.empty(0, np.float32)
+            doc_len = np.concatenate(self._doc_len) if self._doc_len else np.empty(0, np.float32)
+            self._chunks = [(terms[order], rows, tfs)]
+            self._doc_len = [doc_len]
+            self._csr = (indptr, rows, tfs, doc_len, float(doc_len.mean()) if len(doc_len) else 1.0)
+        return self._csr
+
+    def query_terms(self, query: str) -> List[int]:
+        out = []
+        for tok in TOKEN_RE.findall(query.lower()):
+            if tok not in self.vocab and tok.endswith("s"):
+                tok = tok[:-1]  # "buys" -> "buy", "wins" -> "win"
+            if tok in self.vocab:
+                out.append(self.vocab[tok])
+        return list(dict.fromkeys(out))
+
+    def search(self, query: str, k: int = 10, allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k positions and BM25 scores; `allowed` is an optional boolean mask over positions."""
+        terms = self.query_terms(query)
+        if not terms or not self.ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        indptr, rows, tfs, doc_len, avg_len = self._compile()
+        n = len(self.ids)
+        scores = np.zeros(n, dtype=np.float32)
+        for t in terms:
+            lo, hi = indptr[t], indptr[t + 1]
+            r, tf = rows[lo:hi], tfs[lo:hi]
+            idf = np.log(1.0 + (n - (hi - lo) + 0.5) / ((hi - lo) + 0.5))
+            scores[r] += idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * doc_len[r] / avg_len))
+        if allowed is not None:
+            scores[~allowed[:n]] = 0.0
+        hit = np.flatnonzero(scores > 0)
+        if len(hit) > k:
+            hit = hit[np.argpartition(-scores[hit], k - 1)[:k]]
+        hit = hit[np.argsort(-scores[hit], kind="stable")]
+        return hit, scores[hit]
+
+    def save(self, path_db: str) -> None:
+        indptr, rows, tfs, doc_len, _ = self._compile()
+        os.makedirs(path_db, exist_ok=True)
+        terms = np.empty(len(self.vocab), dtype=object)
+        for tok, i in self.vocab.items():
+            terms[i] = tok
+        tmp = os.path.join(path_db, "lexical.tmp.npz")
+        np.savez(tmp, indptr=indptr, rows=rows, tfs=tfs, doc_len=doc_len,
+                 terms=terms.astype(str), ids=np.asarray(self.ids, dtype=str),
+                 meta=np.asarray([self.fingerprint or "", str(self.k1), str(self.b)]))
+        os.replace(tmp, os.path.join(path_db, LEXICAL_FILE))
+
+    @classmethod
+    def load(cls, path_db: str) -> Optional["LexicalIndex"]:
+        path = os.path.join(path_db, LEXICAL_FILE)
+        if not os.path.exists(path):
+            return None
+        z = np.load(path)
+        fp, k1, b = (str(x) for x in z["meta"])
+        lex = cls(float(k1), float(b))
+        lex.fingerprint = fp or None
+        lex.ids = z["ids"].tolist()
+        lex.vocab = {tok: i for i, tok in enumerate(z["terms"].tolist())}
+        indptr = z["indptr"]
+        terms = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        lex._chunks = [(terms, z["rows"], z["tfs"])]
+        lex._doc_len = [z["doc_len"]]
+        return lex
+
+def sync_lexical_index(docs: List["Document"], path_db: str = "vectordb") -> LexicalIndex:
+    """Load the persisted lexical index if it was built from the rows in the current
+    manifest (call after `sync_vectorstore`); otherwise rebuild and save it."""
+    manifest = load_manifest(path_db)
+    fp = rows_fingerprint(manifest.get("rows", {})) if manifest else None
+    lex = LexicalIndex.load(path_db)
+    if lex is not None and fp is not None and lex.fingerprint == fp:
+        return lex
+    lex = LexicalIndex()
+    lex.add(docs)
+    lex.fingerprint = fp
+    lex.save(path_db)
+    return lex
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Convert a trades CSV to Parquet or Arrow IPC")
+    ap.add_argument("csv")
+    ap.add_argument("--out", default=None, help="default: <csv>.parquet; .arrow/.feather writes Arrow IPC")
+    args = ap.parse_args()
+    print(f"wrote {convert_trades(args.csv, args.out)}")
@@ -0,0 +1,153 @@
+import os
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from .config import EMBED_BATCH_SIZE, EMBED_CONCURRENCY, EMBED_CACHE_PATH
+from .data_store import embeddings_name
+
+QUERY_MEMO_SIZE = 256
+
+
+class CachedEmbeddings(Embeddings):
+    """Embedding stage in front of a backend: documents are looked up in a SQLite
+    cache keyed by (model name, sha256(text)) and only misses are sent to the
+    backend, in batches of `batch_size` with up to `concurrency` batches in flight.
+
+    With `read_only`, the cache file is only read and new vectors are kept in
+    `unsaved` for the owner of the file to `save`; this is how a copy sent to
+    another process (e.g. a shard build worker) behaves, so one SQLite file never
+    has writers in several processes."""
+
+    def __init__(self, base: Embeddings, path: str = EMBED_CACHE_PATH,
+                 batch_size: int = EMBED_BATCH_SIZE, concurrency: int = EMBED_CONCURRENCY,
+                 read_only: bool = False):
+        self.base = base
+        self.path = path
+        self.model = embeddings_name(base)
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.read_only = read_only
+        self.unsaved: List[Tuple[str, str, bytes]] = []
+        if read_only:
+            # a missing file means an empty cache, not one to create
+            self._conn = (sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True, check_same_thread=False)
+                          if os.path.exists(path) else None)
+        else:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings ("
+                               "model TEXT NOT NULL, text_hash TEXT NOT NULL, vec BLOB NOT NULL, "
+                               "PRIMARY KEY (model, text_hash))")
+            self._conn.commit()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.backend_calls = 0
+        # recent query vectors: a turn embeds its query for the response cache,
+        # the intent kNN tier and the retriever
+        self._queries: "OrderedDict[str, List[float]]" = OrderedDict()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"base": self.base, "path": self.path, "batch_size": self.batch_size, "concurrency": self.concurrency}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(**state, read_only=True)
+
+    def _lookup(self, hashes: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        if self._conn is None:
+            return found
+        uniq = list(dict.fromkeys(hashes))
+        for i in range(0, len(uniq), 500):
+            chunk = uniq[i:i+500]
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vec FROM embeddings WHERE model = ? AND text_hash IN ({','.join('?'*len(chunk))})",
+                    [self.model, *chunk]).fetchall()
+            for h, blob in rows:
+                found[h] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [hashlib.sha256(t.encode("utf-8")).hexdigest() for t in texts]
+        cached = self._lookup(hashes)
+
+        todo: Dict[str, str] = {}
+        for h, t in zip(hashes, texts):
+            if h not in cached:
+                todo.setdefault(h, t)
+        n_miss = sum(1 for h in hashes if h not in cached)
+        with self._lock:
+            self.hits += len(texts) - n_miss
+            self.misses += n_miss
+
+        if todo:
+            todo_hashes = list(todo)
+            batches = [todo_hashes[i:i+self.batch_size] for i in range(0, len(todo_hashes), self.batch_size)]
+            with self._lock:
+                self.backend_calls += len(batches)
+            if self.concurrency > 1 and len(batches) > 1:
+                with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                    results = list(pool.map(lambda b: self._embed_batch([todo[h] for h in b]), batches))
+            else:
+                results = [self._embed_batch([todo[h] for h in b]) for b in batches]
+            rows = []
+            for batch, vecs in zip(batches, results):
+                for h, v in zip(batch, vecs):
+                    cached[h] = list(v)
+                    rows.append((self.model, h, np.asarray(v, dtype=np.float32).tobytes()))
+            if self.read_only:
+                with self._lock:
+                    self.unsaved.extend(rows)
+            else:
+                self.save(rows)
+
+        return [cached[h] for h in hashes]
+
+    def save(self, rows: List[Tuple[str, str, bytes]]) -> None:
+        """Write (model, text hash, vector bytes) rows, e.g. another copy's `unsaved`."""
+        if rows:
+            with self._lock:
+                self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+                self._conn.commit()
+
+    def _query_memo(self, text: str) -> Optional[List[float]]:
+        with self._lock:
+            vec = self._queries.get(text)
+            if vec is not None:
+                self._queries.move_to_end(text)
+            return vec
+
+    def _remember_query(self, text: str, vec: List[float]) -> List[float]:
+        with self._lock:
+            self._queries[text] = vec
+            while len(self._queries) > QUERY_MEMO_SIZE:
+                self._queries.popitem(last=False)
+        return vec
+
+    def embed_query(self, text: str) -> List[float]:
+        vec = self._query_memo(text)
+        return vec if vec is not None else self._remember_query(text, self.base.embed_query(text))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        vec = self._query_memo(text)
+        return vec if vec is not None else self._remember_query(text, await self.base.aembed_query(text))
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {"model": self.model, "hits": self.hits, "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else None,
+                "backend_calls": self.backend_calls}
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
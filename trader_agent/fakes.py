@@ -0,0 +1,111 @@
+import re
+import time
+import asyncio
+import hashlib
+from typing import Any, List, Optional, Iterator, AsyncIterator
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from .config import FAKE_EMBED_DIM, FAKE_LLM_LATENCY_S
+
+_TOKEN = re.compile(r"[a-z0-9][a-z0-9\-/.]*")
+
+
+def _bucket(token: str, dim: int):
+    h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+    return h % dim, 1.0 if (h >> 63) & 1 else -1.0
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic bag-of-tokens hashing embeddings: no model, no network, and
+    texts sharing tokens land close together, so retrieval and the nearest-
+    neighbour intent tier behave sensibly offline."""
+
+    def __init__(self, dim: int = FAKE_EMBED_DIM):
+        self.dim = dim
+        self.model = f"fake-hash-{dim}"
+
+    def _embed(self, text: str) -> List[float]:
+        v = np.zeros(self.dim, dtype=np.float32)
+        for tok in _TOKEN.findall(text.lower()):
+            i, sign = _bucket(tok, self.dim)
+            v[i] += sign
+        n = float(np.linalg.norm(v))
+        return (v / n if n else v).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def _approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class FakeChatModel(BaseChatModel):
+    """Stub chat model with configurable latency.
+
+    Intent-classifier prompts get a canned JSON intent (from the keyword rules);
+    everything else gets a short deterministic reply. Usage metadata is filled
+    with a chars/4 token estimate."""
+
+    latency_s: float = FAKE_LLM_LATENCY_S
+    reply: str = "Based on the retrieved trades, the setup combined RSI, volume and sentiment signals."
+    model_name: str = "fake-chat"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _respond(self, messages: List[BaseMessage]) -> AIMessage:
+        from .intent import keyword_intent
+        system = " ".join(str(m.content) for m in messages if m.type == "system")
+        human = " ".join(str(m.content) for m in messages if m.type == "human")
+        if "intent classifier" in system:
+            text = '{"intent": "%s"}' % (keyword_intent(human) or "generic")
+        else:
+            text = self.reply
+        prompt_tokens = sum(_approx_tokens(str(m.content)) for m in messages)
+        completion_tokens = _approx_tokens(text)
+        return AIMessage(content=text, usage_metadata={"input_tokens": prompt_tokens,
+                                                        "output_tokens": completion_tokens,
+                                                        "total_tokens": prompt_tokens + completion_tokens})
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    def _chunks(self, messages: List[BaseMessage]) -> List[AIMessageChunk]:
+        msg = self._respond(messages)
+        words = re.findall(r"\S+\s*", str(msg.content)) or [""]
+        chunks = [AIMessageChunk(content=w) for w in words]
+        chunks[-1] = AIMessageChunk(content=words[-1], usage_metadata=msg.usage_metadata)
+        return chunks
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        for c in self._chunks(messages):
+            yield ChatGenerationChunk(message=c)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        for c in self._chunks(messages):
+            yield ChatGenerationChunk(message=c)
@@ -0,0 +1,134 @@
+import io
+import os
+import time
+import threading
+from typing import Dict, Any, List, Optional, Union, Iterator
+
+import pandas as pd
+
+from .config import INGEST_POLL_S, INGEST_SAVE_EVERY_S
+from .data_store import (build_docs, doc_refs, bind_rows, update_manifest, load_manifest, rows_fingerprint,
+                         append_trades, trades_format)
+
+
+class TradeIngestor:
+    """Folds new trades into live assets (from `load_assets`) without a reboot.
+
+    Only the new rows are parsed, embedded and added to the vectorstore; the trade
+    store, retriever mapping, persona counters and lesson cube are extended in
+    place, and `assets["persona"]` is swapped for the updated persona. Trade IDs
+    already loaded are skipped, so re-delivered rows are harmless.
+
+    Rows ingested here only live in memory and the index; pass `csv_path` (the
+    trades file the assets were loaded from) to also write them there so the next
+    boot's sync keeps them. A CSV is appended to right away; a Parquet/Arrow file
+    is rewritten with the index, on save."""
+
+    def __init__(self, assets: Dict[str, Any], path_db: Optional[str] = None, csv_path: Optional[str] = None,
+                 autosave: bool = True):
+        self.assets = assets
+        self.path_db = path_db or assets.get("path_db", "vectordb")
+        self.csv_path = csv_path
+        self.autosave = autosave
+        self.ingested = 0
+        self._pending: List[Any] = []  # docs added to the index but not yet saved
+        self._unwritten: List[pd.DataFrame] = []  # rows not yet in a Parquet/Arrow trades file
+        self._lock = threading.Lock()
+
+    def ingest(self, trades: Union[pd.DataFrame, List[Dict[str, Any]]], persist: bool = True) -> int:
+        """Add trades not seen before; returns how many were added. With `persist`
+        off they are not written to `csv_path`."""
+        df = trades if isinstance(trades, pd.DataFrame) else pd.DataFrame(list(trades))
+        if df.empty:
+            return 0
+        with self._lock:
+            store = self.assets["store"]
+            ids = df["Trade ID"].astype(str)
+            df = df[~ids.isin(store.row_of.keys()) & ~ids.duplicated()]
+            if df.empty:
+                return 0
+
+            new = store.append(df)
+            docs = build_docs(store, range(len(store) - len(new), len(store)))
+            vectorstore = self.assets["vectorstore"]
+            first_fid = vectorstore.index.ntotal
+            ids = [d.id for d in docs]
+            vectorstore.add_texts([d.page_content for d in docs], metadatas=doc_refs(docs), ids=ids)
+            bind_rows(vectorstore, store, ids)
+            lexical = self.assets.get("lexical")
+            first_lex = None
+            if lexical is not None:
+                first_lex = len(lexical)
+                lexical.add(docs)
+            self.assets["retriever"].extend(first_fid, first_lex)
+
+            self.assets["lessons_cube"].add(new)
+            self.assets["persona_stats"].add(new)
+            self.assets["persona"] = self.assets["persona_stats"].persona()
+            self.assets["df"] = store.df
+
+            if persist and self.csv_path and trades_format(self.csv_path) == "csv":
+                append_trades(self.csv_path, df)
+            elif persist and self.csv_path:
+                self._unwritten.append(df)
+            self._pending.extend(docs)
+            self.ingested += len(new)
+            if self.autosave:
+                self._save()
+            return len(new)
+
+    def save(self) -> None:
+        """Write the index and manifest if anything was added since the last save."""
+        with self._lock:
+            self._save()
+
+    def _save(self) -> None:
+        if self._unwritten:
+            append_trades(self.csv_path, pd.concat(self._unwritten, ignore_index=True))
+            self._unwritten = []
+        if not self._pending:
+            return
+        self.assets["vectorstore"].save_local(self.path_db)
+        update_manifest(self.path_db, self._pending, self.assets["embeddings"])
+        lexical = self.assets.get("lexical")
+        if lexical is not None:
+            lexical.fingerprint = rows_fingerprint(load_manifest(self.path_db)["rows"])
+            lexical.save(self.path_db)
+        self._pending = []
+
+    def follow(self, path: str, poll_s: float = INGEST_POLL_S, from_start: bool = False,
+               stop: Optional[threading.Event] = None, save_every_s: float = INGEST_SAVE_EVERY_S) -> Iterator[int]:
+        """Tail an append-only trades CSV, ingesting complete lines as they appear;
+        yields the number of trades added per batch. Starts at the current end of
+        the file unless `from_start`. Index saves are batched every `save_every_s`."""
+        autosave, self.autosave = self.autosave, False
+        # tailing the trades file itself: its rows are already there, don't write them again
+        persist = not (self.csv_path and os.path.exists(self.csv_path) and os.path.samefile(path, self.csv_path))
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            header = f.readline()
+            if not from_start:
+                f.seek(0, os.SEEK_END)
+            buf = ""
+            last_save = time.monotonic()
+            try:
+                while stop is None or not stop.is_set():
+                    chunk = f.read()
+                    if chunk:
+                        buf += chunk
+                        complete, _, buf = buf.rpartition("\n")
+                        if complete.strip():
+                            added = self.ingest(pd.read_csv(io.StringIO(header + complete + "\n")), persist=persist)
+                            if added:
+                                yield added
+                    elif os.path.getsize(path) < f.tell():  # truncated/rotated: start over, IDs dedupe
+                        f.seek(0)
+                        f.readline()
+                        buf = ""
+                    if time.monotonic() - last_save >= save_every_s:
+                        self.save()
+                        last_save = time.monotonic()
+                    if not chunk:
+                        time.sleep(poll_s)
+            finally:
+                self.autosave = autosave
+                self.save()
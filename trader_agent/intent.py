@@ -1,49 +1,286 @@
 import json, re
-from typing import Optional, Dict
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, List
+import numpy as np
 from pydantic import BaseModel
 from typing import Literal
-from langchain_core.prompts import ChatPromptTemplate
+from functools import lru_cache
+from .config import INTENT_KNN_THRESHOLD, INTENT_KEYWORD_MARGIN, INTENT_CACHE_SIZE
 
 class IntentResult(BaseModel):
     intent: Literal["persona","why_trade","list","best","reflect","generic"]
     filters: Optional[Dict[str, str]] = None
 
 
-def classify_intent(llm, query: str) -> IntentResult:
-
-    INTENT_FEW_SHOTS = [
-        {"user": "What trades do you prefer and why?", "intent": "persona"},
-        {"user": "Why did you buy DOGE on 2024-10-09?", "intent": "why_trade"},
-        {"user": "Show recent BTC buys", "intent": "list"},
-        {"user": "Which were your most profitable ETH trades?", "intent": "best"},
-        {"user": "What lessons did you learn last month? What worked and what failed?", "intent": "reflect"},
-    ]
-    FEW_SHOTS_TEXT = "\\n".join([f"User: {x['user']}\\nIntent: {x['intent']}" for x in INTENT_FEW_SHOTS])
+INTENT_FEW_SHOTS = [
+    {"user": "What trades do you prefer and why?", "intent": "persona"},
+    {"user": "Why did you buy DOGE on 2024-10-09?", "intent": "why_trade"},
+    {"user": "Show recent BTC buys", "intent": "list"},
+    {"user": "Which were your most profitable ETH trades?", "intent": "best"},
+    {"user": "What lessons did you learn last month? What worked and what failed?", "intent": "reflect"},
+]
+FEW_SHOTS_TEXT = "\\n".join([f"User: {x['user']}\\nIntent: {x['intent']}" for x in INTENT_FEW_SHOTS])
 
-    intent_prompt = ChatPromptTemplate.from_messages([
+@lru_cache(maxsize=None)
+def intent_prompt():
+    from langchain_core.prompts import ChatPromptTemplate
+    return ChatPromptTemplate.from_messages([
         ("system",
         "You are an intent classifier for a trader assistant. "
         "Return ONLY a compact JSON object with keys 'intent' and optional 'filters'. "
         "Valid intents: persona, why_trade, list, best, reflect, generic.\\n\\n"
         "Examples:\\n{few_shots}"),
         ("human", "{query}")
-    ])
+    ]).partial(few_shots=FEW_SHOTS_TEXT)
+
+
+def __getattr__(name: str):
+    # INTENT_PROMPT is built on first access so importing the module skips langchain
+    if name == "INTENT_PROMPT":
+        return intent_prompt()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Labelled queries for the local nearest-neighbour tier
+LABELLED_QUERIES = INTENT_FEW_SHOTS + [
+    {"user": "What's your trading style?", "intent": "persona"},
+    {"user": "How would you describe yourself as a trader?", "intent": "persona"},
+    {"user": "Which assets do you like to trade?", "intent": "persona"},
+    {"user": "How risky is your approach?", "intent": "persona"},
+    {"user": "Why did you sell SOL in March?", "intent": "why_trade"},
+    {"user": "What was the reasoning behind trade T042?", "intent": "why_trade"},
+    {"user": "Explain your ETH buy last week", "intent": "why_trade"},
+    {"user": "List my SOL sells", "intent": "list"},
+    {"user": "Show me all DOGE trades in 2024", "intent": "list"},
+    {"user": "What trades did you make last month?", "intent": "list"},
+    {"user": "What were your biggest wins?", "intent": "best"},
+    {"user": "Top performing BTC trades", "intent": "best"},
+    {"user": "Which setups paid off the most?", "intent": "best"},
+    {"user": "What patterns did you notice in your losses?", "intent": "reflect"},
+    {"user": "Give me insights from the last 30 days", "intent": "reflect"},
+    {"user": "Reflect on your trading in March 2025", "intent": "reflect"},
+    {"user": "Hello, how are you?", "intent": "generic"},
+    {"user": "What is a stop-loss?", "intent": "generic"},
+    {"user": "Can you help me?", "intent": "generic"},
+]
+
+# (intent, {keyword regex: weight}), in priority order. Keywords match whole words
+# only ("list" is not in "realistic"); weight 2 marks a cue that settles the intent
+# on its own, weight 1 a word that also shows up in other kinds of question.
+KEYWORD_RULES = [
+    ("reflect",   {r"lessons?": 2, r"learn(?:ed|t|ing)?": 2, r"insights?": 2, r"reflect(?:s|ing|ion)?": 2,
+                   r"worked": 1, r"failed": 1, r"patterns?": 1}),
+    ("why_trade", {r"why did": 2, r"reason(?:s|ing)?": 2, r"explain(?:s|ed)?": 1}),
+    ("persona",   {r"prefer(?:s|red|ence)?": 2, r"style": 2, r"persona": 2}),
+    ("list",      {r"list": 2, r"show": 1, r"recent(?:ly)?": 1}),
+    ("best",      {r"profitable": 2, r"wins": 2, r"best": 1}),
+]
+_KEYWORD_RES = [(intent, [(re.compile(rf"\b{w}\b"), weight) for w, weight in words.items()])
+                for intent, words in KEYWORD_RULES]
+
+
+def keyword_scores(query: str) -> Dict[str, float]:
+    """Summed weights of the keywords each intent matched (intents with none are left out)."""
+    ql = query.lower()
+    scores = {}
+    for intent, patterns in _KEYWORD_RES:
+        score = sum(weight for rx, weight in patterns if rx.search(ql))
+        if score:
+            scores[intent] = score
+    return scores
+
 
-    msgs = intent_prompt.format_messages(query=query, few_shots=FEW_SHOTS_TEXT)
-    raw = llm.invoke(msgs).content.strip().strip("`")
+def keyword_intent(query: str) -> Optional[str]:
+    """First matching keyword rule, in priority order."""
+    return next(iter(keyword_scores(query)), None)
+
+
+def parse_intent(raw: str, query: str) -> IntentResult:
+    raw = raw.strip().strip("`")
     try:
         data = json.loads(raw)
         return IntentResult(**data)
     except Exception:
-        ql = query.lower()
-        if any(w in ql for w in ["lesson","learn","worked","failed","pattern","insight","reflect"]):
-            return IntentResult(intent="reflect")
-        if any(w in ql for w in ["why did","reason","explain"]):
-            return IntentResult(intent="why_trade")
-        if any(w in ql for w in ["prefer","style","persona"]):
-            return IntentResult(intent="persona")
-        if any(w in ql for w in ["show","list","recent"]):
-            return IntentResult(intent="list")
-        if any(w in ql for w in ["best","profitable","wins"]):
-            return IntentResult(intent="best")
-        return IntentResult(intent="generic")
\ No newline at end of file
+        return IntentResult(intent=keyword_intent(query) or "generic")
+
+
+def classify_intent(llm, query: str) -> IntentResult:
+    msgs = intent_prompt().format_messages(query=query)
+    return parse_intent(llm.invoke(msgs).content, query)
+
+
+async def aclassify_intent(llm, query: str) -> IntentResult:
+    msgs = intent_prompt().format_messages(query=query)
+    return parse_intent((await llm.ainvoke(msgs)).content, query)
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query.lower()).strip(" ?!.")
+
+
+class IntentClassifier:
+    """Cascade in front of `classify_intent`.
+
+    1. keyword rules, accepted when the top intent's score leads every other
+       intent's by at least `keyword_margin` (a lone ambiguous word is not enough);
+    2. nearest neighbours over embedded LABELLED_QUERIES, accepted above `threshold`;
+    3. the LLM classifier for everything else.
+    Results are memoized per normalized query."""
+
+    def __init__(self, llm, embeddings=None, threshold: float = INTENT_KNN_THRESHOLD,
+                 k: int = 3, cache_size: int = INTENT_CACHE_SIZE,
+                 examples: Optional[List[Dict[str, str]]] = None,
+                 keyword_margin: float = INTENT_KEYWORD_MARGIN):
+        self.llm = llm
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.keyword_margin = keyword_margin
+        self.k = k
+        self.cache_size = cache_size
+        self.examples = examples or LABELLED_QUERIES
+        self._example_vecs: Optional[np.ndarray] = None
+        self._cache: "OrderedDict[str, IntentResult]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counts = {"cache": 0, "keyword": 0, "knn": 0, "llm": 0}
+        self.llm_seconds = 0.0
+        self.local_seconds = 0.0
+
+    def _keyword_tier(self, query: str) -> Optional[IntentResult]:
+        scores = keyword_scores(query)
+        if not scores:
+            return None
+        ranked = sorted(scores.values(), reverse=True)
+        lead = ranked[0] - (ranked[1] if len(ranked) > 1 else 0.0)
+        if lead < self.keyword_margin:
+            return None
+        return IntentResult(intent=max(scores, key=scores.get))
+
+    def _example_matrix(self, vecs) -> np.ndarray:
+        vecs = np.asarray(vecs, dtype=np.float32)
+        return vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+
+    def _knn_vote(self, qvec) -> Optional[IntentResult]:
+        q = np.asarray(qvec, dtype=np.float32)
+        sims = self._example_vecs @ (q / max(float(np.linalg.norm(q)), 1e-12))
+        top = np.argsort(-sims)[:self.k]
+        votes: Dict[str, float] = {}
+        for i in top:
+            votes[self.examples[i]["intent"]] = votes.get(self.examples[i]["intent"], 0.0) + float(sims[i])
+        intent = max(votes.items(), key=lambda kv: kv[1])[0]
+        # confident = nearest example is close enough and agrees with the neighbourhood vote
+        if sims[top[0]] >= self.threshold and self.examples[top[0]]["intent"] == intent:
+            return IntentResult(intent=intent)
+        return None
+
+    def _knn_tier(self, query: str, qvec=None) -> Optional[IntentResult]:
+        if self.embeddings is None:
+            return None
+        if self._example_vecs is None:
+            self._example_vecs = self._example_matrix(self.embeddings.embed_documents([x["user"] for x in self.examples]))
+        return self._knn_vote(self.embeddings.embed_query(query) if qvec is None else qvec)
+
+    async def _aknn_tier(self, query: str) -> Optional[IntentResult]:
+        if self.embeddings is None:
+            return None
+        if self._example_vecs is None:
+            self._example_vecs = self._example_matrix(await self.embeddings.aembed_documents([x["user"] for x in self.examples]))
+        return self._knn_vote(await self.embeddings.aembed_query(query))
+
+    def _cached(self, key: str) -> Optional[IntentResult]:
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.counts["cache"] += 1
+                return self._cache[key]
+        return None
+
+    def _record(self, key: str, tier: str, result: IntentResult, local_s: float, llm_s: float = 0.0) -> IntentResult:
+        with self._lock:
+            self.counts[tier] += 1
+            self.local_seconds += local_s
+            self.llm_seconds += llm_s
+            self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def classify(self, query: str) -> IntentResult:
+        key = normalize_query(query)
+        hit = self._cached(key)
+        if hit is not None:
+            return hit
+        t0 = time.perf_counter()
+        result = self._keyword_tier(query)
+        if result is not None:
+            return self._record(key, "keyword", result, time.perf_counter() - t0)
+        result = self._knn_tier(query)
+        if result is not None:
+            return self._record(key, "knn", result, time.perf_counter() - t0)
+        t1 = time.perf_counter()
+        result = classify_intent(self.llm, query)
+        return self._record(key, "llm", result, t1 - t0, time.perf_counter() - t1)
+
+    async def aclassify(self, query: str) -> IntentResult:
+        key = normalize_query(query)
+        hit = self._cached(key)
+        if hit is not None:
+            return hit
+        t0 = time.perf_counter()
+        result = self._keyword_tier(query)
+        if result is not None:
+            return self._record(key, "keyword", result, time.perf_counter() - t0)
+        result = await self._aknn_tier(query)
+        if result is not None:
+            return self._record(key, "knn", result, time.perf_counter() - t0)
+        t1 = time.perf_counter()
+        result = await aclassify_intent(self.llm, query)
+        return self._record(key, "llm", result, t1 - t0, time.perf_counter() - t1)
+
+    def classify_batch(self, queries: List[str], qvecs=None, max_concurrency: int = 8) -> List[IntentResult]:
+        """`classify` for many queries: the kNN tier uses `qvecs` (one embedding per
+        query) when given, and everything that escalates goes to the LLM through
+        its batch interface, once per distinct normalized query."""
+        keys = [normalize_query(q) for q in queries]
+        results: Dict[str, IntentResult] = {}
+        pending: Dict[str, str] = {}
+        for i, (q, key) in enumerate(zip(queries, keys)):
+            if key in results or key in pending:
+                continue
+            hit = self._cached(key)
+            if hit is not None:
+                results[key] = hit
+                continue
+            t0 = time.perf_counter()
+            result = self._keyword_tier(q)
+            if result is not None:
+                results[key] = self._record(key, "keyword", result, time.perf_counter() - t0)
+                continue
+            result = self._knn_tier(q, None if qvecs is None else qvecs[i])
+            if result is not None:
+                results[key] = self._record(key, "knn", result, time.perf_counter() - t0)
+                continue
+            pending[key] = q
+        if pending:
+            t1 = time.perf_counter()
+            msgs = [intent_prompt().format_messages(query=q) for q in pending.values()]
+            outs = self.llm.batch(msgs, config={"max_concurrency": max_concurrency}, return_exceptions=True)
+            llm_s = (time.perf_counter() - t1) / len(pending)
+            for (key, q), out in zip(pending.items(), outs):
+                result = parse_intent(out.content if not isinstance(out, Exception) else "", q)
+                results[key] = self._record(key, "llm", result, 0.0, llm_s)
+        return [results[key] for key in keys]
+
+    def stats(self) -> Dict[str, float]:
+        """Tier counts, escalation rate and estimated LLM latency avoided."""
+        with self._lock:
+            total = sum(self.counts.values())
+            llm_n = self.counts["llm"]
+            avg_llm = self.llm_seconds / llm_n if llm_n else None
+            local_n = total - llm_n
+            return {**self.counts,
+                    "total": total,
+                    "escalation_rate": llm_n / total if total else None,
+                    "avg_llm_seconds": avg_llm,
+                    "local_seconds": self.local_seconds,
+                    "est_seconds_saved": (avg_llm * local_n - self.local_seconds) if avg_llm is not None else None}
@@ -1,54 +1,230 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Union, List
 from datetime import date
 import numpy as np
 import pandas as pd
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
 import json
+from functools import lru_cache
+from .trade_store import TradeStore, as_store
+from .summary_cache import SummaryCache, stats_fingerprint, llm_name
 
-def compute_lessons(trades: pd.DataFrame, start: Optional[date]=None, end: Optional[date]=None) -> Dict[str, Any]:
-    tdf = trades.copy()
-    tdf["Date"] = pd.to_datetime(tdf["Date"]).dt.date
-    if start: tdf = tdf[tdf["Date"] >= start]
-    if end:   tdf = tdf[tdf["Date"] <= end]
-    if len(tdf)==0:
-        return {"window": {"start": start.isoformat() if start else None,
-                           "end":   end.isoformat() if end else None},
-                "assets": {}, "tags": {}, "summary": "No data in window."}
-
-    asset_win = (tdf.groupby("Asset")["Outcome"].apply(lambda s: (s=="Profit").mean())
-                 .sort_values(ascending=False)).to_dict()
-
-    tag_stats = {}
-    for _, row in tdf.iterrows():
-        outs = row["Outcome"]
-        for t in [x.strip() for x in str(row["Tags"]).split(",") if x.strip()]:
-            st = tag_stats.setdefault(t, {"n":0, "wins":0})
-            st["n"] += 1; st["wins"] += int(outs == "Profit")
-    for t, st in tag_stats.items():
-        st["win_rate"] = st["wins"]/max(1,st["n"])
+def compute_lessons(trades: Union[TradeStore, pd.DataFrame], start: Optional[date]=None, end: Optional[date]=None) -> Dict[str, Any]:
+    store = as_store(trades)
+    idx = np.sort(store.window(start, end))
+    window = {"start": start.isoformat() if start else None,
+              "end":   end.isoformat() if end else None}
+    if len(idx)==0:
+        return {"window": window, "assets": {}, "tags": {}, "summary": "No data in window."}
+
+    wins = store.is_win[idx]
+    codes = store.asset.codes.to_numpy()[idx]
+    n_cat = len(store.asset.categories)
+    valid = codes >= 0
+    a_n = np.bincount(codes[valid], minlength=n_cat)
+    a_w = np.bincount(codes[valid], weights=wins[valid], minlength=n_cat)
+    present = np.flatnonzero(a_n)
+    rates = a_w[present] / a_n[present]
+    order = np.argsort(-rates, kind="stable")
+    asset_win = {store.asset.categories[present[i]]: float(rates[i]) for i in order}
+
+    sub = store.tag_matrix[idx]
+    t_n = sub.sum(axis=0)
+    t_w = sub[wins].sum(axis=0)
+    seen = np.flatnonzero(t_n)
+    seen = seen[np.argsort(sub[:, seen].argmax(axis=0), kind="stable")]
+    tag_stats = {store.tag_vocab[j]: {"n": int(t_n[j]), "wins": int(t_w[j]), "win_rate": int(t_w[j])/max(1, int(t_n[j]))}
+                 for j in seen}
+
+    def win_mean(col: str) -> Optional[float]:
+        return float(pd.Series(store.num[col][idx][wins]).mean()) if wins.any() else None
 
     feat_avg = {
-        "RSI_win": float(tdf[tdf["Outcome"]=="Profit"]["RSI"].mean()) if (tdf["Outcome"]=="Profit").any() else None,
-        "VolChg_win": float(tdf[tdf["Outcome"]=="Profit"]["Volume_Change_Pct"].mean()) if (tdf["Outcome"]=="Profit").any() else None,
-        "Sent_win": float(tdf[tdf["Outcome"]=="Profit"]["Sentiment_Score"].mean()) if (tdf["Outcome"]=="Profit").any() else None,
+        "RSI_win": win_mean("RSI"),
+        "VolChg_win": win_mean("Volume_Change_Pct"),
+        "Sent_win": win_mean("Sentiment_Score"),
     }
-    return {"window": {"start": start.isoformat() if start else None,
-                       "end":   end.isoformat() if end else None},
-            "assets": asset_win, "tags": tag_stats, "features": feat_avg}
+    return {"window": window, "assets": asset_win, "tags": tag_stats, "features": feat_avg}
+
+
+FEATURES = [("RSI_win", "RSI"), ("VolChg_win", "Volume_Change_Pct"), ("Sent_win", "Sentiment_Score")]
+
+
+class LessonCube:
+    """Per-day trade/win counts by asset and tag plus winner feature sums, kept as
+    prefix sums so `stats(start, end)` is a pair of row subtractions. Returns the
+    same dict as `compute_lessons`; `add` folds in new trades without a rescan."""
+
+    def __init__(self, trades: Union[TradeStore, pd.DataFrame, None] = None):
+        self.days = np.empty(0, dtype="datetime64[D]")
+        self.assets: list = []
+        self.tags: list = []
+        self._daily = {"trades": np.zeros((0, 1)), "wins": np.zeros((0, 1)),
+                       "a_n": np.zeros((0, 0)), "a_w": np.zeros((0, 0)),
+                       "t_n": np.zeros((0, 0)), "t_w": np.zeros((0, 0)),
+                       "f_sum": np.zeros((0, len(FEATURES))), "f_cnt": np.zeros((0, len(FEATURES)))}
+        self._prefix: Dict[str, np.ndarray] = {}
+        if trades is not None:
+            self.add(trades)
+        else:
+            self._rebuild_prefix()
+
+    @staticmethod
+    def _col_index(names: list, new_names) -> np.ndarray:
+        pos = {n: i for i, n in enumerate(names)}
+        out = []
+        for n in new_names:
+            if n not in pos:
+                pos[n] = len(names); names.append(n)
+            out.append(pos[n])
+        return np.asarray(out, dtype=np.int64)
+
+    def add(self, trades: Union[TradeStore, pd.DataFrame]) -> None:
+        new = as_store(trades)
+        if len(new) == 0:
+            return
+        all_days = np.union1d(self.days, new.dates)
+        old_pos = np.searchsorted(all_days, self.days)
+        day = np.searchsorted(all_days, new.dates)
+
+        a_map = self._col_index(self.assets, [str(c) for c in new.asset.categories])
+        t_map = self._col_index(self.tags, new.tag_vocab)
+        widths = {"trades": 1, "wins": 1, "a_n": len(self.assets), "a_w": len(self.assets),
+                  "t_n": len(self.tags), "t_w": len(self.tags), "f_sum": len(FEATURES), "f_cnt": len(FEATURES)}
+        for key, width in widths.items():
+            grown = np.zeros((len(all_days), width))
+            old = self._daily[key]
+            grown[np.ix_(old_pos, np.arange(old.shape[1]))] = old
+            self._daily[key] = grown
+
+        wins = new.is_win.astype(np.float64)
+        d = self._daily
+        np.add.at(d["trades"][:, 0], day, 1.0)
+        np.add.at(d["wins"][:, 0], day, wins)
+        codes = new.asset.codes.to_numpy()
+        ok = codes >= 0
+        np.add.at(d["a_n"], (day[ok], a_map[codes[ok]]), 1.0)
+        np.add.at(d["a_w"], (day[ok], a_map[codes[ok]]), wins[ok])
+        rows, cols = np.nonzero(new.tag_matrix)
+        np.add.at(d["t_n"], (day[rows], t_map[cols]), 1.0)
+        np.add.at(d["t_w"], (day[rows], t_map[cols]), wins[rows])
+        for j, (_, col) in enumerate(FEATURES):
+            v = new.num[col]
+            w = new.is_win & ~np.isnan(v)
+            np.add.at(d["f_sum"][:, j], day[w], v[w])
+            np.add.at(d["f_cnt"][:, j], day[w], 1.0)
+
+        self.days = all_days
+        self._rebuild_prefix()
+
+    def _rebuild_prefix(self) -> None:
+        self._prefix = {k: np.vstack([np.zeros((1, v.shape[1])), np.cumsum(v, axis=0)])
+                        for k, v in self._daily.items()}
+
+    def stats(self, start: Optional[date]=None, end: Optional[date]=None) -> Dict[str, Any]:
+        lo = np.searchsorted(self.days, np.datetime64(start, "D"), "left") if start else 0
+        hi = np.searchsorted(self.days, np.datetime64(end, "D"), "right") if end else len(self.days)
+        hi = max(lo, hi)
+        P = self._prefix
+        window = {"start": start.isoformat() if start else None,
+                  "end":   end.isoformat() if end else None}
+        if P["trades"][hi, 0] - P["trades"][lo, 0] == 0:
+            return {"window": window, "assets": {}, "tags": {}, "summary": "No data in window."}
+
+        a_n = P["a_n"][hi] - P["a_n"][lo]
+        a_w = P["a_w"][hi] - P["a_w"][lo]
+        names = np.asarray(self.assets, dtype=object)
+        present = np.flatnonzero(a_n)
+        present = present[np.argsort(names[present], kind="stable")]
+        rates = a_w[present] / a_n[present]
+        asset_win = {names[present[i]]: float(rates[i]) for i in np.argsort(-rates, kind="stable")}
+
+        t_n = np.rint(P["t_n"][hi] - P["t_n"][lo]).astype(np.int64)
+        t_w = np.rint(P["t_w"][hi] - P["t_w"][lo]).astype(np.int64)
+        tag_stats = {self.tags[j]: {"n": int(t_n[j]), "wins": int(t_w[j]), "win_rate": int(t_w[j])/max(1, int(t_n[j]))}
+                     for j in np.flatnonzero(t_n)}
+
+        any_win = P["wins"][hi, 0] - P["wins"][lo, 0] > 0
+        f_sum = P["f_sum"][hi] - P["f_sum"][lo]
+        f_cnt = P["f_cnt"][hi] - P["f_cnt"][lo]
+        feat_avg = {name: (float(f_sum[j] / f_cnt[j]) if f_cnt[j] else float("nan")) if any_win else None
+                    for j, (name, _) in enumerate(FEATURES)}
+        return {"window": window, "assets": asset_win, "tags": tag_stats, "features": feat_avg}
+
+
+@lru_cache(maxsize=None)
+def lessons_prompt():
+    from langchain_core.prompts import ChatPromptTemplate
+    return ChatPromptTemplate.from_messages([
+        ("system",
+         "You are an experienced trading coach. Based on structured stats, write a concise reflection for the agent:\n"
+         "- 6–10 bullet points with what worked, what failed, and risk notes.\n"
+         "- Reference assets/tags and thresholds (e.g., RSI>55, ΔVol>20%).\n"
+         "- Keep it historical and educational; no forward-looking advice.\n"
+         "Persona (for tone/bias): {persona}"),
+        ("human", "Stats JSON:\n{stats_json}")
+    ])
+
+
+def __getattr__(name: str):
+    # LESSONS_PROMPT is built on first access so importing the module skips langchain
+    if name == "LESSONS_PROMPT":
+        return lessons_prompt()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def lessons_chain(llm):
+    from langchain_core.output_parsers import StrOutputParser
+    return lessons_prompt() | llm | StrOutputParser()
+
+
+def _lessons_inputs(persona, stats: Dict[str, Any]) -> Dict[str, str]:
+    return {"persona": json.dumps(persona), "stats_json": json.dumps(stats, ensure_ascii=False, default=str)}
+
+
+def summarize_lessons(llm, persona, stats: Dict[str, Any], cache: Optional[SummaryCache]=None) -> str:
+    key = stats_fingerprint(stats, persona, llm_name(llm)) if cache is not None else None
+    if key is not None:
+        hit = cache.get(key)
+        if hit is not None:
+            return hit
+    summary = lessons_chain(llm).invoke(_lessons_inputs(persona, stats))
+    if key is not None:
+        cache.put(key, summary)
+    return summary
 
 
-def summarize_lessons(llm, persona, stats: Dict[str, Any]) -> str:
+def summarize_lessons_batch(llm, persona, stats_list: List[Dict[str, Any]], cache: Optional[SummaryCache]=None,
+                            max_concurrency: int = 8) -> List[str]:
+    """`summarize_lessons` for many windows; identical stats are summarized once
+    and cache misses go through the model's batch interface."""
+    model = llm_name(llm)
+    keys = [stats_fingerprint(s, persona, model) for s in stats_list]
+    out: Dict[str, str] = {}
+    todo: Dict[str, Dict[str, Any]] = {}
+    for key, stats in zip(keys, stats_list):
+        if key in out or key in todo:
+            continue
+        hit = cache.get(key) if cache is not None else None
+        if hit is not None:
+            out[key] = hit
+        else:
+            todo[key] = stats
+    if todo:
+        summaries = lessons_chain(llm).batch([_lessons_inputs(persona, s) for s in todo.values()],
+                                             config={"max_concurrency": max_concurrency})
+        for key, summary in zip(todo, summaries):
+            out[key] = summary
+            if cache is not None:
+                cache.put(key, summary)
+    return [out[key] for key in keys]
 
-    lessons_prompt = ChatPromptTemplate.from_messages([
-    ("system",
-     "You are an experienced trading coach. Based on structured stats, write a concise reflection for the agent:\n"
-     "- 6–10 bullet points with what worked, what failed, and risk notes.\n"
-     "- Reference assets/tags and thresholds (e.g., RSI>55, ΔVol>20%).\n"
-     "- Keep it historical and educational; no forward-looking advice.\n"
-     "Persona (for tone/bias): {persona}"),
-    ("human", "Stats JSON:\n{stats_json}")
-])
-    lessons_chain = lessons_prompt | llm | StrOutputParser()
 
-    return lessons_chain.invoke({"persona": json.dumps(persona), "stats_json": json.dumps(stats, ensure_ascii=False, default=str)})
+async def asummarize_lessons(llm, persona, stats: Dict[str, Any], cache: Optional[SummaryCache]=None) -> str:
+    key = stats_fingerprint(stats, persona, llm_name(llm)) if cache is not None else None
+    if key is not None:
+        hit = cache.get(key)
+        if hit is not None:
+            return hit
+    summary = await lessons_chain(llm).ainvoke(_lessons_inputs(persona, stats))
+    if key is not None:
+        cache.put(key, summary)
+    return summary
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+from collections import deque
+from typing import Any, Optional, Iterator, AsyncIterator
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+
+class _Slots:
+    """`n` slots shared by threads and event loops, handed to waiters first come
+    first served. A released slot goes straight to the oldest waiter: a thread's
+    Event is set, or an async waiter's future is resolved on its own loop."""
+
+    def __init__(self, n: int):
+        self.free = n
+        self._waiters: deque = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            if self.free and not self._waiters:
+                self.free -= 1
+                return
+            ready = threading.Event()
+            self._waiters.append(ready)
+        ready.wait()
+
+    async def aacquire(self) -> None:
+        with self._lock:
+            if self.free and not self._waiters:
+                self.free -= 1
+                return
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append(fut)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            with self._lock:
+                queued = fut in self._waiters
+                if queued:
+                    self._waiters.remove(fut)
+            if not queued and fut.done() and not fut.cancelled():
+                self.release()  # handed a slot, then cancelled before using it
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            if not self._waiters:
+                self.free += 1
+                return
+            waiter = self._waiters.popleft()
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+        else:
+            waiter.get_loop().call_soon_threadsafe(self._hand_over, waiter)
+
+    def _hand_over(self, fut: "asyncio.Future") -> None:
+        if fut.cancelled():  # its task was cancelled meanwhile: pass the slot on
+            self.release()
+        else:
+            fut.set_result(None)
+
+
+class ConcurrencyLimitedLLM(Runnable):
+    """Wraps a chat model/LLM so that at most `max_concurrency` calls are in flight,
+    sync and async callers together (they draw on the same slots). Drop-in wherever
+    the model is piped into a chain or invoked directly."""
+
+    def __init__(self, llm, max_concurrency: int):
+        self.llm = llm
+        self.max_concurrency = max(1, max_concurrency)
+        self._slots = _Slots(self.max_concurrency)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> Any:
+        # model_name / model / repo_id etc. resolve on the wrapped model; before __init__
+        # has set it (copy/unpickle) there is none, and hasattr() needs AttributeError
+        llm = self.__dict__.get("llm")
+        if llm is None:
+            raise AttributeError(name)
+        return getattr(llm, name)
+
+    def _enter(self) -> None:  # holding a slot
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _exit(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        self._slots.acquire()
+        self._enter()
+        try:
+            return self.llm.invoke(input, config, **kwargs)
+        finally:
+            self._exit()
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        await self._slots.aacquire()
+        self._enter()
+        try:
+            return await self.llm.ainvoke(input, config, **kwargs)
+        finally:
+            self._exit()
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[Any]:
+        self._slots.acquire()
+        self._enter()
+        try:
+            yield from self.llm.stream(input, config, **kwargs)
+        finally:
+            self._exit()
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AsyncIterator[Any]:
+        await self._slots.aacquire()
+        self._enter()
+        try:
+            async for chunk in self.llm.astream(input, config, **kwargs):
+                yield chunk
+        finally:
+            self._exit()
@@ -1,11 +1,48 @@
-from typing import List, Dict
+from collections import deque
+from typing import List, Dict, Optional
+
+from .config import MEMORY_RECENT_TURNS, MEMORY_SUMMARY_TOKENS
+
 
 class Memory:
-    def __init__(self, max_turns=8):
-        self.turns: List[Dict[str,str]] = []
-        self._max = max_turns
+    """Short-term conversation memory: the last `max_turns` exchanges verbatim in a
+    ring buffer, plus a rolling summary that older entries are folded into as they
+    fall out (one short line each, oldest dropped past `summary_tokens`)."""
+
+    def __init__(self, max_turns: int = MEMORY_RECENT_TURNS, summary_tokens: int = MEMORY_SUMMARY_TOKENS):
+        self.turns: "deque[Dict[str, str]]" = deque(maxlen=2 * max(1, max_turns))
+        self.summary_tokens = summary_tokens
+        self._summary: "deque[str]" = deque()
+        self._summary_len: "deque[int]" = deque()
+        self._summary_total = 0
+
     def add(self, role: str, text: str):
+        if len(self.turns) == self.turns.maxlen:
+            self._fold(self.turns[0])
         self.turns.append({"role": role, "text": text})
-        self.turns = self.turns[-2*self._max:]
-    def last_context(self, n=4) -> str:
-        return "\\n".join([f"{t['role']}: {t['text']}" for t in self.turns[-n:]])
\ No newline at end of file
+
+    def _fold(self, turn: Dict[str, str]) -> None:
+        from .tokens import count_tokens, truncate_tokens
+        text = " ".join(turn["text"].split())
+        if turn["role"] == "assistant":
+            text = text.split(". ")[0]  # first sentence of a reply is enough context
+        line = f"{turn['role']}: {truncate_tokens(text, 40)}"
+        n = count_tokens(line)
+        self._summary.append(line)
+        self._summary_len.append(n)
+        self._summary_total += n
+        while self._summary and self._summary_total > self.summary_tokens:
+            self._summary.popleft()
+            self._summary_total -= self._summary_len.popleft()
+
+    @property
+    def summary(self) -> str:
+        return "\n".join(self._summary)
+
+    def last_context(self, n: Optional[int] = None) -> str:
+        """Rolling summary (if any) followed by the last `n` entries (default: all kept)."""
+        turns: List[Dict[str, str]] = list(self.turns)[-n:] if n else list(self.turns)
+        recent = "\n".join(f"{t['role']}: {t['text']}" for t in turns)
+        if not self._summary:
+            return recent
+        return f"Earlier (summary):\n{self.summary}\nRecent:\n{recent}"
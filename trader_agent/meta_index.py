@@ -0,0 +1,49 @@
+from typing import Optional, Dict, Tuple
+from datetime import date
+import numpy as np
+from .trade_store import TradeStore
+
+CATEGORY_FILTERS = {"Asset": "asset", "Buy/Sell": "side", "Outcome": "outcome"}
+
+
+class MetadataIndex:
+    """Per-value row bitmaps over a TradeStore, used to resolve filters to candidate rows."""
+
+    def __init__(self, store: TradeStore):
+        self.store = store
+        self.n = len(store)  # rows covered; the store may grow before the index is rebuilt
+        self.bitmaps: Dict[str, Dict[str, np.ndarray]] = {}
+        for col, attr in CATEGORY_FILTERS.items():
+            cat = getattr(store, attr)
+            codes = cat.codes.to_numpy()
+            self.bitmaps[col] = {str(v).upper(): codes == i for i, v in enumerate(cat.categories)}
+        self.bitmaps["Tags"] = {t.upper(): store.tag_matrix[:, j] for j, t in enumerate(store.tag_vocab)}
+
+    def _bitmap(self, key: str, value) -> Optional[np.ndarray]:
+        if key == "Tags":
+            wanted = [t.strip().upper() for t in str(value).split(",") if t.strip()]
+            mask = np.ones(self.n, dtype=bool)
+            for t in wanted:
+                mask &= self.bitmaps["Tags"].get(t, np.zeros(self.n, dtype=bool))
+            return mask
+        if key in self.bitmaps:
+            return self.bitmaps[key].get(str(value).upper(), np.zeros(self.n, dtype=bool))
+        if key in self.store.df.columns:
+            return (self.store.df[key].iloc[:self.n].astype(str).str.upper() == str(value).upper()).to_numpy()
+        return None  # not a trade column; nothing to filter on
+
+    def candidates(self, filters: Optional[Dict[str, str]],
+                   date_range: Tuple[Optional[date], Optional[date]] = (None, None)) -> Optional[np.ndarray]:
+        """Row positions matching every filter and the date window, or None when unfiltered."""
+        mask = None
+        for kf, vf in (filters or {}).items():
+            bm = self._bitmap(kf, vf)
+            if bm is not None:
+                mask = bm.copy() if mask is None else (mask & bm)
+        s, e = date_range if date_range else (None, None)
+        if s or e:
+            rows = self.store.window(s, e)
+            in_window = np.zeros(self.n, dtype=bool)
+            in_window[rows[rows < self.n]] = True
+            mask = in_window if mask is None else (mask & in_window)
+        return None if mask is None else np.flatnonzero(mask)
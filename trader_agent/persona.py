@@ -1,50 +1,108 @@
 import numpy as np
 import pandas as pd
 import re
-from typing import Dict, Any
-
-
-def extract_persona(trades: pd.DataFrame) -> Dict[str, Any]:
-    persona = {"style": None, "risk": None, "holding": "swing",
-               "preferred_assets": [], "top_tags": [], "rules": []}
-    wins = trades[trades["Outcome"] == "Profit"].copy()
-
-    def tag_ratio(s: pd.Series, pattern: str) -> float:
-        return s.fillna("").str.contains(pattern, flags=re.IGNORECASE, regex=True).mean()
-
-    momentum_ratio = tag_ratio(wins["Tags"], r"breakout|momentum|volume-spike")
-    sentiment_ratio = tag_ratio(wins["Tags"], r"news-sentiment|meme")
-    meanrev_ratio  = tag_ratio(wins["Tags"], r"mean-revert|rsi-divergence|range-trade")
-    avg_rsi_wins = wins["RSI"].mean() if len(wins) else np.nan
-
-    if momentum_ratio > 0.35 and (not np.isnan(avg_rsi_wins) and avg_rsi_wins > 55):
-        persona["style"] = "Momentum"
-    elif sentiment_ratio > 0.30 and wins["Sentiment_Score"].mean() > 0.2:
-        persona["style"] = "Sentiment"
-    else:
-        persona["style"] = "MeanReversion" if meanrev_ratio > 0.28 else "Technical"
-
-    exposure = trades["Asset"].value_counts(normalize=True)
-    high_beta = exposure.get("DOGE", 0) + exposure.get("PEPE", 0)
-    persona["risk"] = "High" if high_beta > 0.35 else ("Medium" if high_beta > 0.15 else "Low")
-
-    asset_win = (trades.groupby("Asset")["Outcome"]
-                 .apply(lambda s: (s=="Profit").mean())
-                 .sort_values(ascending=False).head(3))
-    persona["preferred_assets"] = asset_win.index.tolist()
-
-    tag_counts = {}
-    for tags in trades["Tags"].fillna(""):
-        for t in [x.strip() for x in str(tags).split(",") if x.strip()]:
-            tag_counts[t] = tag_counts.get(t, 0) + 1
-    persona["top_tags"] = sorted(tag_counts, key=tag_counts.get, reverse=True)[:5]
-
-    if momentum_ratio > 0.35:
-        persona["rules"].append("Favor entries when RSI > 55 and volume spikes.")
-    if sentiment_ratio > 0.30:
-        persona["rules"].append("Lean into strong positive sentiment with tight stops.")
-    if high_beta > 0.25:
-        persona["rules"].append("Size down on high-volatility meme assets.")
-    if not persona["rules"]:
-        persona["rules"].append("Wait for confluence: RSI alignment, rising volume, supportive sentiment.")
-    return persona
\ No newline at end of file
+from typing import Dict, Any, Union
+from .trade_store import TradeStore, as_store
+
+# tag families behind the style ratios (share of winning trades carrying any tag of the family)
+TAG_FAMILIES = {
+    "momentum": r"breakout|momentum|volume-spike",
+    "sentiment": r"news-sentiment|meme",
+    "meanrev": r"mean-revert|rsi-divergence|range-trade",
+}
+
+
+class PersonaStats:
+    """Running counters behind `extract_persona`: trade/win counts, per-family win
+    tag hits, per-asset trades/wins, tag counts and win RSI/sentiment sums.
+    `add()` folds in new trades only, so the persona can follow a live feed."""
+
+    def __init__(self, trades: Union[TradeStore, pd.DataFrame, None] = None):
+        self.trades = 0
+        self.wins = 0
+        self.family_wins = {f: 0 for f in TAG_FAMILIES}
+        self.asset_n: Dict[str, int] = {}
+        self.asset_w: Dict[str, int] = {}
+        self.tag_counts: Dict[str, int] = {}  # insertion order = first appearance
+        self.win_sum = {"RSI": 0.0, "Sentiment_Score": 0.0}
+        self.win_cnt = {"RSI": 0, "Sentiment_Score": 0}
+        if trades is not None:
+            self.add(trades)
+
+    def add(self, trades: Union[TradeStore, pd.DataFrame]) -> None:
+        store = as_store(trades)
+        wins = store.is_win
+        win_tags = store.tag_matrix[wins]
+        self.trades += len(store)
+        self.wins += int(wins.sum())
+
+        for fam, pattern in TAG_FAMILIES.items():
+            cols = [j for j, t in enumerate(store.tag_vocab) if re.search(pattern, t, flags=re.IGNORECASE)]
+            self.family_wins[fam] += int(win_tags[:, cols].any(axis=1).sum()) if len(win_tags) else 0
+
+        for col in self.win_sum:
+            v = store.num[col][wins]
+            ok = ~np.isnan(v)
+            self.win_sum[col] += float(v[ok].sum())
+            self.win_cnt[col] += int(ok.sum())
+
+        codes = store.asset.codes.to_numpy()
+        valid = codes >= 0
+        n_cat = len(store.asset.categories)
+        a_n = np.bincount(codes[valid], minlength=n_cat)
+        a_w = np.bincount(codes[valid], weights=wins[valid], minlength=n_cat)
+        for i, name in enumerate(store.asset.categories):
+            if a_n[i]:
+                self.asset_n[name] = self.asset_n.get(name, 0) + int(a_n[i])
+                self.asset_w[name] = self.asset_w.get(name, 0) + int(a_w[i])
+
+        for t, c in zip(store.tag_vocab, store.tag_matrix.sum(axis=0)):
+            self.tag_counts[t] = self.tag_counts.get(t, 0) + int(c)
+
+    def _ratio(self, fam: str) -> float:
+        return self.family_wins[fam] / self.wins if self.wins else np.nan
+
+    def _win_mean(self, col: str) -> float:
+        return self.win_sum[col] / self.win_cnt[col] if self.win_cnt[col] else np.nan
+
+    def persona(self) -> Dict[str, Any]:
+        persona = {"style": None, "risk": None, "holding": "swing",
+                   "preferred_assets": [], "top_tags": [], "rules": []}
+        momentum_ratio = self._ratio("momentum")
+        sentiment_ratio = self._ratio("sentiment")
+        meanrev_ratio = self._ratio("meanrev")
+        avg_rsi_wins = self._win_mean("RSI")
+        avg_sent_wins = self._win_mean("Sentiment_Score")
+
+        if momentum_ratio > 0.35 and (not np.isnan(avg_rsi_wins) and avg_rsi_wins > 55):
+            persona["style"] = "Momentum"
+        elif sentiment_ratio > 0.30 and avg_sent_wins > 0.2:
+            persona["style"] = "Sentiment"
+        else:
+            persona["style"] = "MeanReversion" if meanrev_ratio > 0.28 else "Technical"
+
+        exposure = {a: n / max(1, self.trades) for a, n in self.asset_n.items()}
+        high_beta = exposure.get("DOGE", 0) + exposure.get("PEPE", 0)
+        persona["risk"] = "High" if high_beta > 0.35 else ("Medium" if high_beta > 0.15 else "Low")
+
+        names = sorted(self.asset_n)  # category order, as in a freshly loaded store
+        rates = np.array([self.asset_w[a] / self.asset_n[a] for a in names])
+        persona["preferred_assets"] = [names[i] for i in np.argsort(-rates, kind="stable")[:3]]
+
+        tags = list(self.tag_counts)
+        counts = np.array([self.tag_counts[t] for t in tags])
+        persona["top_tags"] = [tags[j] for j in np.argsort(-counts, kind="stable")[:5]]
+
+        if momentum_ratio > 0.35:
+            persona["rules"].append("Favor entries when RSI > 55 and volume spikes.")
+        if sentiment_ratio > 0.30:
+            persona["rules"].append("Lean into strong positive sentiment with tight stops.")
+        if high_beta > 0.25:
+            persona["rules"].append("Size down on high-volatility meme assets.")
+        if not persona["rules"]:
+            persona["rules"].append("Wait for confluence: RSI alignment, rising volume, supportive sentiment.")
+        return persona
+
+
+def extract_persona(trades: Union[TradeStore, pd.DataFrame]) -> Dict[str, Any]:
+    return PersonaStats(trades).persona()
@@ -1,58 +1,131 @@
+import asyncio
 from typing import TypedDict, Optional, Tuple, List, Dict, Any
 from datetime import date
 from langgraph.graph import START, END, StateGraph
 from langchain_core.documents import Document
-from .intent import classify_intent, IntentResult
-from .date_utils import parse_date_range
-from .retriever import retrieve_with_filters, extract_simple_filters
-from .lessons import compute_lessons, summarize_lessons
+from .intent import classify_intent, aclassify_intent, IntentResult, IntentClassifier, keyword_intent
+from .query_analysis import QueryAnalysis, analyze_query
+from .retriever import retrieve_with_filters
+from .lessons import LessonCube, summarize_lessons, asummarize_lessons
+from .trade_store import TradeStore
+from .summary_cache import SummaryCache
+from .telemetry import traced_node
+from .query_engine import TradeQueryEngine, STRUCTURED_INTENTS
 
 class State(TypedDict):
     query: str
+    analysis: QueryAnalysis
     intent: IntentResult
     date_range: Tuple[Optional[date], Optional[date]]
+    spec_filters: Optional[Dict[str, str]]
     docs: List[Document]
+    stats: Dict[str, Any]
     lessons_text: Optional[str]
 
-def build_graph(df, retriever, llm):
+def merge_filters(intent: IntentResult, analysis: QueryAnalysis) -> Dict[str, str]:
+    filters = (intent.filters or {}).copy()
+    # merge the filters found by query analysis
+    for k,v in analysis.filters.items():
+        filters.setdefault(k, v)
+    return filters
+
+def build_graph(store: TradeStore, retriever, llm, lessons_cube: Optional[LessonCube] = None,
+                intent_classifier: Optional[IntentClassifier] = None,
+                summary_cache: Optional[SummaryCache] = None,
+                query_engine: Optional[TradeQueryEngine] = None):
+    """Fan-out/fan-in graph:
+
+        START ─┬─ intent_node ─────────────────────────┐
+               └─ analyze_node ─┬─ retrieve_node ──────┼─ join_node ─(reflect)─ lessons_node
+                                └─ stats_node ─────────┘
+
+    analyze_node runs `analyze_query` once per turn (date window, asset, side,
+    trade IDs, tags); later nodes read its result instead of the query text.
+    Named tags only boost matching trades in the ranking, they do not filter.
+    Retrieval runs speculatively on those filters while the intent call is in
+    flight; join_node re-runs it only if the intent adds filters. list / best /
+    why_trade are answered exactly from the trade table in join_node, so vector
+    search is skipped when the keywords already point there."""
     graph = StateGraph(State)
+    cube = lessons_cube if lessons_cube is not None else LessonCube(store)
+    engine = query_engine if query_engine is not None else TradeQueryEngine(store)
 
 
     def node_intent(state: State):
+        if intent_classifier is not None:
+            return {"intent": intent_classifier.classify(state["query"])}
         return {"intent": classify_intent(llm, state["query"])}
 
-    def node_dates(state: State):
-        return {"date_range": parse_date_range(state["query"], df)}
+    async def anode_intent(state: State):
+        if intent_classifier is not None:
+            return {"intent": await intent_classifier.aclassify(state["query"])}
+        return {"intent": await aclassify_intent(llm, state["query"])}
+
+    def node_analyze(state: State):
+        analysis = analyze_query(state["query"], store)
+        return {"analysis": analysis, "date_range": analysis.date_range}
+
+    def retrieve(state: State, filters: Dict[str, str]) -> List[Document]:
+        return retrieve_with_filters(retriever, state["query"], filters, state["date_range"], k=5, store=store,
+                                     trade_ids=state["analysis"].trade_ids, boost_tags=state["analysis"].tags)
 
     def node_retrieve(state: State):
-        filters = (state["intent"].filters or {}).copy()
-        # merge fallback regex filters
-        for k,v in extract_simple_filters(state["query"]).items():
-            filters.setdefault(k, v)
+        filters = state["analysis"].filters
+        if keyword_intent(state["query"]) in STRUCTURED_INTENTS:
+            return {"spec_filters": None, "docs": []}  # exact path in join_node
+        return {"spec_filters": filters, "docs": retrieve(state, filters)}
+
+    def node_stats(state: State):
+        s,e = state["date_range"]
+        return {"stats": cube.stats(s, e)}
+
+    def exact_docs(state: State, filters: Dict[str, str]) -> Optional[List[Document]]:
+        return engine.answer(state["intent"].intent, state["query"], filters, state["date_range"], k=5,
+                             analysis=state["analysis"])
+
+    def node_join(state: State):
+        filters = merge_filters(state["intent"], state["analysis"])
+        docs = exact_docs(state, filters)
+        if docs is not None:
+            return {"docs": docs}
+        if filters == state["spec_filters"]:
+            return {"docs": state["docs"]}
+        return {"docs": retrieve(state, filters)}
 
-        docs = retrieve_with_filters(retriever, state["query"], filters, state["date_range"], k=5)
-        return {"docs": docs}
+    async def anode_join(state: State):
+        filters = merge_filters(state["intent"], state["analysis"])
+        docs = exact_docs(state, filters)
+        if docs is not None:
+            return {"docs": docs}
+        if filters == state["spec_filters"]:
+            return {"docs": state["docs"]}
+        return {"docs": await asyncio.to_thread(retrieve, state, filters)}
 
     def node_lessons(state: State):
-        s,e = state["date_range"]
-        stats = compute_lessons(df, s, e)
-        summary = summarize_lessons(llm, {}, stats)  # persona injected later in composer prompt
+        summary = summarize_lessons(llm, {}, state["stats"], summary_cache)  # persona injected later in composer prompt
         return {"lessons_text": summary}
-    
-    graph.add_node("intent_node", node_intent)
-    graph.add_node("date_node", node_dates)
-    graph.add_node("retrieve_node", node_retrieve)
-    graph.add_node("lessons_node", node_lessons)
+
+    async def anode_lessons(state: State):
+        return {"lessons_text": await asummarize_lessons(llm, {}, state["stats"], summary_cache)}
+
+    graph.add_node("intent_node", traced_node("intent_node", node_intent, anode_intent))
+    graph.add_node("analyze_node", traced_node("analyze_node", node_analyze))
+    graph.add_node("retrieve_node", traced_node("retrieve_node", node_retrieve))
+    graph.add_node("stats_node", traced_node("stats_node", node_stats))
+    graph.add_node("join_node", traced_node("join_node", node_join, anode_join))
+    graph.add_node("lessons_node", traced_node("lessons_node", node_lessons, anode_lessons))
 
     graph.add_edge(START, "intent_node")
-    graph.add_edge("intent_node", "date_node")
-    graph.add_edge("date_node", "retrieve_node")
+    graph.add_edge(START, "analyze_node")
+    graph.add_edge("analyze_node", "retrieve_node")
+    graph.add_edge("analyze_node", "stats_node")
+    graph.add_edge(["intent_node", "retrieve_node", "stats_node"], "join_node")
 
 
     def when_reflect(state: State) -> bool:
         return state["intent"].intent == "reflect"
 
-    graph.add_conditional_edges("retrieve_node", when_reflect, {True: "lessons_node", False: END})
+    graph.add_conditional_edges("join_node", when_reflect, {True: "lessons_node", False: END})
     graph.add_edge("lessons_node", END)
 
-    return graph.compile()
\ No newline at end of file
+    return graph.compile()
@@ -0,0 +1,192 @@
+import re
+import weakref
+from functools import lru_cache
+from datetime import date, timedelta
+from typing import NamedTuple, Optional, Tuple, Dict, Union, TYPE_CHECKING
+
+from .config import TODAY, QUERY_ANALYSIS_CACHE_SIZE
+from .date_utils import MONTHS
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from .trade_store import TradeStore
+
+KNOWN_ASSETS = ("BTC", "ETH", "SOL", "DOGE", "PEPE")
+ASSET_ALIASES = {"bitcoin": "BTC", "ethereum": "ETH", "solana": "SOL", "dogecoin": "DOGE"}
+SIDE_WORDS = {"buy": "Buy", "buys": "Buy", "bought": "Buy", "sell": "Sell", "sells": "Sell", "sold": "Sell"}
+
+ISO = r"\d{4}-\d{2}-\d{2}"
+# date phrases in precedence order: when several appear, the earliest kind here wins
+DATE_PATTERNS = [
+    ("range", rf"\b(?:between|from)\s*(?P<r1>{ISO})\s*(?:and|to)\s*(?P<r2>{ISO})\b"),
+    ("since", rf"\b(?:since|after|from)\s*(?P<s1>{ISO})\b"),  # a lone "from <date>" is open-ended
+    ("month", rf"\b(?P<mname>{'|'.join(MONTHS)})\s+(?P<myear>\d{{4}})\b"),
+    ("day", rf"\b(?P<d1>{ISO})\b"),
+    ("ym", r"\b(?P<ymy>\d{4})-(?P<ymm>\d{2})\b"),
+    ("last_n", r"\blast\s+(?P<n>\d{1,3})\s*(?P<unit>day|week|month)s?\b"),
+    ("year", r"\b(?:in|during)\s+(?P<y1>\d{4})\b(?!-\d)"),
+    ("today", r"\btoday\b"),
+    ("yesterday", r"\byesterday\b"),
+    ("last_month", r"\blast\s+month\b"),
+]
+DATE_KINDS = [kind for kind, _ in DATE_PATTERNS]
+TRADE_ID_PATTERN = r"\bt\d{3,}\b"
+SIDE_PATTERN = rf"\b(?:{'|'.join(SIDE_WORDS)})\b"
+
+
+class QueryAnalysis(NamedTuple):
+    """What `analyze_query` found in one query."""
+    date_range: Tuple[Optional[date], Optional[date]] = (None, None)
+    asset: Optional[str] = None
+    side: Optional[str] = None          # "Buy" / "Sell", only when one side is named
+    trade_ids: Tuple[str, ...] = ()
+    tags: Tuple[str, ...] = ()          # a ranking hint, not a filter (see retrieve_with_filters)
+
+    @property
+    def filters(self) -> Dict[str, str]:
+        """Metadata filters (Asset, Buy/Sell) for retrieval and the query engine."""
+        f = {}
+        if self.asset:
+            f["Asset"] = self.asset
+        if self.side:
+            f["Buy/Sell"] = self.side
+        return f
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+@lru_cache(maxsize=32)
+def _pattern(assets: Tuple[str, ...], tags: Tuple[str, ...]) -> Tuple["re.Pattern", Dict[str, str], Dict[str, str]]:
+    """One alternation over every date phrase and term, compiled once per vocabulary,
+    plus lookups from matched text to asset / tag names. Tags come before assets
+    and sides so a tag containing those words is matched whole."""
+    asset_of = {a.lower(): a for a in assets}
+    asset_of.update({k: v for k, v in ASSET_ALIASES.items() if v in assets})
+    tag_parts = {t: re.split(r"[-\s]+", t.lower()) for t in tags}
+    tag_of = {"".join(parts): t for t, parts in tag_parts.items()}
+    parts = [f"(?P<{kind}>{p})" for kind, p in DATE_PATTERNS]
+    parts.append(f"(?P<trade_id>{TRADE_ID_PATTERN})")
+    if tag_of:
+        # hyphenated tags also match with a space or nothing in between ("long term")
+        words = sorted(tag_parts.values(), key=lambda w: -len("".join(w)))
+        alts = "|".join(r"[-\s]?".join(map(re.escape, w)) for w in words)
+        parts.append(rf"(?P<tag>(?<![\w-])(?:{alts})(?![\w-]))")
+    if asset_of:
+        words = sorted(asset_of, key=len, reverse=True)
+        parts.append(rf"(?P<asset>\b(?:{'|'.join(map(re.escape, words))})\b)")
+    parts.append(f"(?P<side>{SIDE_PATTERN})")
+    # every branch starts at a word boundary; checking it first skips mid-word positions fast
+    return re.compile(r"\b(?:" + "|".join(parts) + ")"), asset_of, tag_of
+
+
+def _month(year: int, mon: int) -> Tuple[date, date]:
+    start = date(year, mon, 1)
+    return start, (date(year, mon, 28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+
+
+def _window(kind: str, m: "re.Match", today: date) -> Tuple[Optional[date], Optional[date]]:
+    if kind == "range":
+        return date.fromisoformat(m.group("r1")), date.fromisoformat(m.group("r2"))
+    if kind == "since":
+        return date.fromisoformat(m.group("s1")), today
+    if kind == "month":
+        return _month(int(m.group("myear")), MONTHS[m.group("mname")])
+    if kind == "day":
+        d = date.fromisoformat(m.group("d1"))
+        return d, d
+    if kind == "ym":
+        return _month(int(m.group("ymy")), int(m.group("ymm")))
+    if kind == "last_n":
+        days = int(m.group("n")) * {"day": 1, "week": 7, "month": 30}[m.group("unit")]
+        return today - timedelta(days=days), today
+    if kind == "year":
+        return date(int(m.group("y1")), 1, 1), date(int(m.group("y1")), 12, 31)
+    if kind == "today":
+        return today, today
+    if kind == "yesterday":
+        return today - timedelta(days=1), today - timedelta(days=1)
+    prev = today.replace(day=1) - timedelta(days=1)  # last_month
+    return prev.replace(day=1), prev
+
+
+@lru_cache(maxsize=QUERY_ANALYSIS_CACHE_SIZE)
+def _analyze(text: str, today: date, span: Tuple[Optional[date], Optional[date]],
+             assets: Tuple[str, ...], tags: Tuple[str, ...]) -> QueryAnalysis:
+    regex, asset_of, tag_of = _pattern(assets, tags)
+    dates: Dict[str, "re.Match"] = {}
+    asset = None
+    sides, trade_ids, found_tags = set(), [], []
+    for m in regex.finditer(text):
+        kind = m.lastgroup
+        if kind in DATE_KINDS:
+            dates.setdefault(kind, m)
+        elif kind == "asset":
+            asset = asset or asset_of[m.group(kind)]
+        elif kind == "side":
+            sides.add(SIDE_WORDS[m.group(kind)])
+        elif kind == "trade_id":
+            trade_ids.append(m.group(kind).upper())
+        elif kind == "tag":
+            found_tags.append(tag_of[re.sub(r"[-\s]+", "", m.group(kind))])
+
+    start = end = None
+    for kind in DATE_KINDS:
+        if kind in dates:
+            try:
+                start, end = _window(kind, dates[kind], today)
+            except ValueError:  # e.g. 2024-13 or 2024-02-30
+                continue
+            break
+    dmin, dmax = span
+    if dmin is not None:
+        if start and start < dmin:
+            start = dmin
+        if end and end > dmax:
+            end = dmax
+    return QueryAnalysis((start, end), asset, sides.pop() if len(sides) == 1 else None,
+                         tuple(dict.fromkeys(trade_ids)), tuple(dict.fromkeys(found_tags)))
+
+
+# per-store (version, assets, tags): reading pandas categories costs more than a memo hit
+_VOCAB: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def _vocab(store: "TradeStore") -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    cached = _VOCAB.get(store)
+    if cached is None or cached[0] != store.version:
+        assets = tuple(dict.fromkeys([*KNOWN_ASSETS, *(str(a).upper() for a in store.asset.categories)]))
+        cached = _VOCAB[store] = (store.version, assets, tuple(store.tag_vocab))
+    return cached[1], cached[2]
+
+
+def _frame_vocab(df: "pd.DataFrame") -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    # read straight off the columns: building a TradeStore per call would parse and score every row
+    from .trade_store import tag_vocab
+    assets = tuple(dict.fromkeys([*KNOWN_ASSETS, *(str(a).upper() for a in df["Asset"].dropna().unique())]))
+    return assets, tuple(tag_vocab(df["Tags"]))
+
+
+def analyze_query(query: str, store: Union["TradeStore", "pd.DataFrame", None] = None) -> QueryAnalysis:
+    """Date window, asset, side, trade IDs and tags of `query` in one pass over the
+    normalized text with a single precompiled pattern.
+
+    With `store`, the window is clamped to its date span and its assets and tags
+    are recognised too (otherwise KNOWN_ASSETS only). Results are memoized (LRU)
+    by (normalized query, TODAY, date span, vocabulary). A store's span and
+    vocabulary are cached too; a plain DataFrame's are read off its columns on
+    every call, so repeated callers should pass the TradeStore."""
+    if store is None:
+        return _analyze(normalize(query), TODAY.date(), (None, None), KNOWN_ASSETS, ())
+    from .trade_store import TradeStore, date_span
+    vocab = _vocab(store) if isinstance(store, TradeStore) else _frame_vocab(store)
+    return _analyze(normalize(query), TODAY.date(), date_span(store), *vocab)
+
+
+def analysis_cache_info():
+    return _analyze.cache_info()
+
+
+def clear_analysis_cache() -> None:
+    _analyze.cache_clear()
@@ -0,0 +1,117 @@
+import re
+from datetime import date
+from typing import Optional, Dict, Tuple, List, Any
+
+import numpy as np
+
+from .trade_store import TradeStore
+from .meta_index import MetadataIndex
+from .data_store import build_docs
+from .query_analysis import QueryAnalysis, analyze_query
+
+# intents answered exactly from the trade table; everything else uses vector search
+STRUCTURED_INTENTS = {"list", "best", "why_trade"}
+
+OUTCOME_RANK = {"profit": 2, "neutral": 1, "loss": 0}
+MAX_LIMIT = 50
+
+# "last 3 months" is a date window (query_analysis), not a row limit
+LIMIT_RE = re.compile(r"\b(?:top|last|first|latest|recent|best|worst)\s+(\d{1,3})\b(?!\s*(?:day|week|month|year)s?\b)",
+                      re.IGNORECASE)
+WORST_RE = re.compile(r"\b(worst|losing|losses|loss|least profitable)\b", re.IGNORECASE)
+OLDEST_RE = re.compile(r"\b(oldest|earliest|first)\b", re.IGNORECASE)
+
+
+def plan(intent: str, query: str, k: int = 5) -> Tuple[str, bool, int]:
+    """(sort, descending, limit) the wording asks for under a structured intent."""
+    m = LIMIT_RE.search(query)
+    limit = int(m.group(1)) if m else k
+    if intent == "best":
+        return "outcome", not WORST_RE.search(query), limit
+    if intent == "why_trade":
+        return "score", True, limit
+    return "date", not OLDEST_RE.search(query), limit
+
+
+class TradeQueryEngine:
+    """Exact execution path for list / best / why_trade questions.
+
+    Filters and the date window resolve to rows through MetadataIndex bitmaps,
+    then a vectorised sort (date, setup score or outcome) and a limit pick the
+    rows; results are Documents shaped like the vectorstore's, so the composer
+    does not care which path produced them."""
+
+    def __init__(self, store: TradeStore):
+        self.store = store
+        self.meta = MetadataIndex(store)
+
+    def _index(self) -> MetadataIndex:
+        if self.meta.n != len(self.store):  # store grew (live ingestion)
+            self.meta = MetadataIndex(self.store)
+        return self.meta
+
+    def _filters(self, filters: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        # LLM filters come with arbitrary key casing; keep only trade columns
+        columns = {c.lower(): c for c in self.store.df.columns}
+        out = {}
+        for k, v in (filters or {}).items():
+            col = columns.get(str(k).lower())
+            if col is not None and v not in (None, ""):
+                out[col] = str(v)
+        return out
+
+    def _sort_keys(self, rows: np.ndarray, sort: str) -> List[np.ndarray]:
+        """lexsort keys, most significant last, all ascending."""
+        store = self.store
+        day = store.dates[rows].astype(np.int64)
+        score = store.setup_score[rows]
+        if sort == "date":
+            return [score, day]
+        rank = np.array([OUTCOME_RANK.get(str(c).lower(), 1) for c in store.outcome.categories] + [1])
+        outcome = rank[store.outcome.codes.to_numpy()[rows]]
+        if sort == "outcome":
+            return [day, score, outcome]
+        return [day, score]  # "score"
+
+    def query(self, filters: Optional[Dict[str, Any]] = None,
+              date_range: Tuple[Optional[date], Optional[date]] = (None, None),
+              sort: str = "date", descending: bool = True, limit: int = 5,
+              trade_ids: Optional[List[str]] = None) -> List[Any]:
+        store = self.store
+        meta = self._index()
+        rows = meta.candidates(self._filters(filters), date_range)
+        if rows is None:
+            rows = np.arange(meta.n)
+        if trade_ids:
+            wanted = np.array([store.row_of[t] for t in trade_ids if t in store.row_of], dtype=np.int64)
+            rows = np.intersect1d(rows, wanted)
+        if len(rows) == 0:
+            return []
+        order = np.lexsort(self._sort_keys(rows, sort))
+        if descending:
+            order = order[::-1]
+        top = rows[order[:max(1, min(limit, MAX_LIMIT))]]
+        docs = build_docs(store, top)
+        for d, row in zip(docs, top):
+            d.metadata["_setup_score"] = float(store.setup_score[row])
+        return docs
+
+    def answer(self, intent: str, query: str, filters: Optional[Dict[str, Any]],
+               date_range: Tuple[Optional[date], Optional[date]], k: int = 5,
+               analysis: Optional[QueryAnalysis] = None) -> Optional[List[Any]]:
+        """Plan sort/limit from the intent and wording and run it. Returns None when
+        the question carries no constraint the table can answer exactly, or when
+        no trade matches it (then the caller should fall back to vector search). `analysis` is the query's
+        `analyze_query` result, if the caller already has it."""
+        if intent not in STRUCTURED_INTENTS:
+            return None
+        analysis = analysis if analysis is not None else analyze_query(query, self.store)
+        trade_ids = list(analysis.trade_ids)
+        if date_range is None or not any(date_range):
+            date_range = analysis.date_range
+        filters = self._filters(filters)
+        if intent == "why_trade" and not (trade_ids or filters or any(date_range)):
+            return None
+
+        sort, descending, limit = plan(intent, query, k)
+        return self.query(filters, date_range, sort=sort, descending=descending, limit=limit, trade_ids=trade_ids) or None
@@ -0,0 +1,117 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Hashable, Tuple
+
+import numpy as np
+
+from .config import RESPONSE_CACHE_THRESHOLD, RESPONSE_CACHE_MAX
+
+
+def query_context(query: str, store, history: str = "") -> Hashable:
+    """What a cached reply must share besides a similar embedding: the resolved
+    date window, the asset/side filters, any trade IDs named in the query, its
+    keyword intent, the sort/limit the query engine would plan for it (so
+    "top 3", "top 5" and "worst" trades don't share a reply) and the conversation
+    before it (`history`, e.g. `Memory.last_context()`), so a follow-up such as
+    "Why?" is only answered from a session with the same prior turns."""
+    from .query_analysis import analyze_query
+    from .intent import keyword_intent
+    from .query_engine import plan, STRUCTURED_INTENTS
+    analysis = analyze_query(query, store)
+    plans = tuple(plan(intent, query) for intent in sorted(STRUCTURED_INTENTS))
+    return (analysis.date_range, tuple(sorted(analysis.filters.items())), tuple(sorted(analysis.trade_ids)),
+            keyword_intent(query), plans, hashlib.sha256(history.encode("utf-8")).hexdigest() if history else "")
+
+
+def data_version(assets: Dict[str, Any]) -> Hashable:
+    """Changes whenever trades are added/rescored or the persona changes."""
+    persona = json.dumps(assets["persona"], sort_keys=True, default=str)
+    return assets["store"].version, hashlib.sha256(persona.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Replies keyed by query embedding, shared by all sessions.
+
+    A lookup hits when a cached query with the same context (see `query_context`)
+    has cosine similarity >= `threshold`. Entries beyond `max_entries` are evicted
+    least-recently-used, and everything is dropped when the data version passed
+    in changes. Sessions only share replies to turns with the same prior history."""
+
+    def __init__(self, threshold: float = RESPONSE_CACHE_THRESHOLD, max_entries: int = RESPONSE_CACHE_MAX):
+        self.threshold = threshold
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[int, Tuple[Hashable, str]]" = OrderedDict()
+        self._by_context: Dict[Hashable, Dict[int, np.ndarray]] = {}
+        self._next_id = 0
+        self._version: Hashable = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _unit(vec) -> np.ndarray:
+        v = np.asarray(vec, dtype=np.float32)
+        return v / max(float(np.linalg.norm(v)), 1e-12)
+
+    def _sync(self, version: Hashable) -> None:
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._by_context.clear()
+            self._version = version
+
+    def _match(self, q: np.ndarray, context: Hashable) -> Optional[int]:
+        group = self._by_context.get(context)
+        if not group:
+            return None
+        ids = list(group)
+        sims = np.stack([group[i] for i in ids]) @ q
+        best = int(np.argmax(sims))
+        return ids[best] if sims[best] >= self.threshold else None
+
+    def get(self, vec, context: Hashable, version: Hashable = None) -> Optional[str]:
+        q = self._unit(vec)
+        with self._lock:
+            self._sync(version)
+            eid = self._match(q, context)
+            if eid is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(eid)
+            self.hits += 1
+            return self._entries[eid][1]
+
+    def put(self, vec, context: Hashable, reply: str, version: Hashable = None) -> None:
+        q = self._unit(vec)
+        with self._lock:
+            self._sync(version)
+            if self._match(q, context) is not None:
+                return  # a concurrent turn already cached a close match
+            eid = self._next_id
+            self._next_id += 1
+            self._entries[eid] = (context, reply)
+            self._by_context.setdefault(context, {})[eid] = q
+            while len(self._entries) > self.max_entries:
+                old, (ctx, _) = self._entries.popitem(last=False)
+                group = self._by_context[ctx]
+                del group[old]
+                if not group:
+                    del self._by_context[ctx]
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_context.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": (self.hits / total) if total else None,
+                    "size": len(self._entries), "evictions": self.evictions,
+                    "invalidations": self.invalidations, "threshold": self.threshold}
@@ -1,39 +1,248 @@
-import re
-from typing import Optional, Dict, Tuple, List, Any
-from datetime import date
+from typing import Optional, Dict, Tuple, List, Sequence
+from datetime import date, datetime
+import numpy as np
+import faiss
 from langchain_core.documents import Document
+from .config import PREFILTER_EXACT_MAX
 from .scoring import setup_score
+from .trade_store import TradeStore
+from .meta_index import MetadataIndex
+from .query_analysis import analyze_query
 
-def extract_simple_filters(text: str) -> Dict[str,str]:
-    f = {}
-    m_asset = re.search(r"\\b(BTC|ETH|SOL|DOGE|PEPE)\\b", text, re.IGNORECASE)
-    if m_asset: f["Asset"] = m_asset.group(1).upper()
-    if re.search(r"\\b(buy)\\b", text, re.IGNORECASE): f["Buy/Sell"] = "Buy"
-    if re.search(r"\\b(sell)\\b", text, re.IGNORECASE): f["Buy/Sell"] = "Sell"
-    return f
+RRF_K = 60
 
-def retrieve_with_filters(retriever, query: str, filters: Optional[Dict[str,str]], date_range: Tuple[Optional[date],Optional[date]], k:int=5) -> List[Document]:
-    raw_docs: List[Document] = retriever.invoke(query)
+def extract_simple_filters(text: str, store: Optional[TradeStore] = None) -> Dict[str,str]:
+    """Asset / side / tag filters named in `text` (see `query_analysis.analyze_query`)."""
+    return analyze_query(text, store).filters
+
+def selector_params(index, sel):
+    """Search parameters of the type `index` expects, carrying its current nprobe/efSearch."""
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=sel, efSearch=index.hnsw.efSearch)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=sel, nprobe=ivf.nprobe)
+    return faiss.SearchParameters(sel=sel)
+
+class FilteredRetriever:
+    """Vector search restricted to rows that pass the metadata filters.
+
+    Filters are resolved to candidate rows via a MetadataIndex first; small
+    candidate sets are scored exactly, larger ones go through a FAISS ID
+    selector, so every hit qualifies regardless of how selective the filter is.
+    With a `LexicalIndex` attached, `lexical_search` runs BM25 over the same
+    candidate rows for rank fusion."""
+
+    def __init__(self, vectorstore, store: TradeStore, k: int = 12, exact_max: int = PREFILTER_EXACT_MAX,
+                 lexical=None):
+        self.vectorstore = vectorstore
+        self.store = store
+        self.lexical = lexical
+        self.meta = MetadataIndex(store)
+        self.k = k
+        self.exact_max = exact_max
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Re-map store rows to FAISS ids; call after the vectorstore changes."""
+        faiss_of_row = np.full(len(self.store), -1, dtype=np.int64)
+        for fid, tid in self.vectorstore.index_to_docstore_id.items():
+            row = self.store.row_of.get(str(tid))
+            if row is not None:
+                faiss_of_row[row] = fid
+        self.faiss_of_row = faiss_of_row
+        self.lex_of_row = self._map_lexical(np.full(len(self.store), -1, dtype=np.int64), 0)
+
+    def _map_lexical(self, lex_of_row: np.ndarray, first: int) -> np.ndarray:
+        if self.lexical is not None:
+            for pos in range(first, len(self.lexical)):
+                row = self.store.row_of.get(self.lexical.ids[pos])
+                if row is not None and row < len(lex_of_row):
+                    lex_of_row[row] = pos
+        return lex_of_row
+
+    def extend(self, first_fid: int, first_lex: Optional[int] = None) -> None:
+        """Pick up rows appended to the store, vectors added from `first_fid` on and
+        lexical entries from `first_lex` on, without re-walking the existing mapping."""
+        meta = MetadataIndex(self.store)
+        faiss_of_row = np.full(meta.n, -1, dtype=np.int64)
+        faiss_of_row[:len(self.faiss_of_row)] = self.faiss_of_row
+        ids = self.vectorstore.index_to_docstore_id
+        for fid in range(first_fid, self.vectorstore.index.ntotal):
+            row = self.store.row_of.get(str(ids.get(fid)))
+            if row is not None and row < meta.n:
+                faiss_of_row[row] = fid
+        lex_of_row = np.full(meta.n, -1, dtype=np.int64)
+        lex_of_row[:len(self.lex_of_row)] = self.lex_of_row
+        lex_of_row = self._map_lexical(lex_of_row, len(self.lexical) if first_lex is None else first_lex)
+        # mappings before meta: search() reads meta first
+        self.faiss_of_row, self.lex_of_row = faiss_of_row, lex_of_row
+        self.meta = meta
+
+    def doc(self, trade_id: str) -> Optional[Document]:
+        doc = self.vectorstore.docstore.search(str(trade_id))
+        return doc if isinstance(doc, Document) else None
+
+    def _search(self, qvec: np.ndarray, ids: Optional[np.ndarray], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        index = self.vectorstore.index
+        if ids is None:
+            dist, fids = index.search(qvec, k)
+            return dist[0], fids[0]
+        if len(ids) == 0:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        if len(ids) <= self.exact_max:
+            try:
+                vecs = index.reconstruct_batch(ids)
+                if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+                    dist = -(vecs @ qvec[0])
+                else:
+                    dist = ((vecs - qvec) ** 2).sum(axis=1)
+                top = np.argsort(dist, kind="stable")[:k]
+                return dist[top], ids[top]
+            except RuntimeError:
+                pass  # index type without reconstruct; use the selector path
+        dist, fids = index.search(qvec, min(k, len(ids)), params=selector_params(index, faiss.IDSelectorBatch(ids)))
+        return dist[0], fids[0]
+
+    def search(self, query: str, filters: Optional[Dict[str,str]] = None,
+               date_range: Tuple[Optional[date],Optional[date]] = (None, None), k: Optional[int] = None) -> List[Document]:
+        k = k or self.k
+        rows = self.meta.candidates(filters, date_range)
+        ids = None
+        if rows is not None:
+            ids = self.faiss_of_row[rows]
+            ids = ids[ids >= 0]
+        qvec = np.asarray([self.vectorstore._embed_query(query)], dtype=np.float32)
+        if self.vectorstore._normalize_L2:
+            faiss.normalize_L2(qvec)
+        _, fids = self._search(qvec, ids, k)
+        return self._docs(fids)
+
+    def _docs(self, fids: np.ndarray) -> List[Document]:
+        docs = []
+        for fid in fids:
+            if fid < 0:
+                continue
+            doc = self.vectorstore.docstore.search(self.vectorstore.index_to_docstore_id[int(fid)])
+            if isinstance(doc, Document):
+                docs.append(doc)
+        return docs
+
+    def search_batch(self, qvecs: np.ndarray, filters: List[Optional[Dict[str,str]]],
+                     date_ranges: List[Tuple[Optional[date],Optional[date]]], k: Optional[int] = None) -> List[List[Document]]:
+        """`search` for pre-embedded queries. Queries without a row restriction go to
+        FAISS as one matrix search; filtered ones search their own candidate ids."""
+        k = k or self.k
+        qvecs = np.array(qvecs, dtype=np.float32, ndmin=2)
+        if self.vectorstore._normalize_L2:
+            faiss.normalize_L2(qvecs)
+        out: List[List[Document]] = [[] for _ in range(len(qvecs))]
+        unrestricted = []
+        for i, (f, r) in enumerate(zip(filters, date_ranges)):
+            rows = self.meta.candidates(f, r)
+            if rows is None:
+                unrestricted.append(i)
+                continue
+            ids = self.faiss_of_row[rows]
+            _, fids = self._search(qvecs[i:i + 1], ids[ids >= 0], k)
+            out[i] = self._docs(fids)
+        if unrestricted:
+            _, fids = self.vectorstore.index.search(qvecs[unrestricted], k)
+            for i, row in zip(unrestricted, fids):
+                out[i] = self._docs(row)
+        return out
+
+    def lexical_search(self, query: str, filters: Optional[Dict[str,str]] = None,
+                       date_range: Tuple[Optional[date],Optional[date]] = (None, None), k: Optional[int] = None) -> List[Document]:
+        if self.lexical is None:
+            return []
+        k = k or self.k
+        rows = self.meta.candidates(filters, date_range)
+        allowed = None
+        if rows is not None:
+            pos = self.lex_of_row[rows]
+            allowed = np.zeros(len(self.lexical), dtype=bool)
+            allowed[pos[pos >= 0]] = True
+        hits, _ = self.lexical.search(query, k, allowed)
+        docs = [self.doc(self.lexical.ids[p]) for p in hits]
+        return [d for d in docs if d is not None]
+
+    def invoke(self, query: str) -> List[Document]:
+        return self.search(query)
+
+
+def rrf_fuse(rankings: List[List[Document]], k: int = RRF_K) -> List[Document]:
+    """Reciprocal-rank fusion: sum of 1/(k + rank) over the lists each doc appears in."""
+    score: Dict[str, float] = {}
+    first: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, d in enumerate(ranking):
+            key = str(d.metadata.get("Trade ID", d.id))
+            score[key] = score.get(key, 0.0) + 1.0 / (k + rank + 1)
+            first.setdefault(key, d)
+    return [first[key] for key in sorted(score, key=lambda x: -score[x])]
+
+
+def fetch_size(k: int) -> int:
+    """Candidates pulled per query before the setup-score sort picks the top k."""
+    return max(k*4, 24)
+
+
+def retrieve_with_filters(retriever, query: str, filters: Optional[Dict[str,str]], date_range: Tuple[Optional[date],Optional[date]], k:int=5, store: Optional[TradeStore]=None,
+                          dense: Optional[List[Document]] = None, trade_ids: Optional[Sequence[str]] = None,
+                          boost_tags: Sequence[str] = ()) -> List[Document]:
+    """Top-k docs by setup score among filtered hits. `dense` is an already computed
+    vector ranking for this query (e.g. from `FilteredRetriever.search_batch`);
+    `trade_ids` are the IDs named in it (`QueryAnalysis.trade_ids`), if already extracted. Hits carrying any of
+    `boost_tags` rank first (more matching tags first), without excluding the rest."""
+    fetch_k = fetch_size(k)
+    if isinstance(retriever, FilteredRetriever):
+        # Trade IDs named in the query are answered by direct lookup
+        if trade_ids is None:
+            trade_ids = analyze_query(query, store).trade_ids
+        named = [d for d in (retriever.doc(t) for t in dict.fromkeys(trade_ids)) if d is not None]
+        if named:
+            for d in named:
+                score = store.score_of(d.metadata.get("Trade ID")) if store is not None else None
+                d.metadata["_setup_score"] = score if score is not None else setup_score(d.metadata)
+            return named[:k]
+        # Candidates are pre-filtered, so every hit already qualifies; dense and
+        # BM25 rankings are fused so exact tokens (tags, dates, sides) count
+        raw_docs: List[Document] = dense if dense is not None else retriever.search(query, filters, date_range, k=fetch_k)
+        if retriever.lexical is not None:
+            raw_docs = rrf_fuse([raw_docs, retriever.lexical_search(query, filters, date_range, k=fetch_k)])[:fetch_k]
+        filters, date_range = None, (None, None)
+    else:
+        raw_docs = retriever.invoke(query)
     s, e = date_range
     selected = []
     for d in raw_docs:
         ok = True
         if filters:
             for kf, vf in filters.items():
-                if str(d.metadata.get(kf,"")).upper() != str(vf).upper():
-                    ok = False; break
+                have = str(d.metadata.get(kf,"")).upper()
+                if kf == "Tags":
+                    ok = {t.strip() for t in str(vf).upper().split(",")} <= {t.strip() for t in have.split(",")}
+                else:
+                    ok = have == str(vf).upper()
+                if not ok:
+                    break
         if ok and (s or e):
             try:
-                from datetime import datetime
                 ddate = datetime.fromisoformat(str(d.metadata.get("Date"))).date()
                 if s and ddate < s: ok = False
                 if e and ddate > e: ok = False
             except Exception:
                 pass
         if ok:
-            d.metadata["_setup_score"] = setup_score(d.metadata)
+            score = store.score_of(d.metadata.get("Trade ID")) if store is not None else None
+            d.metadata["_setup_score"] = score if score is not None else setup_score(d.metadata)
             selected.append(d)
-        if len(selected) >= max(k*4, 24):
+        if len(selected) >= fetch_k:
             break
-    selected_sorted = sorted(selected, key=lambda d: d.metadata.get("_setup_score",0), reverse=True)
+    wanted = {t.upper() for t in boost_tags}
+    def rank(d: Document):
+        tag_hits = len(wanted & {t.strip().upper() for t in str(d.metadata.get("Tags", "")).split(",")}) if wanted else 0
+        return tag_hits, d.metadata.get("_setup_score", 0)
+    selected_sorted = sorted(selected, key=rank, reverse=True)
     return selected_sorted[:k]
\ No newline at end of file
@@ -1,4 +1,7 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
 
 TAG_WEIGHTS = {
     "breakout": 0.6, "momentum": 0.6, "volume-spike": 0.5,
@@ -26,4 +29,44 @@ def setup_score(meta: Dict[str, Any]) -> float:
         score += TAG_WEIGHTS.get(t.strip(), 0.0)
 
     if str(meta.get("Outcome","")).lower()=="profit": score += 0.2
-    return round(score, 3)
\ No newline at end of file
+    return round(score, 3)
+
+def _unparsable(column) -> "np.ndarray":
+    """Rows whose value `float()` rejects (where `setup_score` falls back to defaults)."""
+    import numpy as np
+    if column.dtype.kind in "biuf":
+        return np.zeros(len(column), dtype=bool)
+    bad = []
+    for v in column.unique():
+        try:
+            float(v)
+        except Exception:
+            bad.append(v)
+    return column.isin(bad).to_numpy() if bad else np.zeros(len(column), dtype=bool)
+
+def setup_scores(store, weights: Optional[Dict[str, float]] = None) -> "np.ndarray":
+    """Vectorised `setup_score` over every row of a TradeStore (same thresholds,
+    fallbacks and per-occurrence tag weights)."""
+    import numpy as np
+    weights = TAG_WEIGHTS if weights is None else weights
+    # like setup_score: one unparsable field resets all three to 50 / 0 / 0
+    bad = (_unparsable(store.df["RSI"]) | _unparsable(store.df["Volume_Change_Pct"])
+           | _unparsable(store.df["Sentiment_Score"]))
+    rsi = np.where(bad, 50.0, store.num["RSI"])
+    vch = np.where(bad, 0.0, store.num["Volume_Change_Pct"])
+    sent = np.where(bad, 0.0, store.num["Sentiment_Score"])
+
+    score = np.where(rsi > 55, 1.0, np.where(rsi > 45, 0.2, 0.0))
+    score = score + np.where(vch > 20, 0.8, np.where(vch > 5, 0.2, 0.0))
+    score = score + np.where(sent > 0.2, 0.5, np.where(sent > 0.0, 0.2, 0.0))
+    score = score + np.where(rsi < 30, 0.3, 0.0)
+
+    w = np.array([weights.get(t.lower().strip(), 0.0) for t in store.tag_vocab], dtype=np.float64)
+    if len(w):
+        score = score + store.tag_matrix @ w
+        rows, cols = store.tag_repeats  # a tag listed twice counts twice
+        np.add.at(score, rows, w[cols])
+
+    profit_cat = np.array([str(c).lower() == "profit" for c in store.outcome.categories] + [False])
+    score = score + np.where(profit_cat[store.outcome.codes.to_numpy()], 0.2, 0.0)
+    return np.round(score, 3)
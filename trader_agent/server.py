@@ -0,0 +1,313 @@
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import threading
+from collections import deque
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from .config import (CSV_PATH, SERVER_HOST, SERVER_PORT, SERVER_LLM_CONCURRENCY, SESSION_IDLE_S,
+                     SHARD_MAX_RESIDENT, SHARD_BOOT_WORKERS)
+from .memory import Memory
+from .llm_limiter import ConcurrencyLimitedLLM
+
+
+class EndpointStats:
+    """Request count, errors and a rolling latency window for one endpoint."""
+
+    def __init__(self, window: int = 2048):
+        self.count = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=window)
+
+    def record(self, seconds: float, ok: bool) -> None:
+        self.count += 1
+        self.errors += 0 if ok else 1
+        self.latencies.append(seconds)
+
+    def snapshot(self, uptime_s: float) -> Dict[str, Any]:
+        lat = np.asarray(self.latencies) * 1000.0
+        return {"count": self.count, "errors": self.errors,
+                "throughput_rps": self.count / uptime_s if uptime_s > 0 else None,
+                "p50_ms": float(np.percentile(lat, 50)) if len(lat) else None,
+                "p95_ms": float(np.percentile(lat, 95)) if len(lat) else None,
+                "mean_ms": float(lat.mean()) if len(lat) else None}
+
+
+def check_trades(trades: list, key: Optional[str] = None) -> None:
+    """Raise ValueError unless every posted trade is an object with the columns
+    the trade store reads (and the shard `key`, when routing by trader)."""
+    from .trade_store import NUMERIC_COLUMNS, CATEGORICAL_COLUMNS
+    required = ["Trade ID", "Date", "Tags", *CATEGORICAL_COLUMNS, *NUMERIC_COLUMNS] + ([key] if key else [])
+    for i, trade in enumerate(trades):
+        if not isinstance(trade, dict):
+            raise ValueError(f"trade {i} is not a JSON object")
+        missing = [c for c in required if c not in trade]
+        if missing:
+            raise ValueError(f"trade {i} is missing {missing}")
+
+
+class Session:
+    def __init__(self, assets: Dict[str, Any], trader: Optional[str] = None):
+        self.memory = Memory()
+        self.trader = trader
+        self.assets = None
+        self.bind(assets)
+        self.lock = asyncio.Lock()
+        self.last_seen = time.monotonic()
+
+    def bind(self, assets: Dict[str, Any]) -> None:
+        """Chat over `assets` (e.g. a shard reloaded after eviction), keeping the memory."""
+        if assets is not self.assets:
+            from .bootstrap import make_chat
+            self.assets = assets
+            self.chat = make_chat(assets, self.memory)
+
+    def release(self) -> None:
+        """Drop the assets (e.g. an evicted shard) so they can be freed; the memory is
+        kept and the next chat binds the reloaded ones."""
+        self.assets = None
+        self.chat = None
+
+
+class AgentServer:
+    """Serves many conversations from one set of shared, read-only assets
+    (trade store, vectorstore, persona, compiled graph). Each session only owns
+    its `Memory`; idle sessions are evicted after `idle_s`.
+
+    With a `ShardRouter` instead of assets, each chat names its `trader` and is
+    served from that trader's shard; sessions stay bound to one trader."""
+
+    def __init__(self, assets: Optional[Dict[str, Any]], idle_s: float = SESSION_IDLE_S, router=None):
+        if assets is None and router is None:
+            raise ValueError("need assets or a shard router")
+        self.assets = assets
+        self.router = router
+        self.idle_s = idle_s
+        self.sessions: Dict[str, Session] = {}
+        self.endpoints: Dict[str, EndpointStats] = {}
+        self.started = time.monotonic()
+        self._reaper: Optional[asyncio.Task] = None
+        self._ingestor = None
+        self._follow_stop = threading.Event()
+
+    @property
+    def ingestor(self):
+        if self._ingestor is None:
+            from .ingest import TradeIngestor
+            # posted trades are written to the trades file too, or the next boot's sync drops them
+            self._ingestor = TradeIngestor(self.assets, csv_path=self.assets.get("csv_path"))
+        return self._ingestor
+
+    def follow(self, path: str) -> threading.Thread:
+        """Tail-follow an append-only trades CSV in a background thread."""
+        def run():
+            for _ in self.ingestor.follow(path, stop=self._follow_stop):
+                pass
+        t = threading.Thread(target=run, name="trade-follow", daemon=True)
+        t.start()
+        return t
+
+    def session(self, session_id: str, assets: Optional[Dict[str, Any]] = None, trader: Optional[str] = None) -> Session:
+        s = self.sessions.get(session_id)
+        if s is None:
+            s = self.sessions[session_id] = Session(assets if assets is not None else self.assets, trader)
+        elif s.trader != trader:
+            raise ValueError(f"session {session_id} belongs to trader {s.trader!r}")
+        elif assets is not None:
+            s.bind(assets)
+        s.last_seen = time.monotonic()
+        return s
+
+    def evict_idle(self) -> int:
+        cutoff = time.monotonic() - self.idle_s
+        idle = [sid for sid, s in self.sessions.items() if s.last_seen < cutoff and not s.lock.locked()]
+        for sid in idle:
+            del self.sessions[sid]
+        self.release_evicted()
+        return len(idle)
+
+    def release_evicted(self) -> int:
+        """Unbind idle sessions from shards the router has evicted, so holding a
+        session does not keep its shard in memory. Runs on the event loop, like
+        every other use of the sessions."""
+        if self.router is None:
+            return 0
+        resident = set(self.router.resident())
+        stale = [s for s in self.sessions.values()
+                 if s.assets is not None and s.trader not in resident and not s.lock.locked()]
+        for s in stale:
+            s.release()
+        return len(stale)
+
+    async def _reap_forever(self) -> None:
+        while True:
+            await asyncio.sleep(max(1.0, min(60.0, self.idle_s / 4)))
+            self.evict_idle()
+
+    def stats(self) -> Dict[str, Any]:
+        uptime = time.monotonic() - self.started
+        assets = self.assets if self.router is None else {"llm": self.router.llm, "tracer": self.router.tracer}
+        llm = assets["llm"]
+        out = {"uptime_s": uptime, "sessions": len(self.sessions),
+               "endpoints": {k: v.snapshot(uptime) for k, v in self.endpoints.items()}}
+        if getattr(llm, "max_concurrency", None) is not None:  # limiter, possibly under other wrappers
+            out["llm"] = {"max_concurrency": llm.max_concurrency, "in_flight": llm.in_flight,
+                          "peak_in_flight": llm.peak_in_flight}
+        cache = assets.get("response_cache")
+        if cache is not None:
+            out["response_cache"] = cache.stats()
+        if self.router is not None:
+            out["shards"] = self.router.stats()
+        tracer = assets.get("tracer")
+        if tracer is not None and tracer.enabled:
+            out["trace"] = tracer.stats()
+        return out
+
+    async def handle(self, method: str, path: str, body: bytes = b"") -> Tuple[int, Dict[str, Any]]:
+        """Route one request; usable directly in tests without a socket."""
+        endpoint = f"{method} {path.split('?')[0].rstrip('/') or '/'}"
+        if endpoint.startswith("DELETE /sessions/"):
+            endpoint = "DELETE /sessions"
+        t0 = time.perf_counter()
+        status, payload = 500, {"error": "internal error"}
+        try:
+            status, payload = await self._route(endpoint, path, body)
+        except ValueError as e:  # malformed request (json.JSONDecodeError included)
+            status, payload = 400, {"error": f"bad request: {e}"}
+        except Exception as e:
+            status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+        finally:
+            self.endpoints.setdefault(endpoint, EndpointStats()).record(time.perf_counter() - t0, status < 400)
+        return status, payload
+
+    async def _route(self, endpoint: str, path: str, body: bytes) -> Tuple[int, Dict[str, Any]]:
+        if endpoint == "GET /health":
+            return 200, {"ok": True}
+        if endpoint == "GET /stats":
+            return 200, self.stats()
+        if endpoint == "POST /chat":
+            req = json.loads(body or b"{}")
+            if not isinstance(req, dict) or not isinstance(req.get("message"), str):
+                raise ValueError("expected a JSON object with a 'message' string")
+            message = req["message"]
+            session_id = req.get("session_id") or uuid.uuid4().hex
+            trader, assets = None, None
+            if self.router is not None:
+                trader = req.get("trader")
+                if not isinstance(trader, str):
+                    raise ValueError("expected a 'trader' string")
+                if trader not in self.router.shards:
+                    return 404, {"error": f"unknown trader {trader!r}"}
+                assets = await asyncio.to_thread(self.router.assets, trader)  # may load the shard
+                self.release_evicted()  # loading it may have evicted another
+            s = self.session(session_id, assets, trader)
+            async with s.lock:
+                reply = await s.chat["achat"](message)
+            s.last_seen = time.monotonic()
+            return 200, {"session_id": session_id, "reply": reply}
+        if endpoint == "POST /trades":
+            req = json.loads(body or b"{}")
+            if not isinstance(req, dict) or not isinstance(req.get("trades"), list):
+                raise ValueError("expected a JSON object with a 'trades' list")
+            check_trades(req["trades"], self.router.key if self.router is not None else None)
+            if self.router is not None:
+                unknown = sorted({str(t[self.router.key]) for t in req["trades"]} - set(self.router.shards))
+                if unknown:
+                    return 404, {"error": f"unknown trader(s) {unknown}"}
+                added = await asyncio.to_thread(self.router.ingest, req["trades"])
+                self.release_evicted()
+                return 200, {"added": sum(added.values()), "by_trader": added}
+            added = await asyncio.to_thread(self.ingestor.ingest, req["trades"])
+            return 200, {"added": added, "trades": len(self.assets["store"])}
+        if endpoint == "DELETE /sessions":
+            sid = path.rstrip("/").rsplit("/", 1)[-1]
+            return (200, {"deleted": sid}) if self.sessions.pop(sid, None) else (404, {"error": "unknown session"})
+        return 404, {"error": f"no route for {endpoint}"}
+
+    async def _serve_conn(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, path, _ = line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                body = await reader.readexactly(int(headers.get("content-length", "0") or 0))
+                status, payload = await self.handle(method.upper(), path, body)
+                data = json.dumps(payload, default=str).encode("utf-8")
+                writer.write(f"HTTP/1.1 {status} {'OK' if status < 400 else 'ERROR'}\r\n"
+                             f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode("latin-1") + data)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = SERVER_HOST, port: int = SERVER_PORT) -> asyncio.AbstractServer:
+        self._reaper = asyncio.create_task(self._reap_forever())
+        return await asyncio.start_server(self._serve_conn, host, port)
+
+    async def close(self) -> None:
+        if self._reaper is not None:
+            self._reaper.cancel()
+        self._follow_stop.set()
+
+
+def create_server(csv_path: str = CSV_PATH, embeddings=None, llm=None,
+                  llm_concurrency: int = SERVER_LLM_CONCURRENCY, idle_s: float = SESSION_IDLE_S,
+                  path_db: str = "vectordb", shard_dir: Optional[str] = None,
+                  max_resident: int = SHARD_MAX_RESIDENT, boot_workers: int = SHARD_BOOT_WORKERS) -> AgentServer:
+    """Boot shared assets once, with every outbound LLM call behind a concurrency limit.
+    With `shard_dir`, the trades are split per trader there instead: shard indexes are
+    built on a process pool and the largest `max_resident` shards are loaded up front."""
+    from .bootstrap import load_assets, get_llm
+    limited = ConcurrencyLimitedLLM(llm if llm is not None else get_llm(), llm_concurrency)
+    if shard_dir is not None:
+        from .shards import ShardRouter
+        router = ShardRouter.from_trades(csv_path, shard_dir, embeddings=embeddings, llm=limited,
+                                         max_resident=max_resident)
+        router.build(workers=boot_workers)
+        router.warm(workers=boot_workers)
+        return AgentServer(None, idle_s=idle_s, router=router)
+    assets = load_assets(csv_path, embeddings=embeddings, llm=limited, path_db=path_db)
+    return AgentServer(assets, idle_s=idle_s)
+
+
+async def _main(args) -> None:
+    server = create_server(args.csv, llm_concurrency=args.llm_concurrency, idle_s=args.idle,
+                           shard_dir=args.shards, max_resident=args.max_resident, boot_workers=args.boot_workers)
+    if args.follow:
+        server.follow(args.follow)
+    srv = await server.start(args.host, args.port)
+    print(f"serving on http://{args.host}:{args.port}")
+    async with srv:
+        await srv.serve_forever()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Multi-session trader agent server")
+    ap.add_argument("--csv", default=CSV_PATH)
+    ap.add_argument("--host", default=SERVER_HOST)
+    ap.add_argument("--port", type=int, default=SERVER_PORT)
+    ap.add_argument("--llm-concurrency", type=int, default=SERVER_LLM_CONCURRENCY)
+    ap.add_argument("--idle", type=float, default=SESSION_IDLE_S)
+    ap.add_argument("--follow", default=None, help="append-only trades CSV to ingest as it grows")
+    ap.add_argument("--shards", default=None, metavar="DIR", help="serve one shard per trader, written under DIR")
+    ap.add_argument("--max-resident", type=int, default=SHARD_MAX_RESIDENT, help="shards kept loaded (LRU)")
+    ap.add_argument("--boot-workers", type=int, default=SHARD_BOOT_WORKERS, help="processes building shards (0 = all CPUs)")
+    args = ap.parse_args()
+    if args.shards and args.follow:
+        ap.error("--follow is not supported with --shards (POST /trades routes by trader)")
+    asyncio.run(_main(args))
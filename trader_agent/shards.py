@@ -0,0 +1,268 @@
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple, Union
+
+import pandas as pd
+
+from .config import TRADER_COLUMN, SHARD_DIR, SHARD_MAX_RESIDENT, SHARD_BOOT_WORKERS
+from .data_store import read_trades, trades_format
+
+SHARDS_FILE = "shards.json"
+
+
+def shard_name(trader: str) -> str:
+    """Directory name for a trader's shard."""
+    return re.sub(r"[^\w.-]+", "_", str(trader)) or "_"
+
+
+def load_shard_manifest(shard_dir: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(shard_dir, SHARDS_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def partition_trades(path: str, shard_dir: str = SHARD_DIR, key: str = TRADER_COLUMN) -> Dict[str, Dict[str, Any]]:
+    """Split a trades table into one file per `key` value, `shard_dir/<trader>/trades.*`
+    (CSV stays CSV so ingested rows can be appended; Parquet/Arrow become Parquet).
+    The split is reused while the source file's size and mtime are unchanged.
+    Returns {trader: {"dir", "trades", "rows"}} with paths relative to `shard_dir`."""
+    st = os.stat(path)
+    source = {"path": os.path.abspath(path), "size": st.st_size, "mtime": st.st_mtime, "key": key}
+    manifest = load_shard_manifest(shard_dir)
+    if manifest is not None and manifest.get("source") == source:
+        return manifest["shards"]
+
+    df = read_trades(path)
+    if key not in df.columns:
+        raise ValueError(f"{path} has no {key!r} column to shard by")
+    ext = ".csv" if trades_format(path) == "csv" else ".parquet"
+    shards: Dict[str, Dict[str, Any]] = {}
+    for trader, part in df.groupby(key, sort=True, observed=True):
+        name = shard_name(trader)
+        os.makedirs(os.path.join(shard_dir, name), exist_ok=True)
+        trades = os.path.join(name, "trades" + ext)
+        part = part.reset_index(drop=True)
+        if ext == ".csv":
+            part.to_csv(os.path.join(shard_dir, trades), index=False)
+        else:
+            part.to_parquet(os.path.join(shard_dir, trades), index=False)
+        shards[str(trader)] = {"dir": name, "trades": trades, "rows": len(part)}
+    with open(os.path.join(shard_dir, SHARDS_FILE), "w", encoding="utf-8") as f:
+        json.dump({"source": source, "shards": shards}, f, indent=1)
+    return shards
+
+
+def build_shard(trades_path: str, path_db: str, embeddings=None, worker: bool = True) -> Dict[str, Any]:
+    """Process-pool task: bring one shard's FAISS and BM25 indexes on disk up to date
+    (a full build the first time, only new/changed trades afterwards).
+
+    As a `worker`, a SQLite embedding cache is only read: vectors embedded here
+    come back under "unsaved" for the parent to write, so build processes don't
+    contend for the cache file."""
+    from .data_store import load_trades, build_docs, sync_vectorstore, sync_lexical_index
+    from .bootstrap import get_embeddings
+    from .embed_cache import CachedEmbeddings
+    t0 = time.perf_counter()
+    embeddings = embeddings if embeddings is not None else get_embeddings()
+    cached = isinstance(embeddings, CachedEmbeddings)
+    if cached and worker and not embeddings.read_only:
+        embeddings = CachedEmbeddings(embeddings.base, embeddings.path, embeddings.batch_size,
+                                      embeddings.concurrency, read_only=True)
+    store = load_trades(trades_path)
+    docs = build_docs(store)
+    sync_vectorstore(docs, embeddings, path_db)
+    sync_lexical_index(docs, path_db)
+    return {"rows": len(store), "build_s": time.perf_counter() - t0, "pid": os.getpid(),
+            "unsaved": embeddings.unsaved if cached else []}
+
+
+class ShardRouter:
+    """Per-trader assets (trade store, indexes, persona, lesson cube, graph) loaded
+    on demand from the shards written by `partition_trades`.
+
+    At most `max_resident` shards are kept in memory; loading another evicts the
+    least recently used one. The intent classifier is shared by all shards.
+    Parquet shards that received live trades are pinned, since those rows only
+    exist in memory and the index until the next partition."""
+
+    def __init__(self, shards: Dict[str, Dict[str, Any]], shard_dir: str = SHARD_DIR, embeddings=None, llm=None,
+                 max_resident: int = SHARD_MAX_RESIDENT, key: str = TRADER_COLUMN):
+        from .telemetry import TRACER
+        self.shards = shards
+        self.shard_dir = shard_dir
+        self.max_resident = max(1, max_resident)
+        self.key = key
+        self.tracer = TRACER
+        self._embeddings = embeddings  # as given; shipped to build workers only when set
+        self._llm = llm
+        self._intent_classifier = None
+        self._resident: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._ingestors: Dict[str, Any] = {}
+        self._pinned = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+        self.build_seconds = 0.0
+
+    @classmethod
+    def from_trades(cls, path: str, shard_dir: str = SHARD_DIR, key: str = TRADER_COLUMN, **kwargs) -> "ShardRouter":
+        return cls(partition_trades(path, shard_dir, key), shard_dir, key=key, **kwargs)
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            from .bootstrap import get_embeddings
+            return get_embeddings()
+        return self._embeddings
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            from .bootstrap import get_llm
+            self._llm = get_llm()
+        return self._llm
+
+    @property
+    def intent_classifier(self):
+        if self._intent_classifier is None:
+            from .intent import IntentClassifier
+            from .telemetry import InstrumentedLLM
+            self._intent_classifier = IntentClassifier(InstrumentedLLM(self.llm), self.embeddings)
+        return self._intent_classifier
+
+    def traders(self) -> List[str]:
+        return list(self.shards)
+
+    def resident(self) -> List[str]:
+        """Traders whose shard is loaded now."""
+        with self._lock:
+            return list(self._resident)
+
+    def paths(self, trader: str) -> Tuple[str, str]:
+        """(trades file, index directory) of a trader's shard."""
+        shard = self.shards.get(trader)
+        if shard is None:
+            raise KeyError(f"unknown trader {trader!r}")
+        return (os.path.join(self.shard_dir, shard["trades"]),
+                os.path.join(self.shard_dir, shard["dir"], "vectordb"))
+
+    def build(self, traders: Optional[List[str]] = None, workers: int = SHARD_BOOT_WORKERS) -> Dict[str, Dict[str, Any]]:
+        """Build/sync the on-disk indexes of `traders` (default all) in a process pool,
+        largest shards first. Embedding dominates a cold boot, so this is the part
+        that is spread over processes; loading happens in `assets`/`warm`."""
+        from .embed_cache import CachedEmbeddings
+        traders = sorted(traders if traders is not None else self.shards, key=lambda t: -self.shards[t]["rows"])
+        t0 = time.perf_counter()
+        workers = min(workers or os.cpu_count() or 1, len(traders))
+        # opened here first, so the cache file exists before workers read it; only this process writes it
+        embeddings = self.embeddings
+        if workers <= 1:
+            out = {t: build_shard(*self.paths(t), self._embeddings, worker=False) for t in traders}
+        else:
+            with ProcessPoolExecutor(workers) as pool:
+                futures = {t: pool.submit(build_shard, *self.paths(t), self._embeddings) for t in traders}
+                out = {}
+                for t, f in futures.items():
+                    out[t] = f.result()
+                    if isinstance(embeddings, CachedEmbeddings):
+                        embeddings.save(out[t]["unsaved"])
+        for result in out.values():
+            result.pop("unsaved", None)
+        self.build_seconds += time.perf_counter() - t0
+        return out
+
+    def assets(self, trader: str) -> Dict[str, Any]:
+        """The trader's assets, loading the shard (and evicting a cold one) if needed."""
+        with self._lock:
+            assets = self._resident.get(trader)
+            if assets is not None:
+                self._resident.move_to_end(trader)
+                self.hits += 1
+                return assets
+            trades, path_db = self.paths(trader)
+            lock = self._loading.setdefault(trader, threading.Lock())
+        with lock:
+            with self._lock:
+                assets = self._resident.get(trader)
+                if assets is not None:  # loaded by a concurrent caller
+                    self._resident.move_to_end(trader)
+                    self.hits += 1
+                    return assets
+            from .bootstrap import load_assets
+            t0 = time.perf_counter()
+            assets = load_assets(trades, embeddings=self.embeddings, llm=self.llm, path_db=path_db,
+                                 intent_classifier=self.intent_classifier)
+            assets["trader"] = trader
+            with self._lock:
+                self._resident[trader] = assets
+                self.loads += 1
+                self.load_seconds += time.perf_counter() - t0
+                self._evict()
+            return assets
+
+    def _evict(self) -> None:
+        while len(self._resident) > self.max_resident:
+            cold = next((t for t in self._resident if t not in self._pinned), None)
+            if cold is None:
+                return
+            del self._resident[cold]
+            self._ingestors.pop(cold, None)
+            self.evictions += 1
+
+    def evict(self, trader: str) -> bool:
+        with self._lock:
+            if trader in self._pinned or self._resident.pop(trader, None) is None:
+                return False
+            self._ingestors.pop(trader, None)
+            self.evictions += 1
+            return True
+
+    def warm(self, traders: Optional[List[str]] = None, workers: int = SHARD_BOOT_WORKERS) -> List[str]:
+        """Load up to `max_resident` shards (default: the largest) on a thread pool."""
+        traders = traders if traders is not None else sorted(self.shards, key=lambda t: -self.shards[t]["rows"])
+        traders = list(traders)[:self.max_resident]
+        if traders:
+            with ThreadPoolExecutor(min(workers or os.cpu_count() or 1, len(traders))) as pool:
+                list(pool.map(self.assets, traders))
+        return traders
+
+    def ingest(self, trades: Union[pd.DataFrame, List[Dict[str, Any]]]) -> Dict[str, int]:
+        """Route new trades to their traders' shards; returns trades added per trader."""
+        from .ingest import TradeIngestor
+        df = trades if isinstance(trades, pd.DataFrame) else pd.DataFrame(list(trades))
+        if df.empty:
+            return {}
+        if self.key not in df.columns:
+            raise ValueError(f"trades need a {self.key!r} column")
+        added: Dict[str, int] = {}
+        for trader, part in df.groupby(df[self.key].astype(str), sort=False):
+            assets = self.assets(trader)
+            trades_path, path_db = self.paths(trader)
+            csv_path = trades_path if trades_format(trades_path) == "csv" else None
+            with self._lock:
+                ingestor = self._ingestors.get(trader)
+                if ingestor is None or ingestor.assets is not assets:
+                    ingestor = self._ingestors[trader] = TradeIngestor(assets, path_db, csv_path=csv_path)
+            added[trader] = ingestor.ingest(part)
+            if added[trader] and csv_path is None:
+                with self._lock:
+                    self._pinned.add(trader)
+        return added
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.loads
+            return {"traders": len(self.shards), "resident": list(self._resident), "max_resident": self.max_resident,
+                    "pinned": sorted(self._pinned), "hits": self.hits, "loads": self.loads,
+                    "hit_rate": (self.hits / total) if total else None, "evictions": self.evictions,
+                    "load_seconds": self.load_seconds, "build_seconds": self.build_seconds}
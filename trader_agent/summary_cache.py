@@ -0,0 +1,93 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Any, Optional
+
+from .config import SUMMARY_CACHE_PATH, SUMMARY_CACHE_MAX, SUMMARY_CACHE_TTL_S
+
+
+def llm_name(llm) -> str:
+    for attr in ("model_name", "model", "repo_id"):
+        v = getattr(llm, attr, None)
+        if v:
+            return str(v)
+    return type(llm).__name__
+
+
+def _canonical(obj):
+    if isinstance(obj, float):
+        return float(f"{obj:.9g}")  # absorb float noise from prefix-sum arithmetic
+    if isinstance(obj, dict):
+        return {str(k): _canonical(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_canonical(v) for v in obj]
+    return obj
+
+
+def stats_fingerprint(stats: Dict[str, Any], persona: Any, model: str) -> str:
+    payload = json.dumps({"stats": _canonical(stats), "persona": _canonical(persona), "model": model},
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SummaryCache:
+    """Persistent LRU/TTL cache for lesson summaries.
+
+    Keys fingerprint the stats JSON (which includes the window), the persona and
+    the model, so a change to any trade inside the window yields a new key and
+    the stale entry simply ages out."""
+
+    def __init__(self, path: str = SUMMARY_CACHE_PATH, max_entries: int = SUMMARY_CACHE_MAX,
+                 ttl_s: float = SUMMARY_CACHE_TTL_S):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS summaries ("
+                           "key TEXT PRIMARY KEY, summary TEXT NOT NULL, "
+                           "created REAL NOT NULL, last_used REAL NOT NULL)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT summary, created FROM summaries WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl_s:
+                self._conn.execute("DELETE FROM summaries WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE summaries SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, summary: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)", (key, summary, now, now))
+            self._conn.execute("DELETE FROM summaries WHERE created < ?", (now - self.ttl_s,))
+            self._conn.execute("DELETE FROM summaries WHERE key NOT IN "
+                               "(SELECT key FROM summaries ORDER BY last_used DESC LIMIT ?)", (self.max_entries,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM summaries")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "size": size,
+                "hit_rate": (self.hits / total) if total else None}
+
+    def close(self) -> None:
+        self._conn.close()
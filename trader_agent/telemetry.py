@@ -0,0 +1,270 @@
+import json
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Callable, Iterator, AsyncIterator
+
+import numpy as np
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+
+from .config import TRACE_ENABLED, TRACE_JSONL, TRACE_WINDOW
+
+_current: contextvars.ContextVar[Optional["TurnTrace"]] = contextvars.ContextVar("trader_agent_turn", default=None)
+
+
+class TurnTrace:
+    """Everything recorded for one chat turn; shared by the nodes that run in it."""
+
+    def __init__(self, query: str):
+        self.query = query
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self.total_s: Optional[float] = None
+        self.spans: Dict[str, float] = {}
+        self.llm_calls = 0
+        self.llm_s = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.docs = 0
+        self.extra: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def add_llm(self, seconds: float, prompt_tokens: int, completion_tokens: int) -> None:
+        with self._lock:
+            self.llm_calls += 1
+            self.llm_s += seconds
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"ts": self.started, "query": self.query, "total_s": self.total_s, "spans": dict(self.spans),
+                "llm_calls": self.llm_calls, "llm_s": self.llm_s, "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens, "docs": self.docs, **self.extra}
+
+
+class JsonLinesExporter:
+    """Appends one JSON object per finished turn."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class Tracer:
+    """Per-turn instrumentation with rolling latency windows.
+
+    When disabled, `turn()` yields None and every hook reduces to a context-var
+    lookup, so the instrumented paths cost next to nothing."""
+
+    def __init__(self, enabled: bool = TRACE_ENABLED, exporters: Optional[List[Any]] = None,
+                 window: int = TRACE_WINDOW):
+        self.enabled = enabled
+        self.exporters = list(exporters or [])
+        self.window = window
+        self.turns = 0
+        self.totals = {"llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "docs": 0, "tokens_saved": 0}
+        self._hist: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def begin(self, query: str) -> Optional[TurnTrace]:
+        return TurnTrace(query) if self.enabled else None
+
+    @contextmanager
+    def activate(self, trace: Optional[TurnTrace]) -> Iterator[None]:
+        """Make `trace` current for the enclosed code (e.g. one pull of a stream)."""
+        if trace is None:
+            yield
+            return
+        token = _current.set(trace)
+        try:
+            yield
+        finally:
+            _current.reset(token)
+
+    def finish(self, trace: Optional[TurnTrace]) -> None:
+        if trace is None:
+            return
+        trace.total_s = time.perf_counter() - trace._t0
+        self._record(trace)
+
+    @contextmanager
+    def turn(self, query: str) -> Iterator[Optional[TurnTrace]]:
+        if not self.enabled or _current.get() is not None:
+            yield _current.get()
+            return
+        trace = self.begin(query)
+        try:
+            with self.activate(trace):
+                yield trace
+        finally:
+            self.finish(trace)
+
+    def _record(self, trace: TurnTrace) -> None:
+        with self._lock:
+            self.turns += 1
+            self.totals["llm_calls"] += trace.llm_calls
+            self.totals["prompt_tokens"] += trace.prompt_tokens
+            self.totals["completion_tokens"] += trace.completion_tokens
+            self.totals["docs"] += trace.docs
+            self.totals["tokens_saved"] += trace.extra.get("tokens_saved", 0)
+            self._observe("turn", trace.total_s)
+            for name, s in trace.spans.items():
+                self._observe(name, s)
+            if trace.llm_calls:
+                self._observe("llm", trace.llm_s)
+            for name, s in trace.extra.items():
+                if name.endswith("_s") and isinstance(s, float):
+                    self._observe(name[:-2], s)
+        record = trace.to_dict()
+        for exp in self.exporters:
+            exp.export(record)
+
+    def _observe(self, name: str, seconds: float) -> None:
+        h = self._hist.get(name)
+        if h is None:
+            h = self._hist[name] = deque(maxlen=self.window)
+        h.append(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        """In-process view: turn count, totals, and p50/p95/p99 (ms) per span."""
+        with self._lock:
+            hist = {k: np.asarray(v) * 1000.0 for k, v in self._hist.items()}
+            out = {"turns": self.turns, **self.totals}
+        out["latency_ms"] = {k: {"n": int(len(v)), "p50": float(np.percentile(v, 50)),
+                                 "p95": float(np.percentile(v, 95)), "p99": float(np.percentile(v, 99))}
+                             for k, v in hist.items() if len(v)}
+        return out
+
+    def reset(self) -> None:
+        with self._lock:
+            self.turns = 0
+            self.totals = {k: 0 for k in self.totals}
+            self._hist.clear()
+
+
+TRACER = Tracer(exporters=[JsonLinesExporter(TRACE_JSONL)] if TRACE_JSONL else [])
+
+
+def current_turn() -> Optional[TurnTrace]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_span(name, time.perf_counter() - t0)
+
+
+def _record_docs(trace: TurnTrace, out: Any) -> None:
+    if isinstance(out, dict) and "docs" in out:
+        trace.docs = len(out["docs"] or [])
+
+
+def traced_node(name: str, func: Callable, afunc: Optional[Callable] = None) -> RunnableLambda:
+    """Graph node that records its wall time (and retrieved-doc count) in the current turn."""
+    def run(state):
+        trace = _current.get()
+        if trace is None:
+            return func(state)
+        t0 = time.perf_counter()
+        out = func(state)
+        trace.add_span(name, time.perf_counter() - t0)
+        _record_docs(trace, out)
+        return out
+
+    if afunc is None:
+        return RunnableLambda(run)
+
+    async def arun(state):
+        trace = _current.get()
+        if trace is None:
+            return await afunc(state)
+        t0 = time.perf_counter()
+        out = await afunc(state)
+        trace.add_span(name, time.perf_counter() - t0)
+        _record_docs(trace, out)
+        return out
+
+    return RunnableLambda(run, afunc=arun)
+
+
+def _usage(msg: Any) -> tuple:
+    usage = getattr(msg, "usage_metadata", None)
+    if usage:
+        return int(usage.get("input_tokens", 0)), int(usage.get("output_tokens", 0))
+    tu = (getattr(msg, "response_metadata", None) or {}).get("token_usage") or {}
+    return int(tu.get("prompt_tokens", 0)), int(tu.get("completion_tokens", 0))
+
+
+class InstrumentedLLM(Runnable):
+    """Counts calls, latency and prompt/completion tokens of the wrapped model
+    against the current turn. Outside a traced turn it is a plain passthrough."""
+
+    def __init__(self, llm):
+        self.llm = llm
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.__dict__["llm"], name)
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        trace = _current.get()
+        if trace is None:
+            return self.llm.invoke(input, config, **kwargs)
+        t0 = time.perf_counter()
+        out = self.llm.invoke(input, config, **kwargs)
+        trace.add_llm(time.perf_counter() - t0, *_usage(out))
+        return out
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        trace = _current.get()
+        if trace is None:
+            return await self.llm.ainvoke(input, config, **kwargs)
+        t0 = time.perf_counter()
+        out = await self.llm.ainvoke(input, config, **kwargs)
+        trace.add_llm(time.perf_counter() - t0, *_usage(out))
+        return out
+
+    def stream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[Any]:
+        trace = _current.get()
+        if trace is None:
+            yield from self.llm.stream(input, config, **kwargs)
+            return
+        t0 = time.perf_counter()
+        pt = ct = 0
+        for chunk in self.llm.stream(input, config, **kwargs):
+            p, c = _usage(chunk)
+            pt, ct = pt + p, ct + c
+            yield chunk
+        trace.add_llm(time.perf_counter() - t0, pt, ct)
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AsyncIterator[Any]:
+        trace = _current.get()
+        if trace is None:
+            async for chunk in self.llm.astream(input, config, **kwargs):
+                yield chunk
+            return
+        t0 = time.perf_counter()
+        pt = ct = 0
+        async for chunk in self.llm.astream(input, config, **kwargs):
+            p, c = _usage(chunk)
+            pt, ct = pt + p, ct + c
+            yield chunk
+        trace.add_llm(time.perf_counter() - t0, pt, ct)
@@ -0,0 +1,39 @@
+from functools import lru_cache
+from typing import List
+
+from .config import OPENAI_CHAT_MODEL
+
+
+@lru_cache(maxsize=1)
+def encoding():
+    """tiktoken encoding of the chat model, or None when tiktoken (or its BPE file,
+    fetched on first use) is unavailable; counts then fall back to chars/4."""
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(OPENAI_CHAT_MODEL)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    enc = encoding()
+    return len(enc.encode(text, disallowed_special=())) if enc is not None else (len(text) + 3) // 4
+
+
+def truncate_tokens(text: str, max_tokens: int, keep: str = "head") -> str:
+    """`text` cut to at most `max_tokens`, keeping the start ("head") or the end ("tail")."""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    enc = encoding()
+    if enc is None:
+        n = max_tokens * 4
+        return (text[:n - 1] + "…") if keep == "head" else ("…" + text[-(n - 1):])
+    ids: List[int] = enc.encode(text, disallowed_special=())
+    return (enc.decode(ids[:max_tokens - 1]) + "…") if keep == "head" else ("…" + enc.decode(ids[-(max_tokens - 1):]))
@@ -0,0 +1,259 @@
+import re
+from typing import Optional, List, Union, Dict, Any, Iterator, Tuple
+from collections.abc import MutableMapping
+from datetime import date
+import numpy as np
+import pandas as pd
+from .scoring import setup_scores
+
+NUMERIC_COLUMNS = ["Price", "Volume", "RSI", "Volume_Change_Pct", "Sentiment_Score"]
+CATEGORICAL_COLUMNS = ["Asset", "Buy/Sell", "Outcome"]
+TAG_SEP = r"\s*,[\s,]*"  # commas with any spaces / empty entries around them
+
+
+def _normalize_tags(tags: pd.Series) -> pd.Series:
+    return (tags.fillna("").astype(str)
+            .str.replace(TAG_SEP, ",", regex=True)
+            .str.strip(", "))
+
+
+def split_tags(tags: pd.Series) -> pd.DataFrame:
+    """One boolean column per tag, columns ordered by first appearance."""
+    norm = _normalize_tags(tags)
+    mat = norm.str.get_dummies(sep=",").astype(bool)
+    order = [t for t in pd.unique(norm.str.split(",").explode()) if t in mat.columns]
+    return mat[order]
+
+
+def repeated_tags(tags: pd.Series, vocab: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """(rows, vocab columns) of each repeat of a tag within one row, e.g. the second
+    "breakout" in "breakout,breakout"; the boolean tag matrix can't count those."""
+    pairs = _normalize_tags(tags).str.split(",").explode()
+    pairs = pairs[pairs.index.duplicated(keep=False) & (pairs != "")]  # rows with several tags
+    extra = pairs[pd.MultiIndex.from_arrays([pairs.index, pairs.to_numpy()]).duplicated()]
+    col = {t: j for j, t in enumerate(vocab)}
+    return extra.index.to_numpy(dtype=np.int64), np.array([col[t] for t in extra], dtype=np.int64)
+
+
+def tag_vocab(tags: pd.Series) -> List[str]:
+    """The columns of `split_tags(tags)` without building the matrix: only each
+    distinct Tags string is split."""
+    sep = re.compile(TAG_SEP)
+    vocab: Dict[str, None] = {}
+    for text in pd.unique(tags.dropna().astype(str)):
+        for t in sep.sub(",", text).strip(", ").split(","):
+            if t:
+                vocab.setdefault(t)
+    return list(vocab)
+
+
+class TradeStore:
+    """Typed, columnar view over the trade table, parsed once at load time.
+
+    `df` keeps the original columns (with `Date` normalised to ISO strings) for
+    document building; the attributes below are what the query paths use."""
+
+    def __init__(self, df: pd.DataFrame):
+        df = df.reset_index(drop=True)  # a new frame; the caller's is not modified
+        parsed = pd.to_datetime(df["Date"], format="mixed")
+        df["Date"] = parsed.dt.strftime("%Y-%m-%d")
+        for c in CATEGORICAL_COLUMNS:
+            df[c] = df[c].astype("category")
+        self.df = df
+        self._columns: Dict[str, Any] = {}
+
+        self.dates: np.ndarray = parsed.to_numpy().astype("datetime64[D]")
+        self.asset = df["Asset"].cat
+        self.side = df["Buy/Sell"].cat
+        self.outcome = df["Outcome"].cat
+        self.is_win: np.ndarray = (df["Outcome"] == "Profit").to_numpy()
+        self.num = {c: pd.to_numeric(df[c], errors="coerce").to_numpy(dtype=np.float64) for c in NUMERIC_COLUMNS}
+
+        tags = split_tags(df["Tags"])
+        self.tag_vocab: List[str] = list(tags.columns)
+        self.tag_matrix: np.ndarray = tags.to_numpy()
+        self.tag_repeats = repeated_tags(df["Tags"], self.tag_vocab)
+        self.row_of: Dict[str, int] = {str(t): i for i, t in enumerate(df["Trade ID"])}
+        self.weights: Optional[Dict[str, float]] = None
+        self.version = 0  # bumped whenever rows or scores change
+        self.setup_score: np.ndarray = setup_scores(self)
+
+        self.date_order: np.ndarray = np.argsort(self.dates, kind="stable")
+        self._sorted_dates = self.dates[self.date_order]
+        self.date_min: Optional[date] = self._sorted_dates[0].astype(object) if len(df) else None
+        self.date_max: Optional[date] = self._sorted_dates[-1].astype(object) if len(df) else None
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    def column(self, name: str) -> Any:
+        """Indexable per-row view of `df[name]`, cached for per-row reads. Reuses the
+        store's own arrays (numeric columns, categorical codes) or the column's
+        backing array rather than materializing an object copy of it."""
+        col = self._columns.get(name)
+        if col is None:
+            if name in self.num:
+                col = self.num[name]
+            else:
+                values = self.df[name].array
+                if isinstance(values, pd.Categorical):
+                    col = _CategoryColumn(values)
+                elif values.dtype == object:
+                    col = values.to_numpy()  # a view for numpy-backed object columns
+                else:
+                    col = values  # e.g. Arrow-backed strings, read in place
+            self._columns[name] = col
+        return col
+
+    def rescore(self, weights: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """Recompute the setup-score column, e.g. after TAG_WEIGHTS changes."""
+        self.weights = weights
+        self.setup_score = setup_scores(self, weights)
+        self.version += 1
+        return self.setup_score
+
+    def append(self, trades: pd.DataFrame) -> "TradeStore":
+        """Add new rows in place and return them parsed as their own TradeStore.
+
+        Only the new rows are parsed; existing columns are extended, the tag
+        vocabulary grows at the end and the date index is merged, so the result
+        matches a store built from the concatenated table. All attributes are
+        swapped in one step so concurrent readers see either the old or the new
+        table."""
+        new = TradeStore(trades)
+        if len(new) == 0:
+            return new
+        if self.weights is not None:
+            new.rescore(self.weights)
+        n_old = len(self)
+
+        df = pd.concat([self.df.astype({c: object for c in CATEGORICAL_COLUMNS}),
+                        new.df.astype({c: object for c in CATEGORICAL_COLUMNS})], ignore_index=True)
+        for c in CATEGORICAL_COLUMNS:
+            df[c] = df[c].astype("category")
+
+        known = set(self.tag_vocab)
+        vocab = self.tag_vocab + [t for t in new.tag_vocab if t not in known]
+        col = {t: j for j, t in enumerate(vocab)}
+        tag_matrix = np.zeros((n_old + len(new), len(vocab)), dtype=bool)
+        tag_matrix[:n_old, :len(self.tag_vocab)] = self.tag_matrix
+        tag_matrix[n_old:, [col[t] for t in new.tag_vocab]] = new.tag_matrix
+        remap = np.array([col[t] for t in new.tag_vocab], dtype=np.int64)
+        tag_repeats = (np.concatenate([self.tag_repeats[0], new.tag_repeats[0] + n_old]),
+                       np.concatenate([self.tag_repeats[1], remap[new.tag_repeats[1]]]))
+
+        at = np.searchsorted(self._sorted_dates, new._sorted_dates, "right")
+        sorted_dates = np.insert(self._sorted_dates, at, new._sorted_dates)
+        self.__dict__.update(
+            df=df, _columns={},
+            dates=np.concatenate([self.dates, new.dates]),
+            asset=df["Asset"].cat, side=df["Buy/Sell"].cat, outcome=df["Outcome"].cat,
+            is_win=np.concatenate([self.is_win, new.is_win]),
+            num={c: np.concatenate([self.num[c], new.num[c]]) for c in NUMERIC_COLUMNS},
+            tag_vocab=vocab, tag_matrix=tag_matrix, tag_repeats=tag_repeats,
+            row_of={**self.row_of, **{t: i + n_old for t, i in new.row_of.items()}},
+            setup_score=np.concatenate([self.setup_score, new.setup_score]),
+            date_order=np.insert(self.date_order, at, new.date_order + n_old),
+            _sorted_dates=sorted_dates,
+            date_min=sorted_dates[0].astype(object), date_max=sorted_dates[-1].astype(object),
+            version=self.version + 1,
+        )
+        return new
+
+    def row(self, i: int) -> "TradeRow":
+        return TradeRow(self, int(i))
+
+    def score_of(self, trade_id) -> Optional[float]:
+        i = self.row_of.get(str(trade_id))
+        return None if i is None else float(self.setup_score[i])
+
+    def window_bounds(self, start: Optional[date] = None, end: Optional[date] = None):
+        lo = np.searchsorted(self._sorted_dates, np.datetime64(start, "D"), "left") if start else 0
+        hi = np.searchsorted(self._sorted_dates, np.datetime64(end, "D"), "right") if end else len(self)
+        return lo, max(lo, hi)
+
+    def window(self, start: Optional[date] = None, end: Optional[date] = None) -> np.ndarray:
+        """Row positions with start <= Date <= end, in date order."""
+        lo, hi = self.window_bounds(start, end)
+        return self.date_order[lo:hi]
+
+    def window_frame(self, start: Optional[date] = None, end: Optional[date] = None) -> pd.DataFrame:
+        return self.df.iloc[np.sort(self.window(start, end))]
+
+
+class _CategoryColumn:
+    """Per-row reads of a categorical column: its codes plus the (few) category
+    values, with missing (code -1) reading as None."""
+
+    __slots__ = ("codes", "values")
+
+    def __init__(self, cat: pd.Categorical):
+        self.codes = cat.codes
+        self.values = np.append(cat.categories.to_numpy(dtype=object), None)
+
+    def __getitem__(self, i: int) -> Any:
+        return self.values[self.codes[i]]
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+
+class TradeRow(MutableMapping):
+    """Document metadata backed by row `row` of a TradeStore.
+
+    Trade fields are read from the shared table on access instead of being
+    copied per document; keys set on it (e.g. `_setup_score`) go to a small
+    per-row overlay. Pickles as a plain `{"Trade ID": ...}` dict, so a persisted
+    docstore only carries the key needed to re-bind it to a store."""
+
+    __slots__ = ("store", "row", "extra")
+
+    def __init__(self, store: TradeStore, row: int):
+        self.store = store
+        self.row = row
+        self.extra: Optional[Dict[str, Any]] = None
+
+    def __getitem__(self, key: str) -> Any:
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        return self.store.column(key)[self.row]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if self.extra is None:
+            self.extra = {}
+        self.extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if self.extra is None or key not in self.extra:
+            raise KeyError(key)
+        del self.extra[key]
+
+    def __iter__(self) -> Iterator[str]:
+        columns = list(self.store.df.columns)
+        yield from columns
+        if self.extra:
+            yield from (k for k in self.extra if k not in columns)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __reduce__(self):
+        return dict, ({"Trade ID": self["Trade ID"]},)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+def as_store(trades: Union[TradeStore, pd.DataFrame]) -> TradeStore:
+    return trades if isinstance(trades, TradeStore) else TradeStore(trades)
+
+
+def date_span(trades: Union[TradeStore, pd.DataFrame]) -> Tuple[Optional[date], Optional[date]]:
+    """(first, last) trade date; a plain frame's Date column is read directly
+    instead of building a TradeStore for it."""
+    if isinstance(trades, TradeStore):
+        return trades.date_min, trades.date_max
+    if not len(trades):
+        return None, None
+    parsed = pd.to_datetime(pd.Series(trades["Date"].unique()), format="mixed")
+    return parsed.min().date(), parsed.max().date()